@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           cold_start.py
+Author:         Adeel Ahmad
+Description:    Measure import-to-first-call latency of the entry points,
+                comparing eager per-module boto3 clients with the lazy,
+                shared clients from common.clients.
+"""
+
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
+
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+RUNS = int(os.environ.get('BENCH_RUNS', 10))
+
+# Each scenario runs in a fresh interpreter, like a Lambda cold start.
+# "First call" stops at loading the DescribeDBInstances operation model, so the
+# numbers need no credentials or network access.
+SCENARIOS = {
+    # What the entry points did before: every module built its own client
+    # at import time, whether or not it was used.
+    'eager': """
+import time
+start = time.perf_counter()
+import boto3
+clients = [boto3.client('rds') for _ in range(4)]
+rds = clients[0]
+rds.meta.service_model.operation_model('DescribeDBInstances')
+print(time.perf_counter() - start)
+""",
+    # Current layout: importing the Lambda module and all shared helpers,
+    # then touching the lazy client once.
+    'lazy': """
+import time
+start = time.perf_counter()
+import lambda_function, rds_restore, query_db
+rds = lambda_function.RDS
+rds.meta.service_model.operation_model('DescribeDBInstances')
+print(time.perf_counter() - start)
+""",
+    # Import cost alone, before any client is needed.
+    'lazy-import-only': """
+import time
+start = time.perf_counter()
+import lambda_function, rds_restore, query_db
+print(time.perf_counter() - start)
+""",
+}
+
+
+def run(code):
+    """
+    Execute code in a fresh interpreter and return the seconds it printed.
+    """
+    env = dict(os.environ)
+    env.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=ROOT, env=env)
+    return float(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def main():
+    """
+    Run every scenario RUNS times and print median and best wall time.
+    """
+    print("%-18s %10s %10s" % ("scenario", "median ms", "best ms"))
+    for name, code in SCENARIOS.items():
+        samples = [run(code) * 1000 for _ in range(RUNS)]
+        print("%-18s %10.1f %10.1f" % (name, statistics.median(samples), min(samples)))
+
+
+if __name__ == "__main__":
+    main()
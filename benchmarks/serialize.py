@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           serialize.py
+Author:         Adeel Ahmad
+Description:    Micro-benchmarks of the custom resource response encoder
+                against dumping the whole botocore response.
+"""
+
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
+
+import datetime
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from common import serialization
+
+NUMBER = int(os.environ.get('BENCH_NUMBER', 2000))
+
+
+def cluster_snapshot_response():
+    """A create_db_cluster_snapshot response shaped like botocore returns it."""
+    now = datetime.datetime(2023, 1, 1, 12, 0, 0)
+    return {
+        'DBClusterSnapshot': {
+            'AvailabilityZones': ['us-east-1a', 'us-east-1b', 'us-east-1c'],
+            'DBClusterSnapshotIdentifier': 'daily-2023-01-01',
+            'DBClusterIdentifier': 'orders',
+            'SnapshotCreateTime': now,
+            'Engine': 'aurora-postgresql',
+            'EngineMode': 'provisioned',
+            'AllocatedStorage': 1,
+            'Status': 'creating',
+            'Port': 0,
+            'VpcId': 'vpc-0123456789abcdef0',
+            'ClusterCreateTime': now,
+            'MasterUsername': 'admin',
+            'EngineVersion': '15.4',
+            'LicenseModel': 'postgresql-license',
+            'SnapshotType': 'manual',
+            'PercentProgress': 0,
+            'StorageEncrypted': True,
+            'KmsKeyId': 'arn:aws:kms:us-east-1:111111111111:key/' + 'a' * 36,
+            'DBClusterSnapshotArn': 'arn:aws:rds:us-east-1:111111111111:cluster-snapshot:daily-2023-01-01',
+            'IAMDatabaseAuthenticationEnabled': False,
+            'TagList': [{'Key': 'team', 'Value': 'orders'}] * 10,
+        },
+        'ResponseMetadata': {
+            'RequestId': 'f' * 36,
+            'HTTPStatusCode': 200,
+            'HTTPHeaders': {'x-amzn-requestid': 'f' * 36, 'content-type': 'text/xml',
+                            'content-length': '2513', 'date': 'Sun, 01 Jan 2023 12:00:00 GMT'},
+            'RetryAttempts': 0,
+        },
+    }
+
+
+def fleet_response(targets=300):
+    """A fleet mode result map, large enough to need truncation."""
+    return dict(('db-%04d' % number, {'Status': 'SUCCESS', 'Type': 'instance',
+                                      'SnapshotIdentifier': 'daily-db-%04d-2023-01-01' % number})
+                for number in range(targets))
+
+
+def body(data):
+    return {'Status': 'SUCCESS', 'Reason': 'ok', 'PhysicalResourceId': 'log-stream',
+            'StackId': 'stack-id', 'RequestId': 'request-id', 'LogicalResourceId': 'logical-id',
+            'Data': data}
+
+
+def previous(data):
+    """The old approach: dump everything, stringifying what json cannot encode."""
+    return json.dumps(body(data), default=str).encode('utf-8')
+
+
+def current(data):
+    return serialization.encode_response(body(data))
+
+
+def main():
+    """Print per-call time and payload size for each case."""
+    print("%-28s %12s %10s" % ("case", "us/call", "bytes"))
+    for name, data in (('cluster snapshot', cluster_snapshot_response()),
+                       ('fleet of 300', fleet_response())):
+        for label, encoder in (('dumps everything', previous), ('encode_response', current)):
+            seconds = timeit.timeit(lambda: encoder(data), number=NUMBER)
+            print("%-28s %12.1f %10d" % ("%s / %s" % (name, label),
+                                         seconds / NUMBER * 1e6, len(encoder(data))))
+
+
+if __name__ == "__main__":
+    main()
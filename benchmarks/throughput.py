@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           throughput.py
+Author:         Adeel Ahmad
+Description:    Throughput of the snapshot handler, query_db_cluster and the
+                restore script against an in-process RDS stand-in, for
+                fleets of increasing size.
+"""
+
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
+
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import lambda_function
+import rds_restore
+from common import clients, topology, utils
+from tests.fake_rds import FakeRDS
+
+FLEET_SIZES = [int(size) for size in os.environ.get('BENCH_FLEET_SIZES', '10,1000,10000').split(',')]
+# Simulated per-call API latency and probability of a Throttling error
+LATENCY = float(os.environ.get('BENCH_LATENCY_MS', 0)) / 1000
+THROTTLE_RATE = float(os.environ.get('BENCH_THROTTLE_RATE', 0))
+# Every CLUSTER_EVERY-th pair of instances forms an Aurora cluster
+CLUSTER_EVERY = int(os.environ.get('BENCH_CLUSTER_EVERY', 10))
+# Restores are one process per database in practice, cap how many we run
+MAX_RESTORES = int(os.environ.get('BENCH_MAX_RESTORES', 1000))
+
+
+class Context(object):
+    """Just enough of a Lambda context for the handler."""
+    log_stream_name = 'benchmark'
+    log_group_name = 'benchmark'
+    aws_request_id = 'benchmark'
+    memory_limit_in_mb = 128
+
+    @staticmethod
+    def get_remaining_time_in_millis():
+        return 900000
+
+
+def run_handler(fake):
+    lambda_function.TOPOLOGY = topology.TopologyIndex()
+    lambda_function.DBSNAPSHOTID = 'bench-'
+    event = {'StackId': 'stack-id', 'RequestId': 'request-id', 'LogicalResourceId': 'logical-id',
+             'ResponseURL': 'http://localhost/unused',
+             'ResourceProperties': {'DBInstanceIdentifiers': list(fake.instances)}}
+    lambda_function.handler(event, Context())
+
+
+def run_query(fake):
+    for instance_id in list(fake.instances):
+        utils.query_db_cluster(instance_id)
+
+
+def run_restore(fake):
+    # Only the restore requests: waiting for cluster members would measure
+    # the polling delay, not the script
+    os.environ['RESTORE_CLUSTER_MEMBERS'] = 'false'
+    rds_restore.TOPOLOGY = topology.TopologyIndex()
+    for instance_id in list(fake.instances)[:MAX_RESTORES]:
+        os.environ['NEW_INSTANCEID'] = os.environ['NEW_CLUSTER_ID'] = 'restored-' + instance_id
+        try:
+            rds_restore.main(instance_id)
+        except Exception: # pylint: disable=broad-except
+            pass # throttled, counted by the stand-in
+
+
+def measure(func, size):
+    """Run func against a fresh fleet of size, return (seconds, calls, peak bytes)."""
+    fake = FakeRDS(instances=size, cluster_every=CLUSTER_EVERY, latency=LATENCY, throttle_rate=THROTTLE_RATE)
+    clients.reset()
+    clients.install(fake)
+    fake.calls.clear()
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(fake)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, fake.calls, peak
+
+
+def main():
+    """Print wall time, API calls (throttled ones included) and peak memory per case."""
+    logging.disable(logging.CRITICAL)
+    # Responses go nowhere, the transport is not what is measured here
+    lambda_function.send = lambda *args, **kwargs: True
+    print("%-18s %8s %10s %10s %10s %10s" % ("case", "fleet", "seconds", "api calls", "throttled", "peak KiB"))
+    for size in FLEET_SIZES:
+        for name, func in (('handler (fleet)', run_handler),
+                           ('query_db_cluster', run_query),
+                           ('rds_restore.main', run_restore)):
+            seconds, calls, peak = measure(func, size)
+            throttled = calls.pop('Throttled', 0)
+            print("%-18s %8d %10.3f %10d %10d %10.0f" % (name, size, seconds, sum(calls.values()),
+                                                        throttled, peak / 1024))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           checkpoint.py
+Author:         Adeel Ahmad
+Description:    Time-budgeted work queue and compact checkpoints, so a job
+                larger than one Lambda invocation continues in the next one.
+"""
+
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
+
+import base64
+import logging
+import threading
+import time
+import zlib
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from common import utils
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Stop taking new work when this little time is left, so there is still
+# time to hand over the remainder or respond to CloudFormation.
+DEFAULT_RESERVE_MS = 15000
+# Short invocations scale the reserve down to this fraction of their budget
+MAX_RESERVE_FRACTION = 0.5
+# Event key carrying the checkpoint into the next invocation
+EVENT_KEY = 'RDSBackupCheckpoint'
+# Asynchronous invocation payloads are limited to 256 KB
+MAX_PAYLOAD = 256 * 1024
+
+
+def budget_reserve(reserve_ms, budget_ms):
+    """The reserve of an invocation that started with budget_ms left."""
+    return min(reserve_ms, budget_ms * MAX_RESERVE_FRACTION)
+
+
+def run_within_budget(func, items, remaining_ms, reserve_ms=DEFAULT_RESERVE_MS,
+                      max_workers=utils.DEFAULT_MAX_WORKERS):
+    """
+    Like utils.map_concurrently, but a worker only takes the next item
+    while remaining_ms() leaves reserve_ms plus the longest item seen so far.
+    The reserve is scaled to the budget left on the first call (see
+    budget_reserve), and the first item always starts, so every invocation
+    makes progress.
+    Returns (outcomes, pending): item -> (result, None) or (None, exception)
+    for the items that ran, and the items never started, in order.
+    """
+    items = list(items)
+    lock = threading.Lock()
+    state = {'next': 0, 'longest': 0.0, 'reserve': None}
+    stop = object()
+
+    def take():
+        with lock:
+            if state['next'] >= len(items):
+                return stop
+            left = remaining_ms()
+            if state['reserve'] is None:
+                state['reserve'] = budget_reserve(reserve_ms, left)
+            elif left < state['reserve'] + state['longest']:
+                return stop
+            state['next'] += 1
+            return items[state['next'] - 1]
+
+    def work(_):
+        results = {}
+        while True:
+            item = take()
+            if item is stop:
+                return results
+            started = time.monotonic()
+            try:
+                results[item] = (func(item), None)
+            except Exception as error: # pylint: disable=broad-except
+                results[item] = (None, error)
+            with lock:
+                state['longest'] = max(state['longest'], (time.monotonic() - started) * 1000)
+
+    outcomes = {}
+    for results, _ in utils.map_concurrently(work, range(min(max_workers, len(items))), max_workers).values():
+        outcomes.update(results or {})
+    pending = items[state['next']:]
+    if pending:
+        logger.info("Time budget reached: %d item(s) done, %d left for the next invocation",
+                    len(outcomes), len(pending))
+    return outcomes, pending
+
+
+class Checkpoint(object):
+    """
+    What a chain of invocations has finished so far: the snapshot name
+    suffix (fixed for the whole chain, so a chain crossing midnight does
+    not name its snapshots twice) and identifier -> [kind, created, reason]
+    of every completed target; reason is None for successes.
+    """
+
+    def __init__(self, suffix, completed=None, invocation=1):
+        self.suffix = suffix
+        self.completed = dict(completed or {})
+        self.invocation = invocation
+
+    def record(self, kind, identifier, created=False, reason=None):
+        self.completed[identifier] = [kind, bool(created), reason]
+
+    def encode(self):
+        """zlib compressed, base64 encoded JSON of the checkpoint."""
+        document = json.dumps({'Suffix': self.suffix, 'Invocation': self.invocation,
+                               'Completed': self.completed}, separators=(',', ':'))
+        return base64.b64encode(zlib.compress(document.encode('utf-8'), 9)).decode('ascii')
+
+    @classmethod
+    def decode(cls, value):
+        document = json.loads(zlib.decompress(base64.b64decode(value)).decode('utf-8'))
+        return cls(document['Suffix'], document['Completed'], document['Invocation'])
+
+    def next_event(self, event):
+        """
+        Copy of event carrying this checkpoint for the next invocation.
+        Raises ValueError if it would not fit an asynchronous payload.
+        """
+        following = dict(event)
+        following[EVENT_KEY] = Checkpoint(self.suffix, self.completed, self.invocation + 1).encode()
+        payload = json.dumps(following)
+        if len(payload) > MAX_PAYLOAD:
+            raise ValueError("Checkpoint of %d target(s) exceeds the %d byte invocation payload limit." %
+                             (len(self.completed), MAX_PAYLOAD))
+        return following
+
+    @classmethod
+    def from_event(cls, event):
+        """The checkpoint an earlier invocation put into event, or None."""
+        value = event.get(EVENT_KEY)
+        return cls.decode(value) if value else None
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           clients.py
+Author:         Adeel Ahmad
+Description:    Lazily created, shared boto3 clients for all entry points.
+"""
+
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# boto3 is imported on first use rather than at module import, so a cold start
+# only pays for botocore's model loading once a client is actually needed.
+_SESSION = None
+_CLIENTS = {}
+# One session per assumed role, its credentials refresh themselves.
+_ROLE_SESSIONS = {}
+# Callables applied to every client once it is built, e.g. instrumentation.
+_HOOKS = []
+# Guards the caches above, never held while a session or client is built.
+_LOCK = threading.RLock()
+# Client construction on one session is not thread safe: one lock per
+# session (role_arn, None for the shared one), so roles build in parallel.
+_BUILD_LOCKS = {}
+
+
+def _build_lock(role_arn):
+    """Lock serializing client construction on the session of role_arn."""
+    with _LOCK:
+        return _BUILD_LOCKS.setdefault(role_arn, threading.Lock())
+
+
+def get_session():
+    """
+    Return the process wide boto3 session, creating it on first use.
+    All clients share its botocore session and loaded service models.
+    """
+    global _SESSION
+    with _LOCK:
+        if _SESSION is None:
+            import boto3
+            _SESSION = boto3.session.Session()
+        return _SESSION
+
+
+def _assumed_session(role_arn, region=None):
+    """
+    Return the boto3 session acting as role_arn, shared by every client of
+    that role. Its credentials are assumed on first use and renewed by
+    botocore shortly before they expire (15 minutes ahead), so long running
+    and warm processes never sign with expired credentials.
+    """
+    with _LOCK:
+        session = _ROLE_SESSIONS.get(role_arn)
+    if session is not None:
+        return session
+    import boto3
+    import botocore.session
+    from botocore.credentials import DeferredRefreshableCredentials
+
+    def assume():
+        credentials = get_client('sts', region).assume_role(
+            RoleArn=role_arn,
+            RoleSessionName='rds-backup'
+            )['Credentials']
+        logger.info("Assumed %s until %s", role_arn, credentials['Expiration'])
+        return {
+            'access_key': credentials['AccessKeyId'],
+            'secret_key': credentials['SecretAccessKey'],
+            'token': credentials['SessionToken'],
+            'expiry_time': credentials['Expiration'].isoformat(),
+        }
+
+    shared = get_session()
+    with _build_lock(None):
+        loader = shared._session.get_component('data_loader') # pylint: disable=protected-access
+    core = botocore.session.get_session()
+    # Service models are loaded once per process, not once per role
+    core.register_component('data_loader', loader)
+    core._credentials = DeferredRefreshableCredentials( # pylint: disable=protected-access
+        refresh_using=assume, method='sts-assume-role')
+    session = boto3.session.Session(botocore_session=core, region_name=region or shared.region_name)
+    with _LOCK:
+        return _ROLE_SESSIONS.setdefault(role_arn, session)
+
+
+def get_client(service='rds', region=None, role_arn=None):
+    """
+    Return a cached client for service in region, optionally acting as
+    role_arn. The client is built on the first request for that key.
+    """
+    key = (service, region, role_arn)
+    with _LOCK:
+        client = _CLIENTS.get(key)
+    if client is not None:
+        return client
+    with _build_lock(role_arn):
+        with _LOCK:
+            client = _CLIENTS.get(key)
+        if client is not None:
+            return client
+        if role_arn:
+            session = _assumed_session(role_arn, region)
+        else:
+            session = get_session()
+        client = session.client(service, region_name=region)
+        with _LOCK:
+            # Cached first, so hooks can look up its key
+            cached = _CLIENTS.setdefault(key, client)
+            if cached is client:
+                for hook in _HOOKS:
+                    hook(client)
+    logger.debug("Created %s client (region=%s, role=%s)", service, region, role_arn)
+    return cached
+
+
+def install(client, service='rds', region=None, role_arn=None):
+    """
+    Use client for (service, region, role_arn) instead of building one,
+    e.g. to plug an in-process stand-in into every entry point.
+    """
+    with _LOCK:
+        _CLIENTS[(service, region, role_arn)] = client
+
+
+def key_of(client):
+    """(service, region, role_arn) a cached client was built or installed for, or None."""
+    with _LOCK:
+        for key, cached in _CLIENTS.items():
+            if cached is client:
+                return key
+    return None
+
+
+def add_client_hook(hook):
+    """
+    Register hook(client), called for every client already cached and
+    every client built from now on.
+    """
+    with _LOCK:
+        if hook in _HOOKS:
+            return
+        _HOOKS.append(hook)
+        for client in _CLIENTS.values():
+            hook(client)
+
+
+def reset():
+    """
+    Forget every cached client, assumed role session and the shared session.
+    """
+    global _SESSION
+    with _LOCK:
+        _CLIENTS.clear()
+        _ROLE_SESSIONS.clear()
+        _SESSION = None
+
+
+class LazyClient(object):
+    """
+    Stand-in for a boto3 client that defers construction to the first
+    attribute access, e.g. RDS = LazyClient('rds') at module level.
+    """
+
+    def __init__(self, service='rds', region=None, role_arn=None):
+        self.service = service
+        self.region = region
+        self.role_arn = role_arn
+
+    @property
+    def client(self):
+        """The underlying boto3 client, built on first use."""
+        return get_client(self.service, self.region, self.role_arn)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            # Keep copy/pickle/mock introspection from building a client
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    def __repr__(self):
+        return "LazyClient(%r, region=%r, role_arn=%r)" % (self.service, self.region, self.role_arn)
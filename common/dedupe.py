@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           dedupe.py
+Author:         Adeel Ahmad
+Description:    Drop repeated deliveries of the same event: an in-memory cache
+                per container, backed by an optional DynamoDB table shared by
+                all containers.
+"""
+
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
+
+import collections
+import logging
+import threading
+import time
+from botocore.exceptions import ClientError
+
+from common import clients
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# EventBridge retries a delivery for up to 24 hours
+DEFAULT_TTL = 24 * 3600
+# Event ids remembered per container, the oldest are forgotten first
+MAX_ENTRIES = 10000
+KEY_ATTRIBUTE = 'EventId'
+# Enable DynamoDB TTL on this attribute to expire old claims
+EXPIRY_ATTRIBUTE = 'ExpiresAt'
+
+
+class DedupeCache(object):
+    """
+    seen(key) claims key for ttl seconds and tells whether it was claimed
+    already. Claims are kept in memory and, if table is set, in DynamoDB
+    with a conditional write, so a duplicate delivered to another
+    container is dropped too. If DynamoDB fails the event is processed:
+    processing twice is safer than not at all.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, table=None, max_entries=MAX_ENTRIES, client=None, clock=time.time):
+        self.ttl = ttl
+        self.table = table
+        self.max_entries = max_entries
+        self._client = client or clients.LazyClient('dynamodb')
+        self._clock = clock
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def seen(self, key):
+        """True if key was claimed within ttl, otherwise claim it and return False."""
+        now = self._clock()
+        with self._lock:
+            expires = self._entries.get(key)
+            if expires is not None and expires > now:
+                return True
+            self._entries[key] = now + self.ttl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if self.table and not self._claim(key, now):
+            return True
+        return False
+
+    def _claim(self, key, now):
+        try:
+            self._client.put_item(
+                TableName=self.table,
+                Item={KEY_ATTRIBUTE: {'S': key}, EXPIRY_ATTRIBUTE: {'N': str(int(now + self.ttl))}},
+                # An expired claim may still be listed until DynamoDB TTL removes it
+                ConditionExpression='attribute_not_exists(#key) OR #expires < :now',
+                ExpressionAttributeNames={'#key': KEY_ATTRIBUTE, '#expires': EXPIRY_ATTRIBUTE},
+                ExpressionAttributeValues={':now': {'N': str(int(now))}})
+        except ClientError as error:
+            if error.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return False
+            logger.warning("Could not record event %s in %s, processing it anyway: %s", key, self.table, error)
+        return True
+
+    def release(self, key):
+        """Forget key, so a retry of an event that failed is processed again."""
+        with self._lock:
+            self._entries.pop(key, None)
+        if not self.table:
+            return
+        try:
+            self._client.delete_item(TableName=self.table, Key={KEY_ATTRIBUTE: {'S': key}})
+        except ClientError as error:
+            logger.warning("Could not release event %s in %s: %s", key, self.table, error)
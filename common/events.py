@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           events.py
+Author:         Adeel Ahmad
+Description:    Recognise RDS events delivered by Amazon EventBridge and name
+                the follow-up action each one calls for.
+"""
+
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
+
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+SOURCE = 'aws.rds'
+# A snapshot became available: copy, export and prune its source's snapshots
+SNAPSHOT_CREATED = 'snapshot-created'
+# An instance finished a backup, which includes this function's snapshots
+BACKUP_COMPLETED = 'backup-completed'
+# The snapshot of an event may be gone by the time it is handled
+SNAPSHOT_NOT_FOUND_CODES = ('DBSnapshotNotFound', 'DBSnapshotNotFoundFault', 'DBClusterSnapshotNotFoundFault')
+
+# detail-type -> (kind, ((message pattern, action), ...)). Messages are
+# matched rather than event ids, which differ between engines and kinds.
+ROUTES = {
+    'RDS DB Snapshot Event': ('instance', ((re.compile(r'snapshot created', re.I), SNAPSHOT_CREATED),)),
+    'RDS DB Cluster Snapshot Event': ('cluster', ((re.compile(r'snapshot created', re.I), SNAPSHOT_CREATED),)),
+    'RDS DB Instance Event': ('instance', ((re.compile(r'finished .*backup', re.I), BACKUP_COMPLETED),)),
+}
+
+
+def is_rds_event(event):
+    """True for an RDS event delivered by EventBridge (not a custom resource request)."""
+    return isinstance(event, dict) and event.get('source') == SOURCE and 'detail-type' in event
+
+
+def route(event):
+    """
+    The follow-up of one RDS event as a dict with 'Action', 'Kind',
+    'Identifier' (the snapshot, or the instance for backups), 'EventId'
+    and 'Message', or None if the event needs none.
+    """
+    kind, rules = ROUTES.get(event.get('detail-type'), (None, ()))
+    detail = event.get('detail') or {}
+    message = detail.get('Message', '')
+    identifier = detail.get('SourceIdentifier') or (detail.get('SourceArn') or '').split(':')[-1]
+    for pattern, action in rules:
+        if pattern.search(message) and identifier:
+            return {'Action': action, 'Kind': kind, 'Identifier': identifier,
+                    'EventId': event.get('id'), 'Message': message}
+    logger.info("No follow-up for %s: %s", event.get('detail-type'), message)
+    return None
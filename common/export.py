@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           export.py
+Author:         Adeel Ahmad
+Description:    Export snapshots to S3 as Parquet, within the account's limit
+                of concurrent export tasks, and report their throughput.
+"""
+
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
+
+import datetime
+import hashlib
+import logging
+import time
+
+from common import utils, waiter
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# RDS runs at most five export tasks per account at a time, tasks beyond
+# the limit are queued (or deferred to the next run).
+DEFAULT_MAX_CONCURRENT_EXPORTS = 5
+# Exports take tens of minutes to hours, poll accordingly
+DEFAULT_TIMEOUT = 6 * 3600
+DEFAULT_MIN_DELAY = 30
+DEFAULT_MAX_DELAY = 300
+# Export task identifiers are limited to 60 characters
+MAX_TASK_IDENTIFIER = 60
+TASK_PREFIX = 'export-'
+
+COMPLETE = 'COMPLETE'
+IN_PROGRESS_STATUSES = ('STARTING', 'IN_PROGRESS', 'CANCELING')
+
+_UTC = datetime.timezone.utc
+
+
+def task_identifier(snapshot_identifier):
+    """
+    Export task identifier of a snapshot, the same on every run so an
+    export is never started twice. Long names are shortened with a hash.
+    """
+    identifier = TASK_PREFIX + snapshot_identifier
+    if len(identifier) > MAX_TASK_IDENTIFIER:
+        digest = hashlib.sha1(snapshot_identifier.encode('utf-8')).hexdigest()[:8]
+        identifier = identifier[:MAX_TASK_IDENTIFIER - len(digest) - 1].rstrip('-') + '-' + digest
+    return identifier
+
+
+def _aware(value):
+    return value.replace(tzinfo=_UTC) if value.tzinfo is None else value
+
+
+def select_snapshots(snapshots, max_age_hours=None, now=None):
+    """
+    The available snapshots (dicts with 'Identifier', 'CreateTime' and
+    'Status', see retention.list_snapshots) created within max_age_hours.
+    """
+    now = now or datetime.datetime.now(_UTC)
+    selected = []
+    for snapshot in snapshots:
+        if snapshot.get('Status', waiter.AVAILABLE) != waiter.AVAILABLE or not snapshot.get('CreateTime'):
+            continue
+        if max_age_hours is not None and \
+                (now - _aware(snapshot['CreateTime'])).total_seconds() > max_age_hours * 3600:
+            continue
+        selected.append(snapshot)
+    return selected
+
+
+def list_candidates(prefix, max_age_hours=None, client=None, now=None):
+    """
+    Manual instance and cluster snapshots of the whole account whose
+    identifier starts with prefix, filtered by select_snapshots.
+    """
+    client = client or utils.RDS
+    snapshots = []
+    for operation, key, id_key, arn_key, kind in (
+            ('describe_db_snapshots', 'DBSnapshots', 'DBSnapshotIdentifier', 'DBSnapshotArn', 'instance'),
+            ('describe_db_cluster_snapshots', 'DBClusterSnapshots', 'DBClusterSnapshotIdentifier',
+             'DBClusterSnapshotArn', 'cluster')):
+        for page in client.get_paginator(operation).paginate(SnapshotType='manual'):
+            for snapshot in page.get(key, []):
+                if snapshot[id_key].startswith(prefix):
+                    snapshots.append({'Identifier': snapshot[id_key], 'Kind': kind,
+                                      'CreateTime': snapshot.get('SnapshotCreateTime'),
+                                      'Status': snapshot.get('Status'), 'Arn': snapshot.get(arn_key)})
+    return select_snapshots(snapshots, max_age_hours, now)
+
+
+def describe_exports(client=None):
+    """
+    Every export task of the account, as task identifier -> task, from one
+    paginated describe_export_tasks sweep. One sweep both tracks this
+    pipeline's tasks and counts the running ones against the limit.
+    """
+    client = client or utils.RDS
+    tasks = {}
+    for page in client.get_paginator('describe_export_tasks').paginate():
+        for task in page.get('ExportTasks', []):
+            tasks[task['ExportTaskIdentifier']] = task
+    return tasks
+
+
+def throughput(task, now=None):
+    """
+    Size, duration and rate of one export task: 'ExtractedGB', 'Minutes'
+    and 'GBPerMinute' (None until RDS reports the extracted size).
+    """
+    started = task.get('TaskStartTime')
+    ended = task.get('TaskEndTime') or now or datetime.datetime.now(_UTC)
+    extracted = task.get('TotalExtractedDataInGB')
+    minutes = (_aware(ended) - _aware(started)).total_seconds() / 60 if started else None
+    rate = round(extracted / minutes, 3) if extracted is not None and minutes else None
+    return {'ExtractedGB': extracted, 'Minutes': round(minutes, 1) if minutes is not None else None,
+            'GBPerMinute': rate}
+
+
+def finished_since(tasks, since):
+    """
+    The COMPLETE tasks among tasks (describe_exports values) that ended
+    after since, in epoch seconds.
+    """
+    return [task for task in tasks if task['Status'] == COMPLETE and task.get('TaskEndTime') and
+            _aware(task['TaskEndTime']).timestamp() > since]
+
+
+def _state(task):
+    if task['Status'] == COMPLETE:
+        return 'exported'
+    if task['Status'] in IN_PROGRESS_STATUSES:
+        return 'exporting'
+    return ('failed: %s %s' % (task['Status'], task.get('FailureCause', ''))).strip()
+
+
+def start_export(snapshot, bucket, iam_role_arn, kms_key_id, s3_prefix=None, client=None):
+    """Start the export task of one snapshot (a dict with 'Identifier' and 'Arn')."""
+    client = client or utils.RDS
+    extra = {'S3Prefix': s3_prefix} if s3_prefix else {}
+    logger.info("Exporting snapshot %s to s3://%s", snapshot['Identifier'], bucket)
+    return client.start_export_task(
+        ExportTaskIdentifier=task_identifier(snapshot['Identifier']),
+        SourceArn=snapshot['Arn'],
+        S3BucketName=bucket,
+        IamRoleArn=iam_role_arn,
+        KmsKeyId=kms_key_id,
+        **extra
+        )
+
+
+def start_exports(snapshots, bucket, iam_role_arn, kms_key_id, s3_prefix=None,
+                  max_concurrent=DEFAULT_MAX_CONCURRENT_EXPORTS, client=None, tasks=None):
+    """
+    Start exports of snapshots while fewer than max_concurrent tasks of the
+    account are running. Snapshots that already have a task are skipped.
+    tasks is a describe_exports() result, fetched if not given.
+    Returns identifier -> 'exported', 'exporting', 'started', 'deferred' or
+    'failed: <reason>'; a failed task keeps its identifier and is not retried.
+    """
+    tasks = describe_exports(client) if tasks is None else tasks
+    results = {}
+    pending = []
+    for snapshot in snapshots:
+        task = tasks.get(task_identifier(snapshot['Identifier']))
+        if task is None:
+            pending.append(snapshot)
+        else:
+            results[snapshot['Identifier']] = _state(task)
+
+    running = sum(1 for task in tasks.values() if task['Status'] in IN_PROGRESS_STATUSES)
+    slots = max(0, max_concurrent - running)
+    for snapshot in pending[slots:]:
+        results[snapshot['Identifier']] = 'deferred'
+    by_identifier = dict((snapshot['Identifier'], snapshot) for snapshot in pending[:slots])
+
+    def start(identifier):
+        return start_export(by_identifier[identifier], bucket, iam_role_arn, kms_key_id, s3_prefix, client)
+
+    for identifier, (_, error) in utils.map_concurrently(start, list(by_identifier), max(1, slots)).items():
+        results[identifier] = 'started' if error is None else 'failed: %s' % error
+    logger.info("Exports: %s", ", ".join("%d %s" % (list(results.values()).count(state), state)
+                                         for state in ('started', 'exporting', 'exported', 'deferred')))
+    return results
+
+
+def export_many(snapshots, bucket, iam_role_arn, kms_key_id, s3_prefix=None,
+                max_concurrent=DEFAULT_MAX_CONCURRENT_EXPORTS, client=None, timeout=DEFAULT_TIMEOUT,
+                min_delay=DEFAULT_MIN_DELAY, max_delay=DEFAULT_MAX_DELAY, clock=time.time, sleep=time.sleep):
+    """
+    Export every snapshot, keeping up to max_concurrent tasks of the account
+    running and starting queued ones as slots free up. All tasks are
+    polled with one describe_export_tasks sweep per round until every
+    export is finished or timeout seconds have passed.
+    Returns (results, total_seconds): identifier -> {'Task', 'Status',
+    'PercentProgress', 'ExtractedGB', 'Minutes', 'GBPerMinute'}.
+    """
+    began = clock()
+    deadline = began + timeout
+    delay = min_delay
+    snapshots = list(snapshots)
+    identifiers = dict((task_identifier(snapshot['Identifier']), snapshot['Identifier']) for snapshot in snapshots)
+    results = dict((snapshot['Identifier'], {'Task': task_identifier(snapshot['Identifier']), 'Status': 'queued',
+                                              'PercentProgress': 0, 'ExtractedGB': None, 'Minutes': None,
+                                              'GBPerMinute': None}) for snapshot in snapshots)
+    queued = snapshots
+    previous = None
+    while True:
+        tasks = describe_exports(client)
+        if queued:
+            started = start_exports(queued, bucket, iam_role_arn, kms_key_id, s3_prefix, max_concurrent,
+                                    client, tasks)
+            for identifier, state in started.items():
+                if state == 'started':
+                    results[identifier]['Status'] = 'STARTING'
+                elif state.startswith('failed') and task_identifier(identifier) not in tasks:
+                    # The start call itself failed
+                    results[identifier]['Status'] = state
+            queued = [snapshot for snapshot in queued if started.get(snapshot['Identifier']) == 'deferred']
+        for task_id, identifier in identifiers.items():
+            task = tasks.get(task_id)
+            if task is not None:
+                results[identifier].update(Status=task['Status'], PercentProgress=task.get('PercentProgress', 0),
+                                           **throughput(task))
+        running = sum(1 for result in results.values() if result['Status'] in ('queued',) + IN_PROGRESS_STATUSES)
+        logger.info("Exports: %d of %d finished, %d queued", len(results) - running, len(results), len(queued))
+        if not running:
+            break
+        if clock() + delay > deadline:
+            logger.error("Timed out with %d export(s) unfinished", running)
+            break
+        sleep(delay)
+        # Poll quickly while exports start or finish, back off while nothing changes
+        delay = min_delay if (running, len(queued)) != previous else min(max_delay, delay * 1.5)
+        previous = (running, len(queued))
+    for identifier, result in sorted(results.items()):
+        if result['GBPerMinute'] is not None:
+            logger.info("Export of %s: %.1f GB in %.1f min, %.3f GB/min", identifier,
+                        result['ExtractedGB'], result['Minutes'], result['GBPerMinute'])
+    return results, clock() - began
+
+
+def format_report(results, total_seconds):
+    """Per-export status and throughput as printable lines."""
+    lines = ["%-50s %-12s %8s %10s %10s %10s" % ('snapshot', 'status', 'progress', 'GB', 'minutes', 'GB/min')]
+
+    def cell(value, pattern):
+        return pattern % value if value is not None else '-'
+
+    for identifier, result in sorted(results.items()):
+        lines.append("%-50s %-12s %7d%% %10s %10s %10s" % (
+            identifier, result['Status'], result['PercentProgress'] or 0, cell(result['ExtractedGB'], '%.1f'),
+            cell(result['Minutes'], '%.1f'), cell(result['GBPerMinute'], '%.3f')))
+    exported = [result for result in results.values() if result['Status'] == COMPLETE]
+    total_gb = sum(result['ExtractedGB'] or 0 for result in exported)
+    lines.append("%d/%d exports complete, %.1f GB in %.0f s" % (len(exported), len(results), total_gb, total_seconds))
+    return lines
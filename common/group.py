@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           group.py
+Author:         Adeel Ahmad
+Description:    Snapshot groups: create calls for related databases released
+                at the same instant, tagged with a shared group id.
+"""
+
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
+
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+GROUP_TAG = 'SnapshotGroup'
+# One connection per member: botocore pools 10 connections per client, more
+# members would queue for a connection and skew the group.
+MAX_GROUP_SIZE = 10
+# Seconds the workers wait for each other before giving up
+BARRIER_TIMEOUT = 30
+# The member call of the current worker thread, see instrument()
+_SENDING = threading.local()
+
+
+def group_id(name, suffix):
+    """Group id shared by the snapshots of one run, e.g. 'orders-2023-01-01'."""
+    cleaned = re.sub('[^A-Za-z0-9-]+', '-', name).strip('-')
+    if not cleaned:
+        raise ValueError("Snapshot group name %r has no usable characters." % name)
+    return '%s-%s' % (cleaned, suffix)
+
+
+def group_tags(group):
+    return [{'Key': GROUP_TAG, 'Value': group}]
+
+
+def instrument(client):
+    """
+    Stamp the moment a group member's request is sent, after rate limiting
+    and request signing, through the client's before-send event. Calls
+    outside create_simultaneously are not affected. Stand-ins without an
+    event system are left alone.
+    """
+    events = getattr(getattr(client, 'meta', None), 'events', None)
+    if events is None:
+        return
+
+    def before_send(**kwargs):
+        clock = getattr(_SENDING, 'clock', None)
+        if clock is not None and _SENDING.sent is None:
+            _SENDING.sent = clock()
+
+    events.register('before-send', before_send)
+
+
+def create_simultaneously(func, items, timeout=BARRIER_TIMEOUT, clock=time.perf_counter):
+    """
+    Run func(item) for every item on its own, already running worker; a
+    barrier releases all of them at once. Returns (outcomes, skew): item ->
+    (result, None) or (None, exception), and the spread in milliseconds of
+    the moments the calls were issued ('IssueSkewMs') and answered
+    ('ResponseSkewMs'). A call is issued when its first request is sent on
+    a client set up with instrument(), otherwise when func is called.
+    """
+    items = list(items)
+    if len(items) > MAX_GROUP_SIZE:
+        raise ValueError("A snapshot group has at most %d members, got %d." % (MAX_GROUP_SIZE, len(items)))
+    if not items:
+        return {}, {'IssueSkewMs': 0.0, 'ResponseSkewMs': 0.0}
+    barrier = threading.Barrier(len(items))
+    issued, answered = {}, {}
+
+    def work(item):
+        _SENDING.clock, _SENDING.sent = clock, None
+        barrier.wait(timeout)
+        called = clock()
+        try:
+            return func(item)
+        finally:
+            answered[item] = clock()
+            issued[item] = _SENDING.sent if _SENDING.sent is not None else called
+            _SENDING.clock = None
+
+    outcomes = {}
+    with ThreadPoolExecutor(max_workers=len(items)) as pool:
+        futures = [(item, pool.submit(work, item)) for item in items]
+        for item, future in futures:
+            try:
+                outcomes[item] = (future.result(), None)
+            except Exception as error: # pylint: disable=broad-except
+                logger.error("Group member %s failed: %s", item, error)
+                outcomes[item] = (None, error)
+    skew = dict((name, round((max(moments.values()) - min(moments.values())) * 1000, 3) if moments else 0.0)
+                for name, moments in (('IssueSkewMs', issued), ('ResponseSkewMs', answered)))
+    logger.info("Snapshot group of %d member(s): issue skew %.3f ms, response skew %.3f ms",
+                len(items), skew['IssueSkewMs'], skew['ResponseSkewMs'])
+    return outcomes, skew
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           hub.py
+Author:         Adeel Ahmad
+Description:    Hub mode: run the same work in many AWS accounts from one
+                place, through a role assumed in each of them.
+"""
+
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
+
+import logging
+import re
+
+from common import clients, utils
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Role the hub assumes in every member account unless a full ARN is given
+DEFAULT_ROLE_NAME = 'rds-backup-hub'
+
+_ACCOUNT_ID = re.compile(r'^\d{12}$')
+_ROLE_ARN = re.compile(r'^arn:[\w-]+:iam::(\d{12}):role/.+$')
+
+
+def parse_accounts(value, role_name=DEFAULT_ROLE_NAME, partition='aws'):
+    """
+    Account ids (role_name is assumed in each) or full role ARNs, as a
+    comma separated string or a list. Returns [(account_id, role_arn)].
+    """
+    if isinstance(value, (list, tuple)):
+        entries = value
+    else:
+        entries = str(value or '').split(',')
+    accounts = []
+    for entry in (str(entry).strip() for entry in entries):
+        if not entry:
+            continue
+        matched = _ROLE_ARN.match(entry)
+        if matched:
+            accounts.append((matched.group(1), entry))
+        elif _ACCOUNT_ID.match(entry):
+            accounts.append((entry, 'arn:%s:iam::%s:role/%s' % (partition, entry, role_name)))
+        else:
+            raise ValueError("Hub account must be a 12 digit account id or a role ARN, got %r." % entry)
+    return accounts
+
+
+def client_for(role_arn, region=None, service='rds'):
+    """
+    The cached client of service acting as role_arn in region. Clients are
+    pooled per (service, region, role) by common.clients, and the role's
+    credentials are shared by all its regions and refreshed before expiry.
+    """
+    return clients.get_client(service, region, role_arn)
+
+
+def fan_out(func, accounts, regions=None, max_workers=utils.DEFAULT_MAX_WORKERS, client_factory=client_for):
+    """
+    Run func(account_id, region, client) for every account and region
+    concurrently. accounts is parse_accounts() output, regions defaults to
+    the session's region. Returns (account_id, region) -> (result, None)
+    or (None, exception), like utils.map_concurrently.
+    """
+    roles = dict(accounts)
+    sweeps = [(account_id, region) for account_id, _ in accounts for region in (regions or [None])]
+
+    def run(sweep):
+        account_id, region = sweep
+        return func(account_id, region, client_factory(roles[account_id], region))
+
+    logger.info("Hub: %d account(s) x %d region(s) with up to %d workers",
+                len(accounts), len(regions or [None]), max_workers)
+    return utils.map_concurrently(run, sweeps, max_workers)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           inventory.py
+Author:         Adeel Ahmad
+Description:    Streaming inventory of every RDS instance and cluster of one
+                or more regions, written as JSON Lines or CSV.
+"""
+
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
+
+import csv
+import datetime
+import logging
+import queue
+import threading
+
+from common import clients, serialization
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+FORMATS = ('jsonl', 'csv')
+FIELDS = ('Account', 'Region', 'Kind', 'Identifier', 'Cluster', 'Engine', 'Status', 'Class', 'Members',
+          'LatestSnapshot', 'LatestSnapshotTime', 'LatestSnapshotAgeHours')
+# Records buffered between the region sweeps and the writer
+QUEUE_SIZE = 1000
+
+_UTC = datetime.timezone.utc
+
+
+def latest_snapshots(client, kind):
+    """
+    Newest available snapshot (manual or automated) of every source in one
+    paginated sweep, as source id -> (CreateTime, Identifier). Only one
+    entry per source is kept, however many snapshots the region holds.
+    """
+    if kind == 'cluster':
+        operation, key, source_key, id_key = ('describe_db_cluster_snapshots', 'DBClusterSnapshots',
+                                              'DBClusterIdentifier', 'DBClusterSnapshotIdentifier')
+    else:
+        operation, key, source_key, id_key = ('describe_db_snapshots', 'DBSnapshots',
+                                              'DBInstanceIdentifier', 'DBSnapshotIdentifier')
+    latest = {}
+    for page in client.get_paginator(operation).paginate():
+        for snapshot in page.get(key, []):
+            created = snapshot.get('SnapshotCreateTime')
+            if not created or snapshot.get('Status') != 'available':
+                continue
+            source = snapshot.get(source_key)
+            if source not in latest or latest[source][0] < created:
+                latest[source] = (created, snapshot[id_key])
+    return latest
+
+
+def _with_snapshot(record, latest, now):
+    if latest:
+        created, identifier = latest
+        record['LatestSnapshot'] = identifier
+        record['LatestSnapshotTime'] = created
+        record['LatestSnapshotAgeHours'] = round((now - created).total_seconds() / 3600, 1)
+    else:
+        record['LatestSnapshot'] = record['LatestSnapshotTime'] = record['LatestSnapshotAgeHours'] = None
+    return record
+
+
+def inventory(client, region=None, now=None, account=None):
+    """
+    Yield one record per cluster, then one per instance, page by page.
+    Cluster members report the age of their cluster's newest snapshot.
+    """
+    now = now or datetime.datetime.now(_UTC)
+    region = region or client.meta.region_name
+    instance_snapshots = latest_snapshots(client, 'instance')
+    cluster_snapshots = latest_snapshots(client, 'cluster')
+    for page in client.get_paginator('describe_db_clusters').paginate():
+        for cluster in page.get('DBClusters', []):
+            identifier = cluster['DBClusterIdentifier']
+            yield _with_snapshot({
+                'Account': account,
+                'Region': region,
+                'Kind': 'cluster',
+                'Identifier': identifier,
+                'Cluster': identifier,
+                'Engine': cluster.get('Engine'),
+                'Status': cluster.get('Status'),
+                'Class': None,
+                'Members': len(cluster.get('DBClusterMembers', [])),
+            }, cluster_snapshots.get(identifier), now)
+    for page in client.get_paginator('describe_db_instances').paginate():
+        for instance in page.get('DBInstances', []):
+            cluster_id = instance.get('DBClusterIdentifier')
+            latest = cluster_snapshots.get(cluster_id) if cluster_id else \
+                instance_snapshots.get(instance['DBInstanceIdentifier'])
+            yield _with_snapshot({
+                'Account': account,
+                'Region': region,
+                'Kind': 'instance',
+                'Identifier': instance['DBInstanceIdentifier'],
+                'Cluster': cluster_id,
+                'Engine': instance.get('Engine'),
+                'Status': instance.get('DBInstanceStatus'),
+                'Class': instance.get('DBInstanceClass'),
+                'Members': None,
+            }, latest, now)
+
+
+def inventory_regions(regions, client_for=None, max_workers=None, now=None, accounts=None):
+    """
+    Yield the inventory of every region, of every account when accounts
+    (common.hub.parse_accounts output) is given, sweeping up to max_workers
+    of them at once. client_for(region, role_arn) defaults to the pooled
+    clients of common.clients. Records are handed over through a bounded
+    queue, so memory does not grow with the fleet. Once every sweep is
+    done, the first failure (if any) is raised; the others' records are
+    still yielded.
+    """
+    regions = list(regions) or [None]
+    sweeps = [(account_id, role_arn, region) for account_id, role_arn in (accounts or [(None, None)])
+              for region in regions]
+    client_for = client_for or (lambda region, role_arn: clients.get_client('rds', region, role_arn))
+    now = now or datetime.datetime.now(_UTC)
+    records = queue.Queue(maxsize=QUEUE_SIZE)
+    slots = threading.Semaphore(max_workers or len(sweeps))
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                records.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def sweep(account_id, role_arn, region):
+        with slots:
+            error = None
+            try:
+                for record in inventory(client_for(region, role_arn), region, now, account_id):
+                    if not put(record):
+                        return
+            except Exception as failure: # pylint: disable=broad-except
+                error = failure
+            put((done, '/'.join(str(part) for part in (account_id, region) if part), error))
+
+    workers = [threading.Thread(target=sweep, args=sweep_args, name='inventory-%s-%s' % sweep_args[::2])
+               for sweep_args in sweeps]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    errors = []
+    remaining = len(workers)
+    try:
+        while remaining:
+            item = records.get()
+            if isinstance(item, tuple) and item[0] is done:
+                remaining -= 1
+                if item[2] is not None:
+                    logger.error("Inventory of %s failed: %s", item[1] or 'the default region', item[2])
+                    errors.append(item[2])
+                continue
+            yield item
+    finally:
+        # Unblocks the sweeps if the consumer stops early
+        stop.set()
+    if errors:
+        raise errors[0]
+
+
+def _cell(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return '' if value is None else value
+
+
+def write(records, stream, fmt='jsonl'):
+    """Write records to stream as JSON Lines or CSV, one row at a time. Returns the record count."""
+    if fmt not in FORMATS:
+        raise ValueError("Inventory format must be one of %s, got %r." % (', '.join(FORMATS), fmt))
+    count = 0
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for record in records:
+            writer.writerow(dict((field, _cell(record.get(field))) for field in FIELDS))
+            count += 1
+    else:
+        for record in records:
+            stream.write(serialization.dumps(record) + '\n')
+            count += 1
+    stream.flush()
+    return count
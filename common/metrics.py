@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           metrics.py
+Author:         Adeel Ahmad
+Description:    CloudWatch Embedded Metric Format (EMF) instrumentation of
+                RDS API calls and entry points.
+"""
+
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
+
+import contextlib
+import functools
+import sys
+import threading
+import time
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+DEFAULT_NAMESPACE = 'RDSBackup'
+THROTTLE_CODES = ('Throttling', 'ThrottlingException', 'RequestLimitExceeded', 'TooManyRequestsException')
+# Dimension value for metrics that are not about one RDS operation.
+ENTRY_POINT = 'EntryPoint'
+# EMF allows at most 100 values per metric in one document.
+MAX_VALUES = 100
+
+
+class Metrics(object):
+    """
+    Collects metrics in memory and writes them as EMF JSON lines on flush(),
+    so CloudWatch extracts them from the logs without any API call.
+    Every method returns immediately when the instance is disabled.
+    """
+
+    def __init__(self, namespace=DEFAULT_NAMESPACE, enabled=False, dimensions=None, stream=None):
+        self.namespace = namespace
+        self.enabled = enabled
+        self.dimensions = dict(dimensions or {})
+        self._stream = stream
+        self._values = {}
+        self._lock = threading.Lock()
+        self._invocations = 0
+        self._collectors = []
+
+    def add(self, name, value, unit='Count', operation=ENTRY_POINT):
+        """Record one sample of metric name for operation."""
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._values.setdefault(operation, {}).setdefault(name, [unit, []])
+            entry[1].append(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, operation=ENTRY_POINT):
+        """Time the enclosed block in milliseconds."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000, 'Milliseconds', operation)
+
+    def add_collector(self, collector):
+        """Register collector(metrics), called on every flush to record gauges."""
+        if collector not in self._collectors:
+            self._collectors.append(collector)
+
+    def flush(self):
+        """Write one EMF document per operation and reset the collected values."""
+        if not self.enabled:
+            return
+        for collector in self._collectors:
+            collector(self)
+        with self._lock:
+            values, self._values = self._values, {}
+        stream = self._stream or sys.stdout
+        timestamp = int(time.time() * 1000)
+        for operation, metrics in sorted(values.items()):
+            document = dict(self.dimensions)
+            document['Operation'] = operation
+            document['_aws'] = {
+                'Timestamp': timestamp,
+                'CloudWatchMetrics': [{
+                    'Namespace': self.namespace,
+                    'Dimensions': [sorted(list(self.dimensions) + ['Operation'])],
+                    'Metrics': [{'Name': name, 'Unit': unit} for name, (unit, _) in sorted(metrics.items())],
+                }],
+            }
+            for name, (_, samples) in metrics.items():
+                samples = samples[-MAX_VALUES:]
+                document[name] = samples[0] if len(samples) == 1 else samples
+            stream.write(json.dumps(document, separators=(',', ':')) + '\n')
+        stream.flush()
+
+    def instrument(self, client):
+        """
+        Time every API call of a botocore client and count retries and
+        throttles, through the client's event system. A no-op when disabled.
+        """
+        if not self.enabled:
+            return
+        events = client.meta.events
+        service = client.meta.service_model.service_name
+
+        def before_call(context, **kwargs):
+            context['metrics_start'] = time.perf_counter()
+
+        def after_call(http_response, parsed, model, context, **kwargs):
+            start = context.get('metrics_start')
+            if start is not None:
+                self.add('ApiLatency', (time.perf_counter() - start) * 1000, 'Milliseconds', model.name)
+            self.add('ApiCalls', 1, 'Count', model.name)
+            retries = (parsed or {}).get('ResponseMetadata', {}).get('RetryAttempts', 0)
+            if retries:
+                self.add('ApiRetries', retries, 'Count', model.name)
+            if (parsed or {}).get('Error', {}).get('Code'):
+                self.add('ApiErrors', 1, 'Count', model.name)
+
+        def needs_retry(response, operation, **kwargs):
+            if response is None:
+                return
+            code = (response[1] or {}).get('Error', {}).get('Code')
+            if code in THROTTLE_CODES:
+                self.add('ApiThrottles', 1, 'Count', operation.name)
+
+        events.register('before-call.%s' % service, before_call)
+        events.register('after-call.%s' % service, after_call)
+        events.register('needs-retry.%s' % service, needs_retry)
+
+    def entry_point(self, name):
+        """
+        Decorator for handler(event, context) or main(...): records duration,
+        flags the first call in this process as a cold start and flushes.
+        """
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                self.add('ColdStart', 1 if self._invocations == 0 else 0, 'Count', name)
+                self._invocations += 1
+                try:
+                    with self.timer('Duration', name):
+                        return func(*args, **kwargs)
+                finally:
+                    self.flush()
+            return wrapper
+        return decorate
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           naming.py
+Author:         Adeel Ahmad
+Description:    Per-invocation snapshot names and a cached catalog of existing
+                snapshots, so reruns never issue a create call that would
+                fail with an AlreadyExists error.
+"""
+
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
+
+import re
+import threading
+import time
+
+from common import retention
+
+DAILY = 'daily'
+HOURLY = 'hourly'
+REQUEST = 'request'
+GRANULARITIES = (DAILY, HOURLY, REQUEST)
+DEFAULT_TTL = 300
+
+ALREADY_EXISTS_CODES = ('DBSnapshotAlreadyExists', 'DBSnapshotAlreadyExistsFault',
+                        'DBClusterSnapshotAlreadyExistsFault')
+# An existing snapshot in any other state ('failed', 'deleting',
+# 'incompatible-*', ...) is not a backup
+REUSABLE_STATUSES = ('available', 'creating')
+
+_RESPONSE_SHAPES = {
+    'instance': ('DBSnapshot', 'DBSnapshotIdentifier', 'DBInstanceIdentifier', 'DBSnapshotArn'),
+    'cluster': ('DBClusterSnapshot', 'DBClusterSnapshotIdentifier', 'DBClusterIdentifier', 'DBClusterSnapshotArn'),
+}
+
+
+def snapshot_suffix(now, granularity=DAILY, request_id=None):
+    """
+    Name suffix for a snapshot taken at now: one per day ('2023-01-01'),
+    per hour ('2023-01-01-13') or per request ('2023-01-01-<request id>').
+    A retried request keeps its request id, hence its snapshot name.
+    """
+    if granularity == DAILY:
+        return now.strftime('%Y-%m-%d')
+    if granularity == HOURLY:
+        return now.strftime('%Y-%m-%d-%H')
+    if granularity == REQUEST:
+        if not request_id:
+            raise ValueError("Per-request snapshot names need a request id.")
+        # Identifiers allow letters, digits and single hyphens only
+        return now.strftime('%Y-%m-%d-') + re.sub('[^a-z0-9]+', '-', request_id.lower()).strip('-')
+    raise ValueError("Snapshot name granularity must be one of %s, got %r." %
+                     (', '.join(GRANULARITIES), granularity))
+
+
+class UnusableSnapshotError(Exception):
+    """A snapshot with the name of this run exists but is not a usable backup."""
+
+
+def reusable(snapshot):
+    """True if an existing catalog entry counts as this run's snapshot."""
+    return snapshot.get('Status') in REUSABLE_STATUSES
+
+
+def reuse(snapshot):
+    """
+    as_response() of an existing snapshot standing in for this run's one,
+    raises UnusableSnapshotError unless it is available or being created.
+    """
+    if not reusable(snapshot):
+        raise UnusableSnapshotError("Snapshot %s already exists but is '%s'." %
+                                    (snapshot['Identifier'], snapshot.get('Status')))
+    return as_response(snapshot)
+
+
+def as_response(snapshot):
+    """A create_db_(cluster_)snapshot shaped response for a catalog entry."""
+    shape, id_key, source_key, arn_key = _RESPONSE_SHAPES[snapshot['Kind']]
+    return {shape: {
+        id_key: snapshot['Identifier'],
+        source_key: snapshot.get('SourceId'),
+        arn_key: snapshot.get('Arn'),
+        'Status': snapshot.get('Status'),
+        'Engine': snapshot.get('Engine'),
+        'SnapshotCreateTime': snapshot.get('CreateTime'),
+    }}
+
+
+class SnapshotCatalog(object):
+    """
+    TTL cache of retention.list_snapshots() per (kind, source, prefix).
+    Snapshots created or deleted by this process are applied to the cached
+    listings, so duplicate checks, replication and pruning share one
+    paginated sweep per source for as long as the entry is fresh.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._listings = {}
+        self._lock = threading.Lock()
+
+    def snapshots(self, kind, source_id, prefix, client=None):
+        """The (cached) snapshots of source_id whose identifier starts with prefix."""
+        key = (kind, source_id, prefix)
+        with self._lock:
+            cached = self._listings.get(key)
+            if cached and self._clock() - cached[0] < self.ttl:
+                return list(cached[1].values())
+        listed = retention.list_snapshots(kind, source_id, prefix, client)
+        with self._lock:
+            self._listings[key] = (self._clock(), dict((snapshot['Identifier'], snapshot) for snapshot in listed))
+        return list(listed)
+
+    def find(self, kind, source_id, prefix, identifier, client=None):
+        """The catalog entry of snapshot identifier, or None if it does not exist."""
+        for snapshot in self.snapshots(kind, source_id, prefix, client):
+            if snapshot['Identifier'] == identifier:
+                return dict(snapshot, SourceId=source_id)
+        return None
+
+    def add(self, kind, source_id, prefix, snapshot):
+        """Record a snapshot this process created; no-op if the listing is not cached."""
+        with self._lock:
+            cached = self._listings.get((kind, source_id, prefix))
+            if cached:
+                cached[1][snapshot['Identifier']] = snapshot
+
+    def discard(self, identifiers):
+        """Forget deleted snapshots in every cached listing."""
+        identifiers = set(identifiers)
+        with self._lock:
+            for _, listing in self._listings.values():
+                for identifier in identifiers & set(listing):
+                    del listing[identifier]
+
+    def invalidate(self, kind=None, source_id=None, prefix=None):
+        """Drop one cached listing, or all of them."""
+        with self._lock:
+            if kind is None:
+                self._listings.clear()
+            else:
+                self._listings.pop((kind, source_id, prefix), None)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           profiling.py
+Author:         Adeel Ahmad
+Description:    Opt-in profiling of entry points: cProfile statistics,
+                tracemalloc peak and top allocators, and wall-clock spans of
+                the phases of one call.
+"""
+
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
+
+import cProfile
+import functools
+import itertools
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+CPU = 'cpu'
+MEMORY = 'memory'
+SPANS = 'spans'
+MODES = (CPU, MEMORY, SPANS)
+# Lambda can only write to /tmp
+DEFAULT_OUTPUT_DIR = '/tmp'
+# Functions and allocation sites listed in the log summary
+DEFAULT_TOP = 15
+# Frames kept per allocation: one is enough to name the allocating line and
+# keeps tracemalloc's overhead low
+MEMORY_FRAMES = 1
+_IGNORED_ALLOCATIONS = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__),
+                        tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+                        tracemalloc.Filter(False, '<unknown>'))
+
+
+def parse_modes(value):
+    """
+    Modes from a setting: 'true'/'all' for every mode, or a comma separated
+    list of cpu, memory and spans. Empty, 'false' and unknown modes are off.
+    """
+    value = (value or '').strip().lower()
+    if value in ('', 'false', 'off', '0'):
+        return ()
+    if value in ('true', 'all', 'on', '1'):
+        return MODES
+    modes = []
+    for mode in (part.strip() for part in value.split(',')):
+        if mode in MODES:
+            modes.append(mode)
+        elif mode:
+            logger.warning("Ignoring unknown profiling mode %r, expected one of %s", mode, ', '.join(MODES))
+    return tuple(mode for mode in MODES if mode in modes)
+
+
+class Profiler(object):
+    """
+    Profiles the outermost decorated entry point running in the process.
+    An entry point called while another one runs (query_db_cluster inside
+    handler) is recorded as a span of the outer one. cProfile only sees the
+    thread that entered; spans and allocations of worker threads are
+    included. Nothing is installed and every method returns immediately
+    while no mode is enabled.
+    """
+
+    def __init__(self, modes=(), output_dir=DEFAULT_OUTPUT_DIR, top=DEFAULT_TOP, clock=time.perf_counter):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._counter = itertools.count(1)
+        self._depth = 0
+        self._began = None
+        self._spans = []
+        self._pending = []
+        self._phase = None
+        self.last_report = None
+        self.configure(modes, output_dir, top)
+
+    def configure(self, modes=(), output_dir=DEFAULT_OUTPUT_DIR, top=DEFAULT_TOP):
+        """Set the modes (a parse_modes() value or setting), the stats directory and the summary length."""
+        self.modes = parse_modes(modes) if not isinstance(modes, (tuple, list)) else tuple(modes)
+        self.output_dir = output_dir
+        self.top = top
+
+    @property
+    def enabled(self):
+        return bool(self.modes)
+
+    def add_span(self, name, seconds, started=None):
+        """
+        Record a span measured elsewhere. Outside an entry point it is
+        reported with the next one, e.g. the module import of a cold start.
+        """
+        if SPANS not in self.modes:
+            return
+        with self._lock:
+            if self._depth:
+                offset = (started if started is not None else self._clock() - seconds) - self._began
+                self._spans.append((name, offset, seconds))
+            else:
+                self._pending.append((name, None, seconds))
+
+    def span(self, name):
+        """Context manager recording the enclosed block as a span."""
+        if SPANS not in self.modes:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def phase(self, name):
+        """End the current phase of the running entry point and start phase name."""
+        if SPANS not in self.modes:
+            return
+        now = self._clock()
+        with self._lock:
+            if not self._depth:
+                return
+            previous, self._phase = self._phase, (name, now)
+        if previous is not None:
+            self.add_span(previous[0], now - previous[1], previous[1])
+
+    def entry_point(self, name):
+        """
+        Decorator for handler(event, context) or main(...): profiles the call
+        according to the enabled modes, logs a summary and writes the
+        cProfile statistics to output_dir.
+        """
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.modes:
+                    return func(*args, **kwargs)
+                with self._lock:
+                    outermost = self._depth == 0
+                    self._depth += 1
+                if not outermost:
+                    try:
+                        with self.span(name):
+                            return func(*args, **kwargs)
+                    finally:
+                        with self._lock:
+                            self._depth -= 1
+                return self._profile(name, func, args, kwargs)
+            return wrapper
+        return decorate
+
+    def _profile(self, name, func, args, kwargs):
+        with self._lock:
+            self._began = self._clock()
+            self._spans, self._pending = self._pending, []
+            self._phase = ('start', self._began)
+        tracing = MEMORY in self.modes and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start(MEMORY_FRAMES)
+        elif MEMORY in self.modes:
+            tracemalloc.reset_peak()
+        profile = None
+        if CPU in self.modes:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError as error: # Another profiler is active
+                logger.warning("cProfile unavailable, profiling %s without it: %s", name, error)
+                profile = None
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if profile is not None:
+                profile.disable()
+            ended = self._clock()
+            self.phase(None)
+            memory = None
+            if MEMORY in self.modes:
+                memory = (tracemalloc.get_traced_memory()[1],
+                          tracemalloc.take_snapshot().filter_traces(_IGNORED_ALLOCATIONS))
+                if tracing:
+                    tracemalloc.stop()
+            with self._lock:
+                spans, self._spans = self._spans, []
+                self._phase = None
+                self._depth -= 1
+            self.last_report = self._report(name, ended - self._began, spans, profile, memory)
+            for line in format_report(self.last_report):
+                logger.info("%s", line)
+
+    def _report(self, name, seconds, spans, profile, memory):
+        report = {'Name': name, 'Milliseconds': seconds * 1000,
+                  'Spans': [(span, None if offset is None else offset * 1000, length * 1000)
+                            for span, offset, length in sorted(spans, key=lambda span: (span[1] is not None,
+                                                                                        span[1] or 0))],
+                  'TopFunctions': [], 'PeakMemoryKiB': None, 'TopAllocators': [], 'StatsFile': None}
+        if profile is not None:
+            stats = pstats.Stats(profile)
+            ranked = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+            report['TopFunctions'] = [('%s:%d(%s)' % (os.path.basename(path), line, function), cumulative * 1000,
+                                       calls) for (path, line, function), (_, calls, _, cumulative, _)
+                                      in ranked[:self.top]]
+            report['StatsFile'] = self._dump(name, profile)
+        if memory is not None:
+            peak, snapshot = memory
+            report['PeakMemoryKiB'] = peak / 1024
+            report['TopAllocators'] = [('%s:%d' % (os.path.basename(stat.traceback[0].filename),
+                                                   stat.traceback[0].lineno), stat.size / 1024, stat.count)
+                                       for stat in snapshot.statistics('lineno')[:self.top]]
+        return report
+
+    def _dump(self, name, profile):
+        path = os.path.join(self.output_dir, '%s-%s-%d-%d.pstats' % (
+            name, time.strftime('%Y%m%dT%H%M%S'), os.getpid(), next(self._counter)))
+        try:
+            if not os.path.isdir(self.output_dir):
+                os.makedirs(self.output_dir)
+            profile.dump_stats(path)
+        except OSError as error:
+            logger.warning("Could not write profile of %s to %s: %s", name, path, error)
+            return None
+        return path
+
+
+class _Span(object):
+
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+        self._started = None
+
+    def __enter__(self):
+        self._started = self._profiler._clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._profiler.add_span(self._name, self._profiler._clock() - self._started, self._started)
+        return False
+
+
+class _NullSpan(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def format_report(report):
+    """A profile report as compact printable lines."""
+    def cell(value, pattern):
+        return pattern % value if value is not None else '-'
+
+    lines = ["Profile of %s: %.1f ms, peak memory %s KiB, stats %s" % (
+        report['Name'], report['Milliseconds'], cell(report['PeakMemoryKiB'], '%.1f'),
+        report['StatsFile'] or '-')]
+    for name, offset, milliseconds in report['Spans']:
+        lines.append("  span %10s %10.1f ms  %s" % (cell(offset, '+%.1f'), milliseconds, name))
+    for where, milliseconds, calls in report['TopFunctions']:
+        lines.append("  cpu  %10.1f ms %8d calls  %s" % (milliseconds, calls, where))
+    for where, kib, count in report['TopAllocators']:
+        lines.append("  mem  %10.1f KiB %7d blocks  %s" % (kib, count, where))
+    return lines
+
+
+# Shared by every entry point of the process; each script configures it
+# from its own environment variables.
+PROFILER = Profiler()
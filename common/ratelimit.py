@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           ratelimit.py
+Author:         Adeel Ahmad
+Description:    Client side rate limiting for RDS control-plane calls.
+"""
+
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
+
+import contextlib
+import os
+import threading
+import time
+
+from common import clients, metrics
+from common.metrics import THROTTLE_CODES
+
+# Defaults for the adaptive limiter, in calls per second
+DEFAULT_READ_RATE = 20
+DEFAULT_WRITE_RATE = 5
+DEFAULT_MIN_RATE = 0.5
+# Rate multiplier on a throttle, and the share of the ceiling regained per success
+DEFAULT_BACKOFF = 0.5
+DEFAULT_RECOVERY = 0.05
+READ = 'read'
+WRITE = 'write'
+# Operations that only read state, every other one mutates it
+READ_PREFIXES = ('Describe', 'List', 'Download')
+# Calls of the threads inside unpaced()
+_UNPACED = threading.local()
+
+
+class TokenBucket(object):
+    """
+    Thread safe token bucket. acquire() blocks until a token is available,
+    so a pool of workers sharing one bucket never exceeds `rate` calls per
+    second on average, with bursts of up to `capacity` calls.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+        # Callers currently sleeping in acquire()
+        self.waiting = 0
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def set_rate(self, rate):
+        """Change the refill rate; tokens accrued so far are kept."""
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        with self._lock:
+            self._refill()
+            self.rate = float(rate)
+
+    def charge(self, tokens=1):
+        """
+        Take tokens without waiting. The bucket may go into debt, which the
+        next callers of acquire() wait out, so the average rate still holds.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+
+    def acquire(self, tokens=1):
+        """
+        Take tokens from the bucket, sleeping as long as needed.
+        Returns the seconds spent waiting.
+        """
+        waited = 0.0
+        try:
+            while True:
+                with self._lock:
+                    self._refill()
+                    if self._tokens >= tokens:
+                        self._tokens -= tokens
+                        return waited
+                    delay = (tokens - self._tokens) / self.rate
+                    if not waited:
+                        self.waiting += 1
+                self._sleep(delay)
+                waited += delay
+        finally:
+            if waited:
+                with self._lock:
+                    self.waiting -= 1
+
+
+@contextlib.contextmanager
+def unpaced():
+    """
+    Calls made by this thread inside the block do not wait for a token,
+    they are charged to their budget instead. For calls that must be issued
+    at one instant, like the members of a snapshot group.
+    """
+    previous = getattr(_UNPACED, 'active', False)
+    _UNPACED.active = True
+    try:
+        yield
+    finally:
+        _UNPACED.active = previous
+
+
+def budget(operation):
+    """READ for Describe*/List* style operations, WRITE for everything else."""
+    return READ if operation.startswith(READ_PREFIXES) else WRITE
+
+
+class AdaptiveRateLimiter(object):
+    """
+    Token buckets for the read and the mutating calls of one service, shared
+    by every client it instruments. A throttled call cuts the rate of its
+    budget by `backoff`; each successful call regains `recovery` of the
+    ceiling, so the rate settles just under what the account allows
+    (additive increase, multiplicative decrease). RDS throttles per account
+    and region, so clients of another region or assumed role get buckets of
+    their own (see partition).
+    """
+
+    def __init__(self, read_rate=DEFAULT_READ_RATE, write_rate=DEFAULT_WRITE_RATE, min_rate=DEFAULT_MIN_RATE,
+                 backoff=DEFAULT_BACKOFF, recovery=DEFAULT_RECOVERY, service='rds',
+                 clock=time.monotonic, sleep=time.sleep):
+        self.service = service
+        self.min_rate = float(min_rate)
+        self.backoff = backoff
+        self.recovery = recovery
+        self.max_rates = {READ: float(read_rate), WRITE: float(write_rate)}
+        self.buckets = dict((name, TokenBucket(rate, clock=clock, sleep=sleep))
+                            for name, rate in self.max_rates.items())
+        self.throttles = dict.fromkeys(self.buckets, 0)
+        self._clock = clock
+        self._sleep = sleep
+        # (role_arn, region) -> limiter of that account and region
+        self._partitions = {}
+        self._lock = threading.Lock()
+
+    def partition(self, role_arn=None, region=None):
+        """
+        The limiter of the account behind role_arn in region, with the same
+        settings and buckets of its own. This limiter stands for the
+        default account and region (both None).
+        """
+        if role_arn is None and region is None:
+            return self
+        with self._lock:
+            limiter = self._partitions.get((role_arn, region))
+            if limiter is None:
+                limiter = AdaptiveRateLimiter(self.max_rates[READ], self.max_rates[WRITE], self.min_rate,
+                                              self.backoff, self.recovery, self.service, self._clock, self._sleep)
+                self._partitions[(role_arn, region)] = limiter
+            return limiter
+
+    def acquire(self, operation):
+        """Wait for a token of operation's budget, returns the seconds waited."""
+        bucket = self.buckets[budget(operation)]
+        if getattr(_UNPACED, 'active', False):
+            bucket.charge()
+            return 0.0
+        return bucket.acquire()
+
+    def throttled(self, operation):
+        """Back off after operation was throttled."""
+        name = budget(operation)
+        with self._lock:
+            bucket = self.buckets[name]
+            self.throttles[name] += 1
+            bucket.set_rate(max(self.min_rate, bucket.rate * self.backoff))
+
+    def succeeded(self, operation):
+        """Speed up again after operation went through."""
+        name = budget(operation)
+        with self._lock:
+            bucket, ceiling = self.buckets[name], self.max_rates[name]
+            if bucket.rate < ceiling:
+                bucket.set_rate(min(ceiling, bucket.rate + ceiling * self.recovery))
+
+    def stats(self):
+        """Current rate, queue depth and throttle count of each budget."""
+        with self._lock:
+            return dict((name, {'Rate': bucket.rate, 'QueueDepth': bucket.waiting,
+                                'Throttles': self.throttles[name]})
+                        for name, bucket in self.buckets.items())
+
+    def publish(self, metrics):
+        """Record stats() as RateLimit* metrics, one operation per budget."""
+        for name, stats in self.stats().items():
+            operation = '%sOperations' % name.capitalize()
+            metrics.add('RateLimit', stats['Rate'], 'Count/Second', operation)
+            metrics.add('RateLimitQueueDepth', stats['QueueDepth'], 'Count', operation)
+            metrics.add('RateLimitThrottles', stats['Throttles'], 'Count', operation)
+
+    def instrument(self, client):
+        """
+        Route every API call of a botocore client of this service through
+        the limiter of its account and region (the key it is cached under in
+        common.clients), via the client's event system. Every attempt
+        botocore retries after a throttle slows the budget down; the final
+        outcome of the call is reported once.
+        """
+        meta = getattr(client, 'meta', None)
+        if meta is None or meta.service_model.service_name != self.service:
+            return
+        events = meta.events
+        _, region, role_arn = clients.key_of(client) or (None, None, None)
+        limiter = self.partition(role_arn, region)
+
+        def before_parameter_build(model, **kwargs):
+            limiter.acquire(model.name)
+
+        def needs_retry(response, operation, request_dict, **kwargs):
+            if response is None:
+                return
+            if (response[1] or {}).get('Error', {}).get('Code') in THROTTLE_CODES:
+                request_dict['context']['ratelimit_throttled'] = True
+                limiter.throttled(operation.name)
+
+        def after_call(parsed, model, context, **kwargs):
+            code = (parsed or {}).get('Error', {}).get('Code')
+            if code in THROTTLE_CODES:
+                if not context.get('ratelimit_throttled'):
+                    limiter.throttled(model.name)
+            elif not code:
+                limiter.succeeded(model.name)
+
+        events.register('before-parameter-build.%s' % self.service, before_parameter_build)
+        events.register('needs-retry.%s' % self.service, needs_retry)
+        events.register('after-call.%s' % self.service, after_call)
+
+
+def install(limiter, recorder, enabled=True):
+    """
+    Hook limiter (unless enabled is False) and recorder, a metrics.Metrics,
+    into every client; the limiter's state is published with the metrics.
+    Disabled metrics install no hook.
+    """
+    if enabled:
+        clients.add_client_hook(limiter.instrument)
+        recorder.add_collector(limiter.publish)
+    if recorder.enabled:
+        clients.add_client_hook(recorder.instrument)
+
+
+def from_environment(script, environ=None):
+    """
+    Metrics and rate limiter of a command line script, installed with
+    install(). EMF metrics on stdout, off unless ENABLE_METRICS=true
+    (METRICS_NAMESPACE); every RDS call rate limited unless
+    RDS_RATE_LIMIT=false (RDS_READ_RATE, RDS_WRITE_RATE, RDS_MIN_RATE).
+    Returns (metrics, limiter).
+    """
+    environ = os.environ if environ is None else environ
+    recorder = metrics.Metrics(
+        namespace=environ.get('METRICS_NAMESPACE', metrics.DEFAULT_NAMESPACE),
+        enabled=environ.get('ENABLE_METRICS', 'false').lower() == 'true',
+        dimensions={'Script': script})
+    limiter = AdaptiveRateLimiter(
+        read_rate=float(environ.get('RDS_READ_RATE', DEFAULT_READ_RATE)),
+        write_rate=float(environ.get('RDS_WRITE_RATE', DEFAULT_WRITE_RATE)),
+        min_rate=float(environ.get('RDS_MIN_RATE', DEFAULT_MIN_RATE)))
+    install(limiter, recorder, environ.get('RDS_RATE_LIMIT', 'true').lower() == 'true')
+    return recorder, limiter
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           replication.py
+Author:         Adeel Ahmad
+Description:    Copy available snapshots into disaster recovery regions.
+"""
+
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
+
+import logging
+
+from common import clients, utils, waiter
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# RDS caps the snapshot copies in progress per destination region, copies
+# beyond the cap are deferred to the next run.
+DEFAULT_MAX_CONCURRENT_COPIES = 5
+
+IN_PROGRESS_STATUSES = ('creating', 'copying', 'pending')
+
+
+def _copy_one(client, snapshot, source_region, kms_key_id=None):
+    """
+    Start one cross-region copy, keeping the source identifier.
+    """
+    extra = {'KmsKeyId': kms_key_id} if kms_key_id else {}
+    if snapshot['Kind'] == 'cluster':
+        return client.copy_db_cluster_snapshot(
+            SourceDBClusterSnapshotIdentifier=snapshot['Arn'],
+            TargetDBClusterSnapshotIdentifier=snapshot['Identifier'],
+            SourceRegion=source_region,
+            CopyTags=True,
+            **extra
+            )
+    return client.copy_db_snapshot(
+        SourceDBSnapshotIdentifier=snapshot['Arn'],
+        TargetDBSnapshotIdentifier=snapshot['Identifier'],
+        SourceRegion=source_region,
+        CopyTags=True,
+        **extra
+        )
+
+
+def copy_to_region(snapshots, source_region, region, max_concurrent=DEFAULT_MAX_CONCURRENT_COPIES,
+                   kms_key_id=None, client=None):
+    """
+    Copy snapshots (dicts with 'Kind', 'Identifier' and 'Arn') into one
+    region. Snapshots already present at the destination are skipped, and
+    copies still in progress there count against max_concurrent.
+    Returns identifier -> 'exists', 'copying', 'started', 'deferred' or
+    'failed: <reason>'.
+    """
+    client = client or clients.get_client('rds', region)
+    existing = waiter.describe_snapshot_status(
+        [(snapshot['Kind'], snapshot['Identifier']) for snapshot in snapshots], client)
+    results = {}
+    pending = []
+    for snapshot in snapshots:
+        status = existing.get((snapshot['Kind'], snapshot['Identifier']))
+        if status is None:
+            pending.append(snapshot)
+        elif status[0] in IN_PROGRESS_STATUSES:
+            results[snapshot['Identifier']] = 'copying'
+        else:
+            results[snapshot['Identifier']] = 'exists'
+
+    slots = max(0, max_concurrent - list(results.values()).count('copying'))
+    for snapshot in pending[slots:]:
+        results[snapshot['Identifier']] = 'deferred'
+    by_identifier = dict((snapshot['Identifier'], snapshot) for snapshot in pending[:slots])
+
+    def start(identifier):
+        logger.info("Copying %s snapshot %s to %s", by_identifier[identifier]['Kind'], identifier, region)
+        return _copy_one(client, by_identifier[identifier], source_region, kms_key_id)
+
+    for identifier, (_, error) in utils.map_concurrently(start, list(by_identifier), max_concurrent).items():
+        results[identifier] = 'started' if error is None else 'failed: %s' % error
+    return results
+
+
+def copy_snapshots(snapshots, source_region, target_regions, max_concurrent=DEFAULT_MAX_CONCURRENT_COPIES,
+                   kms_key_ids=None):
+    """
+    Copy snapshots into every target region at once, each region with its
+    own client and its own concurrency cap. kms_key_ids optionally maps a
+    region to the key encrypted copies must use there.
+    Returns region -> (identifier -> result), see copy_to_region.
+    """
+    kms_key_ids = kms_key_ids or {}
+    available = [snapshot for snapshot in snapshots if snapshot.get('Status') == waiter.AVAILABLE]
+    if not available or not target_regions:
+        return {}
+
+    def replicate(region):
+        return copy_to_region(available, source_region, region, max_concurrent, kms_key_ids.get(region))
+
+    report = {}
+    for region, (results, error) in utils.map_concurrently(replicate, target_regions, len(target_regions)).items():
+        if error is not None:
+            logger.error("Copy to %s failed: %s", region, error)
+            results = dict((snapshot['Identifier'], 'failed: %s' % error) for snapshot in available)
+        report[region] = results
+        logger.info("Copy to %s: %s", region, ", ".join(
+            "%d %s" % (list(results.values()).count(state), state)
+            for state in ('started', 'copying', 'exists', 'deferred')))
+    return report
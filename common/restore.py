@@ -0,0 +1,415 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           restore.py
+Author:         Adeel Ahmad
+Description:    Concurrent point-in-time restores of many databases from a
+                manifest, including the instances of restored Aurora
+                clusters, tracked until they are available.
+"""
+
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
+
+import logging
+import os
+import time
+from botocore.exceptions import ClientError
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from common import timeline, utils
+from common.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_RATE = 5
+DEFAULT_TIMEOUT = 3600
+DEFAULT_MIN_DELAY = 15
+DEFAULT_MAX_DELAY = 60
+# Identifiers per Filters value list in one describe call.
+FILTER_BATCH = 100
+MAX_IDENTIFIER = 63
+# Instance settings copied from source cluster members when they are set.
+MEMBER_SETTINGS = ('AvailabilityZone', 'PubliclyAccessible', 'AutoMinorVersionUpgrade')
+
+RESTORE_FULL = 'full'
+RESTORE_CLONE = 'copy-on-write'
+RESTORE_SNAPSHOT = 'snapshot'
+# Errors meaning the source cannot be cloned (engine, version, clone limit
+# or cross-account), a full restore is still possible.
+CLONE_UNSUPPORTED_CODES = ('InvalidParameterCombination', 'InvalidParameterValue')
+
+AVAILABLE = 'available'
+FAILED_STATUSES = ('failed', 'incompatible-restore', 'incompatible-parameters', 'incompatible-network',
+                   'storage-full', 'inaccessible-encryption-credentials')
+
+_DESCRIBE = {
+    'instance': ('describe_db_instances', 'db-instance-id', 'DBInstances',
+                 'DBInstanceIdentifier', 'DBInstanceStatus'),
+    'cluster': ('describe_db_clusters', 'db-cluster-id', 'DBClusters', 'DBClusterIdentifier', 'Status'),
+}
+
+
+def load_manifest(value):
+    """
+    Parse a restore manifest given as JSON text or the path of a JSON file.
+    Either an object of source -> target, or a list of
+    {"Source": ..., "Target": ...} objects or [source, target] pairs.
+    Returns a list of (source, target) tuples.
+    """
+    if os.path.isfile(value):
+        with open(value) as manifest:
+            value = manifest.read()
+    entries = json.loads(value)
+    if isinstance(entries, dict):
+        entries = sorted(entries.items())
+    pairs = []
+    for entry in entries:
+        if isinstance(entry, dict):
+            entry = (entry.get('Source'), entry.get('Target'))
+        source, target = entry
+        if not source or not target:
+            raise ValueError("Manifest entry without source or target: %r" % (entry,))
+        pairs.append((source, target))
+    targets = [target for _, target in pairs]
+    if len(set(targets)) != len(targets):
+        raise ValueError("Manifest restores more than one source into the same target")
+    return pairs
+
+
+def member_identifier(member_id, source_cluster, target_cluster):
+    """
+    Name of the copy of member_id in target_cluster: the source cluster
+    prefix is swapped for the target's, otherwise the target is prepended.
+    """
+    if member_id.startswith(source_cluster):
+        identifier = target_cluster + member_id[len(source_cluster):]
+    else:
+        identifier = '%s-%s' % (target_cluster, member_id)
+    return identifier[:MAX_IDENTIFIER].rstrip('-')
+
+
+def cluster_members(source_cluster, target_cluster, client=None, bucket=None):
+    """
+    create_db_instance arguments reproducing the members of source_cluster
+    (class, parameter group, promotion tier, AZ) in target_cluster, writer first.
+    """
+    client = client or utils.RDS
+    if bucket:
+        bucket.acquire()
+    cluster = client.describe_db_clusters(DBClusterIdentifier=source_cluster)['DBClusters'][0]
+    members = list(cluster.get('DBClusterMembers') or [])
+    if not members:
+        return []
+    if bucket:
+        bucket.acquire()
+    instances = {}
+    pages = client.get_paginator('describe_db_instances').paginate(
+        Filters=[{'Name': 'db-cluster-id', 'Values': [source_cluster]}])
+    for page in pages:
+        for instance in page.get('DBInstances', []):
+            instances[instance['DBInstanceIdentifier']] = instance
+    specs = []
+    for member in sorted(members, key=lambda member: (not member.get('IsClusterWriter'),
+                                                      member.get('PromotionTier', 1),
+                                                      member['DBInstanceIdentifier'])):
+        instance = instances.get(member['DBInstanceIdentifier'])
+        if not instance:
+            continue
+        spec = {
+            'DBInstanceIdentifier': member_identifier(instance['DBInstanceIdentifier'],
+                                                      source_cluster, target_cluster),
+            'DBClusterIdentifier': target_cluster,
+            'DBInstanceClass': instance['DBInstanceClass'],
+            'Engine': instance['Engine'],
+            'PromotionTier': member.get('PromotionTier', instance.get('PromotionTier', 1)),
+        }
+        for key in MEMBER_SETTINGS:
+            if instance.get(key) is not None:
+                spec[key] = instance[key]
+        if instance.get('DBParameterGroups'):
+            spec['DBParameterGroupName'] = instance['DBParameterGroups'][0]['DBParameterGroupName']
+        if instance.get('MonitoringInterval'):
+            spec['MonitoringInterval'] = instance['MonitoringInterval']
+            spec['MonitoringRoleArn'] = instance.get('MonitoringRoleArn')
+        specs.append(spec)
+    return specs
+
+
+def create_instance(spec, client=None, bucket=None):
+    """Create one cluster member from a cluster_members() spec."""
+    client = client or utils.RDS
+    if bucket:
+        bucket.acquire()
+    logger.info("Creating %s (%s) in cluster %s", spec['DBInstanceIdentifier'],
+                spec['DBInstanceClass'], spec['DBClusterIdentifier'])
+    client.create_db_instance(**spec)
+    return spec['DBInstanceIdentifier']
+
+
+def _restore_time(restore_time, key):
+    """Point in time arguments: restore_time if given, else the latest restorable time."""
+    return {key: restore_time} if restore_time else {'UseLatestRestorableTime': True}
+
+
+def restore_cluster(source_cluster, target, client=None, clone=False, restore_time=None):
+    """
+    Start a restore of source_cluster into target, to restore_time or the
+    latest restorable time. With clone, try a copy-on-write clone first
+    (minutes instead of hours for large clusters) and fall back to a full
+    restore when the source cannot be cloned.
+    Returns (response, restore type used).
+    """
+    client = client or utils.RDS
+    if clone:
+        try:
+            response = client.restore_db_cluster_to_point_in_time(
+                DBClusterIdentifier=target,
+                SourceDBClusterIdentifier=source_cluster,
+                RestoreType=RESTORE_CLONE,
+                **_restore_time(restore_time, 'RestoreToTime'))
+            return response, RESTORE_CLONE
+        except ClientError as error:
+            if error.response.get('Error', {}).get('Code') not in CLONE_UNSUPPORTED_CODES:
+                raise
+            logger.warning("Cannot clone %s, falling back to a full restore: %s", source_cluster, error)
+    response = client.restore_db_cluster_to_point_in_time(
+        DBClusterIdentifier=target,
+        SourceDBClusterIdentifier=source_cluster,
+        **_restore_time(restore_time, 'RestoreToTime'))
+    return response, RESTORE_FULL
+
+
+def restore_to_point(kind, source_id, target, point, client=None, clone=False, engine=None):
+    """
+    Start the restore of instance or cluster source_id into target from a
+    common.timeline recovery point: from its snapshot, or point in time to
+    its 'Time'. engine is required for cluster snapshots.
+    Returns (response, restore type used).
+    """
+    client = client or utils.RDS
+    if point['Source'] == timeline.SNAPSHOT:
+        if kind == 'cluster':
+            response = client.restore_db_cluster_from_snapshot(
+                DBClusterIdentifier=target,
+                SnapshotIdentifier=point['SnapshotIdentifier'],
+                Engine=engine)
+        else:
+            response = client.restore_db_instance_from_db_snapshot(
+                DBInstanceIdentifier=target,
+                DBSnapshotIdentifier=point['SnapshotIdentifier'])
+        return response, RESTORE_SNAPSHOT
+    if kind == 'cluster':
+        return restore_cluster(source_id, target, client, clone, point['Time'])
+    response = client.restore_db_instance_to_point_in_time(
+        SourceDBInstanceIdentifier=source_id,
+        TargetDBInstanceIdentifier=target,
+        **_restore_time(point['Time'], 'RestoreTime'))
+    return response, RESTORE_FULL
+
+
+def start_restore(source, target, client=None, bucket=None, with_members=True, clone=False):
+    """
+    Start a latest restorable time restore of instance source, or of its
+    cluster if it belongs to one (cloned if clone is set, see
+    restore_cluster). Returns (kind, target, member specs, restore type):
+    the specs of the instances to create once a restored cluster is
+    available (see cluster_members), empty for instances.
+    """
+    client = client or utils.RDS
+    if bucket:
+        bucket.acquire()
+    cluster_id = utils.query_db_cluster(source, client)
+    if cluster_id:
+        specs = cluster_members(cluster_id, target, client, bucket) if with_members else []
+        if bucket:
+            bucket.acquire()
+        logger.info("Restoring cluster %s (of %s) to %s with %d instance(s)", cluster_id, source, target, len(specs))
+        _, restore_type = restore_cluster(cluster_id, target, client, clone)
+        return ('cluster', target, specs, restore_type)
+    if bucket:
+        bucket.acquire()
+    logger.info("Restoring instance %s to %s", source, target)
+    client.restore_db_instance_to_point_in_time(
+        SourceDBInstanceIdentifier=source,
+        TargetDBInstanceIdentifier=target,
+        UseLatestRestorableTime=True)
+    return ('instance', target, [], RESTORE_FULL)
+
+
+def describe_restore_status(targets, client=None, bucket=None):
+    """
+    Status of many restored instances/clusters with one filtered describe
+    call per kind (per FILTER_BATCH ids). targets is a list of (kind, id).
+    Returns a dict of (kind, id) -> status; targets not visible yet are absent.
+    """
+    client = client or utils.RDS
+    statuses = {}
+    for kind, (operation, filter_name, result_key, id_key, status_key) in _DESCRIBE.items():
+        identifiers = sorted(set(identifier for target_kind, identifier in targets if target_kind == kind))
+        for start in range(0, len(identifiers), FILTER_BATCH):
+            if bucket:
+                bucket.acquire()
+            pages = client.get_paginator(operation).paginate(
+                Filters=[{'Name': filter_name, 'Values': identifiers[start:start + FILTER_BATCH]}])
+            for page in pages:
+                for item in page.get(result_key, []):
+                    statuses[(kind, item[id_key])] = item.get(status_key)
+    return statuses
+
+
+def _track(pending, members, results, started_at, client, bucket, deadline, min_delay, max_delay,
+           max_workers, clock, sleep):
+    """
+    Poll pending, a dict of (kind, id) -> target, until every target is
+    available, failed or deadline passes. When a cluster listed in members
+    becomes available its instances are created in parallel and tracked
+    under the same target; the target is done when all of them are.
+    results and started_at are keyed by target.
+    """
+    outstanding = {}
+    for key, target in pending.items():
+        outstanding.setdefault(target, set()).add(key)
+
+    def fail(target, status):
+        results[target]['Status'] = status
+        for key in outstanding.pop(target, ()):
+            pending.pop(key, None)
+
+    delay = min_delay
+    while pending:
+        if clock() + delay > deadline:
+            logger.warning("Stopping wait with %d restore(s) pending: timeout", len(outstanding))
+            for target in outstanding:
+                results[target]['Status'] = 'timeout'
+            break
+        sleep(delay)
+        statuses = describe_restore_status(list(pending), client, bucket)
+        finished = False
+        create = {}
+        for key in sorted(pending):
+            status = statuses.get(key)
+            if status is None or key not in pending:
+                continue # not visible to describe calls yet, or its target failed
+            target = pending[key]
+            results[target]['Status'] = status
+            if status in FAILED_STATUSES:
+                logger.error("Restore into %s: %s %s is %s", target, key[0], key[1], status)
+                fail(target, status)
+                finished = True
+            elif status == AVAILABLE:
+                del pending[key]
+                outstanding[target].discard(key)
+                finished = True
+                for spec in members.get(key, ()):
+                    create[spec['DBInstanceIdentifier']] = (target, spec)
+
+        # Every member of a ready cluster boots at the same time
+        created = utils.map_concurrently(lambda identifier: create_instance(create[identifier][1], client, bucket),
+                                         sorted(create), max_workers)
+        for identifier, (_, error) in sorted(created.items()):
+            target = create[identifier][0]
+            if target not in outstanding:
+                continue
+            if error is not None:
+                fail(target, 'failed: %s' % error)
+                continue
+            results[target]['Instances'].append(identifier)
+            pending[('instance', identifier)] = target
+            outstanding[target].add(('instance', identifier))
+
+        for target in sorted(target for target, keys in outstanding.items() if not keys):
+            del outstanding[target]
+            results[target]['Status'] = AVAILABLE
+            results[target]['Seconds'] = clock() - started_at[target]
+            logger.info("Restore into %s available after %.0f s", target, results[target]['Seconds'])
+        # Poll quickly while restores complete, back off while nothing changes
+        delay = min_delay if finished else min(max_delay, delay * 1.5)
+
+
+def _result(source, target, kind=None, status=None):
+    """Fresh result entry of the restore of source into target."""
+    return {'Source': source, 'Target': target, 'Type': kind, 'RestoreType': None, 'Status': status,
+            'Seconds': None, 'Instances': []}
+
+
+def restore_many(pairs, client=None, max_workers=utils.DEFAULT_MAX_WORKERS, rate=DEFAULT_RATE,
+                 timeout=DEFAULT_TIMEOUT, min_delay=DEFAULT_MIN_DELAY, max_delay=DEFAULT_MAX_DELAY,
+                 with_members=True, clone=False, clock=time.time, sleep=time.sleep):
+    """
+    Start every (source, target) restore concurrently, sharing one API rate
+    budget, then track all of them together until each is available, failed
+    or timeout seconds have passed. Restored clusters get their members
+    recreated unless with_members is False, and are cloned if clone is set.
+    Returns (results, total_seconds), results being a dict of target ->
+    {'Source', 'Target', 'Type', 'RestoreType', 'Status', 'Seconds', 'Instances'}; Seconds is the
+    time from starting that restore to seeing it (and its instances) available.
+    Targets are unique, one source may be restored into several of them.
+    """
+    bucket = TokenBucket(rate)
+    began = clock()
+
+    def start(pair):
+        result = start_restore(pair[0], pair[1], client, bucket, with_members, clone)
+        return result, clock()
+
+    results = {}
+    pending = {}
+    members = {}
+    started_at = {}
+    for (source, target), (started, error) in utils.map_concurrently(start, pairs, max_workers).items():
+        results[target] = _result(source, target)
+        if error is not None:
+            results[target]['Status'] = 'failed: %s' % error
+            continue
+        (kind, _, specs, restore_type), started_at[target] = started
+        results[target].update(Type=kind, RestoreType=restore_type, Status='starting')
+        pending[(kind, target)] = target
+        members[(kind, target)] = specs
+    _track(pending, members, results, started_at, client, bucket, began + timeout,
+           min_delay, max_delay, max_workers, clock, sleep)
+    return results, clock() - began
+
+
+def wait_for(kind, target, client=None, max_workers=utils.DEFAULT_MAX_WORKERS, rate=DEFAULT_RATE,
+             timeout=DEFAULT_TIMEOUT, min_delay=DEFAULT_MIN_DELAY, max_delay=DEFAULT_MAX_DELAY,
+             clock=time.time, sleep=time.sleep):
+    """Wait for the already started restore of instance or cluster target, returns its final status."""
+    began = clock()
+    results = {target: _result(None, target, kind, 'starting')}
+    _track({(kind, target): target}, {}, results, {target: began}, client, TokenBucket(rate), began + timeout,
+           min_delay, max_delay, max_workers, clock, sleep)
+    return results[target]['Status']
+
+
+def complete_cluster(target, specs, client=None, max_workers=utils.DEFAULT_MAX_WORKERS, rate=DEFAULT_RATE,
+                     timeout=DEFAULT_TIMEOUT, min_delay=DEFAULT_MIN_DELAY, max_delay=DEFAULT_MAX_DELAY,
+                     clock=time.time, sleep=time.sleep):
+    """
+    Wait for the already started restore of cluster target, then create the
+    instances in specs in parallel and wait for them. Returns a dict with
+    'Status', 'Seconds' (time to a usable cluster) and 'Instances'.
+    """
+    began = clock()
+    results = {target: _result(None, target, 'cluster', 'starting')}
+    _track({('cluster', target): target}, {('cluster', target): specs}, results, {target: began}, client,
+           TokenBucket(rate), began + timeout, min_delay, max_delay, max_workers, clock, sleep)
+    return results[target]
+
+
+def format_report(results, total_seconds):
+    """Per-database and total recovery time as printable lines."""
+    lines = ["%-40s %-40s %-8s %-13s %-24s %10s" % ('source', 'target', 'type', 'restore', 'status', 'seconds')]
+    for target, result in sorted(results.items(), key=lambda item: (item[1]['Source'], item[0])):
+        seconds = '%.0f' % result['Seconds'] if result['Seconds'] is not None else '-'
+        lines.append("%-40s %-40s %-8s %-13s %-24s %10s" % (result['Source'], target, result['Type'] or '-',
+                                                           result.get('RestoreType') or '-',
+                                                           result['Status'], seconds))
+    available = sum(1 for result in results.values() if result['Status'] == AVAILABLE)
+    lines.append("%d/%d restores available, total recovery time %.0f s" %
+                 (available, len(results), total_seconds))
+    return lines
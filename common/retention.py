@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           retention.py
+Author:         Adeel Ahmad
+Description:    Grandfather-father-son retention for the manual snapshots
+                created by the backup Lambda.
+"""
+
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
+
+import logging
+
+from common import utils
+from common.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Delete calls are mutating control-plane requests, keep well below the
+# account throttle so concurrent backups are not starved.
+DEFAULT_DELETE_RATE = 5
+
+
+def _day(create_time):
+    return create_time.date()
+
+
+def _week(create_time):
+    return tuple(create_time.isocalendar()[:2])
+
+
+def _month(create_time):
+    return (create_time.year, create_time.month)
+
+
+def select_expired(snapshots, daily=7, weekly=4, monthly=12):
+    """
+    Pure grandfather-father-son selection.
+    snapshots is an iterable of dicts with 'Identifier', 'CreateTime'
+    (datetime) and optionally 'Status'. The newest snapshot of each of the
+    `daily` most recent days, `weekly` most recent ISO weeks and `monthly`
+    most recent months is kept. Returns the expired snapshots, newest first.
+    Snapshots without a CreateTime or not yet 'available' are never expired.
+    """
+    ordered = sorted((snapshot for snapshot in snapshots if snapshot.get('CreateTime')),
+                     key=lambda snapshot: snapshot['CreateTime'], reverse=True)
+    keep = set()
+    for count, bucket in ((daily, _day), (weekly, _week), (monthly, _month)):
+        seen = set()
+        for snapshot in ordered:
+            if len(seen) >= count:
+                break
+            key = bucket(snapshot['CreateTime'])
+            if key not in seen:
+                seen.add(key)
+                keep.add(snapshot['Identifier'])
+    return [snapshot for snapshot in ordered
+            if snapshot['Identifier'] not in keep and
+            snapshot.get('Status', 'available') == 'available']
+
+
+def list_snapshots(kind, source_id, prefix, client=None):
+    """
+    Page through the manual snapshots of one instance or cluster and
+    return those whose identifier starts with prefix, as dicts with
+    'Identifier', 'Kind', 'CreateTime', 'Status', 'Arn' and 'Engine'.
+    """
+    client = client or utils.RDS
+    snapshots = []
+    if kind == 'cluster':
+        pages = client.get_paginator('describe_db_cluster_snapshots').paginate(
+            DBClusterIdentifier=source_id, SnapshotType='manual')
+        for page in pages:
+            for snapshot in page.get('DBClusterSnapshots', []):
+                if snapshot['DBClusterSnapshotIdentifier'].startswith(prefix):
+                    snapshots.append({'Identifier': snapshot['DBClusterSnapshotIdentifier'],
+                                      'Kind': kind,
+                                      'CreateTime': snapshot.get('SnapshotCreateTime'),
+                                      'Status': snapshot.get('Status'),
+                                      'Arn': snapshot.get('DBClusterSnapshotArn'),
+                                      'Engine': snapshot.get('Engine')})
+    else:
+        pages = client.get_paginator('describe_db_snapshots').paginate(
+            DBInstanceIdentifier=source_id, SnapshotType='manual')
+        for page in pages:
+            for snapshot in page.get('DBSnapshots', []):
+                if snapshot['DBSnapshotIdentifier'].startswith(prefix):
+                    snapshots.append({'Identifier': snapshot['DBSnapshotIdentifier'],
+                                      'Kind': kind,
+                                      'CreateTime': snapshot.get('SnapshotCreateTime'),
+                                      'Status': snapshot.get('Status'),
+                                      'Arn': snapshot.get('DBSnapshotArn'),
+                                      'Engine': snapshot.get('Engine')})
+    return snapshots
+
+
+def delete_snapshots(snapshots, client=None, max_workers=utils.DEFAULT_MAX_WORKERS,
+                     rate=DEFAULT_DELETE_RATE):
+    """
+    Delete snapshots concurrently, never faster than `rate` calls per second.
+    Returns a dict of identifier -> (response, None) or (None, exception).
+    """
+    client = client or utils.RDS
+    bucket = TokenBucket(rate)
+    kinds = dict((snapshot['Identifier'], snapshot['Kind']) for snapshot in snapshots)
+
+    def delete(identifier):
+        bucket.acquire()
+        logger.info("Deleting expired %s snapshot %s", kinds[identifier], identifier)
+        if kinds[identifier] == 'cluster':
+            return client.delete_db_cluster_snapshot(DBClusterSnapshotIdentifier=identifier)
+        return client.delete_db_snapshot(DBSnapshotIdentifier=identifier)
+
+    return utils.map_concurrently(delete, list(kinds), max_workers)
+
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           serialization.py
+Author:         Adeel Ahmad
+Description:    Compact JSON encoding of botocore responses for CloudFormation
+                custom resource responses.
+"""
+
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
+
+import base64
+import datetime
+import decimal
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+# CloudFormation rejects custom resource responses larger than this.
+RESPONSE_BUDGET = 4096
+# Longest Reason kept, ClientError messages can be arbitrarily long.
+MAX_REASON = 1024
+TRUNCATED_KEY = 'TruncatedKeys'
+
+# Fields of a snapshot description that stacks actually consume.
+SNAPSHOT_FIELDS = (
+    'DBSnapshotIdentifier', 'DBClusterSnapshotIdentifier',
+    'DBInstanceIdentifier', 'DBClusterIdentifier',
+    'DBSnapshotArn', 'DBClusterSnapshotArn',
+    'Status', 'Engine', 'SnapshotType', 'PercentProgress', 'SnapshotCreateTime',
+)
+SNAPSHOT_SHAPES = ('DBSnapshot', 'DBClusterSnapshot')
+
+_SEPARATORS = (',', ':')
+
+
+def _default(value):
+    """
+    json.dumps hook, only invoked for values the C encoder cannot handle,
+    so all conversions happen during the single encoding pass.
+    """
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode('ascii')
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return str(value)
+
+
+def dumps(value):
+    """Compact JSON of value, botocore types included."""
+    return json.dumps(value, default=_default, separators=_SEPARATORS)
+
+
+def project(response_data):
+    """
+    Reduce create/describe snapshot responses to SNAPSHOT_FIELDS and drop
+    ResponseMetadata. Other mappings are returned unchanged (shallow copy).
+    """
+    projected = dict((key, value) for key, value in response_data.items() if key != 'ResponseMetadata')
+    for shape in SNAPSHOT_SHAPES:
+        if isinstance(projected.get(shape), dict):
+            projected[shape] = dict((field, value) for field, value in projected[shape].items()
+                                    if field in SNAPSHOT_FIELDS)
+    return projected
+
+
+def encode_response(body, budget=RESPONSE_BUDGET):
+    """
+    Encode a custom resource response body within budget bytes.
+    Data is projected first; if the body is still too large, the largest
+    Data entries are dropped and listed under TruncatedKeys.
+    Returns UTF-8 bytes.
+    """
+    body = dict(body)
+    if body.get('Reason') and len(body['Reason']) > MAX_REASON:
+        body['Reason'] = body['Reason'][:MAX_REASON - 3] + '...'
+    data = project(body.get('Data') or {})
+    body['Data'] = data
+    encoded = dumps(body).encode('utf-8')
+    if len(encoded) <= budget:
+        return encoded
+
+    # Size every entry once, then drop the largest until the body fits.
+    sizes = sorted(((len(dumps(value)) + len(dumps(key)) + 2, key) for key, value in data.items()),
+                   reverse=True)
+    overflow = len(encoded) - budget
+    # Room for the TruncatedKeys entry itself: key, quotes, colon, comma
+    listing = len(TRUNCATED_KEY) + 6
+    dropped = []
+    for size, key in sizes:
+        dropped.append(key)
+        overflow -= size
+        listing += len(str(key)) + 1
+        if overflow + listing <= 0:
+            break
+    for key in dropped:
+        data.pop(key)
+    data[TRUNCATED_KEY] = ','.join(sorted(str(key) for key in dropped))
+    encoded = dumps(body).encode('utf-8')
+    if len(encoded) > budget:
+        # Too many keys to even list them, keep a count instead
+        body['Data'] = {TRUNCATED_KEY: '%d keys' % len(dropped)}
+        encoded = dumps(body).encode('utf-8')
+    return encoded
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           timeline.py
+Author:         Adeel Ahmad
+Description:    Sorted index of the recovery points of one instance or cluster
+                (manual snapshots and the point-in-time restore window), with
+                a local JSON cache.
+"""
+
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
+
+import bisect
+import datetime
+import logging
+import os
+import tempfile
+import time
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from common import retention, utils
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_CACHE_TTL = 3600
+SNAPSHOT = 'snapshot'
+PITR = 'pitr'
+# choose() modes: PITR when the window covers the time, else a snapshot
+AUTO = 'auto'
+SOURCES = (AUTO, SNAPSHOT, PITR)
+CACHE_VERSION = 1
+
+_UTC = datetime.timezone.utc
+
+
+def parse_time(value):
+    """ISO 8601 timestamp (naive means UTC, 'Z' accepted) to an aware UTC datetime."""
+    if isinstance(value, datetime.datetime):
+        moment = value
+    else:
+        moment = datetime.datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=_UTC)
+    return moment.astimezone(_UTC)
+
+
+def restore_window(kind, source_id, client=None):
+    """
+    (earliest, latest) restorable times and the engine of an instance or
+    cluster. The window is None when automated backups are disabled.
+    """
+    client = client or utils.RDS
+    if kind == 'cluster':
+        cluster = client.describe_db_clusters(DBClusterIdentifier=source_id)['DBClusters'][0]
+        earliest, latest = cluster.get('EarliestRestorableTime'), cluster.get('LatestRestorableTime')
+        engine = cluster.get('Engine')
+    else:
+        instance = client.describe_db_instances(DBInstanceIdentifier=source_id)['DBInstances'][0]
+        engine = instance.get('Engine')
+        latest = instance.get('LatestRestorableTime')
+        backups = client.describe_db_instance_automated_backups(
+            DBInstanceIdentifier=source_id).get('DBInstanceAutomatedBackups', [])
+        earliest = backups[0].get('RestoreWindow', {}).get('EarliestTime') if backups else None
+    if earliest is None or latest is None:
+        return None, engine
+    return (parse_time(earliest), parse_time(latest)), engine
+
+
+class Timeline(object):
+    """
+    Recovery points of one source, oldest first: its available manual
+    snapshots with the given prefix plus the automated backup window.
+    Lookups are binary searches over the snapshot creation times.
+    """
+
+    def __init__(self, kind, source_id, prefix, snapshots=(), window=None, engine=None, built_at=None):
+        self.kind = kind
+        self.source_id = source_id
+        self.prefix = prefix
+        # (CreateTime, Identifier) of available snapshots, sorted
+        self.snapshots = sorted((parse_time(created), identifier) for created, identifier in snapshots)
+        self._times = [created for created, _ in self.snapshots]
+        self.window = window
+        self.engine = engine
+        self.built_at = built_at if built_at is not None else time.time()
+
+    @classmethod
+    def build(cls, kind, source_id, prefix, client=None, clock=time.time):
+        """One paginated sweep of the source's snapshots plus one window lookup."""
+        snapshots = [(snapshot['CreateTime'], snapshot['Identifier'])
+                     for snapshot in retention.list_snapshots(kind, source_id, prefix, client)
+                     if snapshot.get('CreateTime') and snapshot.get('Status') == 'available']
+        window, engine = restore_window(kind, source_id, client)
+        return cls(kind, source_id, prefix, snapshots, window, engine, clock())
+
+    def refresh_window(self, client=None):
+        """Look the restore window up again, it moves forward every few minutes."""
+        self.window, self.engine = restore_window(self.kind, self.source_id, client)
+
+    def snapshot_before(self, when):
+        """(CreateTime, Identifier) of the newest snapshot taken at or before when, or None."""
+        index = bisect.bisect_right(self._times, parse_time(when))
+        return self.snapshots[index - 1] if index else None
+
+    def choose(self, when, source=AUTO):
+        """
+        Best recovery point for when: a point-in-time restore to exactly
+        when if the backup window covers it (source 'auto' or 'pitr'),
+        otherwise the newest snapshot at or before it ('auto' or 'snapshot').
+        Returns a dict with 'Source', 'Time' and, for snapshots,
+        'SnapshotIdentifier'; raises ValueError if nothing qualifies.
+        """
+        if source not in SOURCES:
+            raise ValueError("Restore source must be one of %s, got %r." % (', '.join(SOURCES), source))
+        when = parse_time(when)
+        if source in (AUTO, PITR) and self.window and self.window[0] <= when <= self.window[1]:
+            return {'Source': PITR, 'Time': when}
+        if source in (AUTO, SNAPSHOT):
+            found = self.snapshot_before(when)
+            if found:
+                return {'Source': SNAPSHOT, 'Time': found[0], 'SnapshotIdentifier': found[1]}
+        raise ValueError("No %s recovery point of %s %s at or before %s." %
+                         ('snapshot or point-in-time' if source == AUTO else source, self.kind,
+                          self.source_id, when.isoformat()))
+
+    def to_dict(self):
+        return {
+            'Version': CACHE_VERSION,
+            'Kind': self.kind,
+            'SourceId': self.source_id,
+            'Prefix': self.prefix,
+            'Engine': self.engine,
+            'BuiltAt': self.built_at,
+            'Window': [moment.isoformat() for moment in self.window] if self.window else None,
+            'Snapshots': [[created.isoformat(), identifier] for created, identifier in self.snapshots],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        window = tuple(parse_time(moment) for moment in data['Window']) if data.get('Window') else None
+        return cls(data['Kind'], data['SourceId'], data['Prefix'], data['Snapshots'], window,
+                   data.get('Engine'), data['BuiltAt'])
+
+    def save(self, path):
+        """Write the index to path atomically."""
+        directory = os.path.dirname(os.path.abspath(path))
+        handle, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(handle, 'w') as cache:
+            json.dump(self.to_dict(), cache)
+        os.replace(temporary, path)
+
+
+def cache_path(kind, source_id, directory=None):
+    """Default cache file of one source's timeline."""
+    return os.path.join(directory or tempfile.gettempdir(), 'rds-timeline-%s-%s.json' % (kind, source_id))
+
+
+def load(path, kind, source_id, prefix, ttl=DEFAULT_CACHE_TTL, clock=time.time):
+    """The cached timeline at path if it matches the source and is younger than ttl seconds, else None."""
+    try:
+        with open(path) as cache:
+            data = json.load(cache)
+    except (IOError, OSError, ValueError):
+        return None
+    if data.get('Version') != CACHE_VERSION or \
+            (data.get('Kind'), data.get('SourceId'), data.get('Prefix')) != (kind, source_id, prefix):
+        return None
+    if clock() - data.get('BuiltAt', 0) > ttl:
+        return None
+    return Timeline.from_dict(data)
+
+
+def get_timeline(kind, source_id, prefix, client=None, path=None, ttl=DEFAULT_CACHE_TTL, clock=time.time,
+                 when=None):
+    """
+    The timeline of source_id from the local cache (path, default
+    cache_path()) when fresh, otherwise built from the API and cached.
+    If when lies past the cached restore window, the window is looked up
+    again: point-in-time restore may cover it by now.
+    """
+    path = path or cache_path(kind, source_id)
+    cached = load(path, kind, source_id, prefix, ttl, clock)
+    if cached:
+        logger.info("Using cached timeline of %s %s (%d snapshots)", kind, source_id, len(cached.snapshots))
+        if when is not None and (not cached.window or parse_time(when) > cached.window[1]):
+            cached.refresh_window(client)
+            logger.info("Refreshed restore window of %s %s: %s", kind, source_id,
+                        cached.window and ' - '.join(moment.isoformat() for moment in cached.window))
+            try:
+                cached.save(path)
+            except (IOError, OSError) as error:
+                logger.warning("Could not cache timeline at %s: %s", path, error)
+        return cached
+    index = Timeline.build(kind, source_id, prefix, client, clock)
+    logger.info("Built timeline of %s %s: %d snapshots, restore window %s", kind, source_id,
+                len(index.snapshots), index.window and ' - '.join(moment.isoformat() for moment in index.window))
+    try:
+        index.save(path)
+    except (IOError, OSError) as error:
+        logger.warning("Could not cache timeline at %s: %s", path, error)
+    return index
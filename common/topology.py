@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           topology.py
+Author:         Adeel Ahmad
+Description:    In-memory index of RDS instances and their clusters built
+                from one paginated describe sweep, cached across warm
+                invocations.
+"""
+
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
+
+import logging
+import threading
+import time
+from botocore.exceptions import ClientError
+
+from common import utils
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Seconds a sweep stays valid. Topology changes rarely compared to how often
+# a warm Lambda container is reused.
+DEFAULT_TTL = 300
+# Seconds an identifier that could not be found is remembered as missing.
+DEFAULT_NEGATIVE_TTL = 60
+
+NOT_FOUND_CODES = ('DBInstanceNotFound', 'DBInstanceNotFoundFault', 'DBClusterNotFoundFault')
+
+
+def instance_record(instance):
+    """
+    Project a describe_db_instances entry onto the fields the index keeps.
+    """
+    return {
+        'DBInstanceIdentifier': instance['DBInstanceIdentifier'],
+        'DBClusterIdentifier': instance.get('DBClusterIdentifier'),
+        'Engine': instance.get('Engine'),
+        'Status': instance.get('DBInstanceStatus'),
+        'Arn': instance.get('DBInstanceArn'),
+        'Tags': dict((tag.get('Key'), tag.get('Value')) for tag in instance.get('TagList', [])),
+    }
+
+
+class TopologyIndex(object):
+    """
+    Map of instance -> cluster, engine, status and ARN.
+    A full refresh costs a few describe pages regardless of fleet size;
+    single misses fall back to one targeted describe call and are
+    negatively cached so unknown identifiers do not hammer the API.
+    Every record expires ttl seconds after it was fetched.
+    """
+
+    def __init__(self, client=None, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL, clock=time.time):
+        self._client = client
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._instances = {}
+        self._fetched = {}
+        self._missing = {}
+        self._loaded_at = None
+
+    @property
+    def client(self):
+        """RDS client used for sweeps, defaults to the shared one in common.utils."""
+        return self._client or utils.RDS
+
+    def is_fresh(self):
+        """True while the last full sweep is younger than the TTL."""
+        return self._loaded_at is not None and self._clock() - self._loaded_at < self.ttl
+
+    def refresh(self):
+        """
+        Rebuild the index from one paginated sweep of describe_db_instances.
+        Every instance entry names its cluster, so no cluster sweep is needed.
+        """
+        instances = {}
+        for page in self.client.get_paginator('describe_db_instances').paginate():
+            for instance in page.get('DBInstances', []):
+                instances[instance['DBInstanceIdentifier']] = instance_record(instance)
+        with self._lock:
+            self._loaded_at = self._clock()
+            self._instances = instances
+            self._fetched = dict.fromkeys(instances, self._loaded_at)
+            self._missing = {}
+        logger.info("Topology index refreshed: %d instance(s)", len(instances))
+
+    def invalidate(self, identifier=None):
+        """
+        Drop one identifier or, without an argument, the whole index so
+        the next lookup sweeps again.
+        """
+        with self._lock:
+            if identifier is None:
+                self._instances = {}
+                self._fetched = {}
+                self._missing = {}
+                self._loaded_at = None
+                return
+            self._instances.pop(identifier, None)
+            self._fetched.pop(identifier, None)
+            self._missing.pop(identifier, None)
+
+    def _is_missing(self, instanceid):
+        missing_since = self._missing.get(instanceid)
+        return missing_since is not None and self._clock() - missing_since < self.negative_ttl
+
+    def lookup(self, instanceid):
+        """
+        Return the cached record for instanceid, or None if it does not exist.
+        Uses one targeted describe call when the identifier is not indexed
+        or its record is older than the TTL.
+        """
+        with self._lock:
+            if instanceid in self._instances and self._clock() - self._fetched[instanceid] < self.ttl:
+                return self._instances[instanceid]
+            if self._is_missing(instanceid):
+                return None
+        try:
+            response = self.client.describe_db_instances(DBInstanceIdentifier=instanceid)
+            instances = response.get('DBInstances', [])
+        except ClientError as error:
+            if error.response.get('Error', {}).get('Code') not in NOT_FOUND_CODES:
+                raise
+            instances = []
+        with self._lock:
+            if not instances:
+                self._instances.pop(instanceid, None)
+                self._fetched.pop(instanceid, None)
+                self._missing[instanceid] = self._clock()
+                return None
+            record = instance_record(instances[0])
+            self._instances[instanceid] = record
+            self._fetched[instanceid] = self._clock()
+            return record
+
+    def lookup_many(self, instanceids):
+        """
+        Resolve many identifiers at once. A stale index is refreshed with
+        one sweep first, identifiers still absent afterwards are negatively
+        cached. Returns a dict of instanceid -> record or None.
+        """
+        instanceids = list(instanceids)
+        if instanceids and not self.is_fresh():
+            self.refresh()
+        now = self._clock()
+        results = {}
+        with self._lock:
+            for instanceid in instanceids:
+                record = self._instances.get(instanceid)
+                if record is None:
+                    self._missing.setdefault(instanceid, now)
+                results[instanceid] = record
+        return results
+
+    def cluster_of(self, instanceid):
+        """
+        Same contract as common.utils.query_db_cluster: DBClusterIdentifier
+        if clustered, otherwise False, also when the lookup fails.
+        """
+        try:
+            record = self.lookup(instanceid)
+        except ClientError as error:
+            logger.warning("Could not find DBClusterIdentifier for %s or API error: %s", instanceid, error)
+            return False
+        return (record or {}).get('DBClusterIdentifier') or False
+
+    def instances(self):
+        """All indexed instance records, refreshing the index if it is stale."""
+        if not self.is_fresh():
+            self.refresh()
+        with self._lock:
+            return list(self._instances.values())
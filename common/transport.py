@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           transport.py
+Author:         Adeel Ahmad
+Description:    Pooled, retrying HTTP(S) transport for CloudFormation
+                custom resource responses.
+"""
+
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
+
+import logging
+import random
+import threading
+import time
+try:
+    import httplib as http_client
+    from urlparse import urlsplit
+except ImportError:
+    import http.client as http_client
+    from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 15
+DEFAULT_RETRIES = 4
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 8
+
+# Worth retrying: throttling and server side errors from S3.
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+class ResponseTransport(object):
+    """
+    Keeps idle keep-alive connections per host, so many responses to the
+    same pre-signed S3 endpoint reuse one TCP/TLS session. Every attempt
+    has explicit connect and read timeouts; retryable failures back off
+    exponentially (with jitter) up to `retries` extra attempts.
+    """
+
+    def __init__(self, connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                 retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, max_backoff=DEFAULT_MAX_BACKOFF,
+                 sleep=time.sleep, observer=None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._sleep = sleep
+        # observer(status, seconds) is told about every attempt, status is
+        # None when no response was received.
+        self._observer = observer
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _checkout(self, scheme, netloc):
+        with self._lock:
+            idle = self._idle.get((scheme, netloc))
+            if idle:
+                return idle.pop()
+        connection_class = http_client.HTTPSConnection if scheme == 'https' else http_client.HTTPConnection
+        connection = connection_class(netloc, timeout=self.connect_timeout)
+        connection.connect()
+        # The connect timeout only covers the handshake, reads get their own
+        connection.sock.settimeout(self.read_timeout)
+        return connection
+
+    def _checkin(self, scheme, netloc, connection):
+        with self._lock:
+            self._idle.setdefault((scheme, netloc), []).append(connection)
+
+    def close(self):
+        """Close every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def delay(self, attempt):
+        """Exponential backoff with full jitter for the given retry attempt."""
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def put(self, url, body, headers=None):
+        """
+        PUT body to url. Returns the final HTTP status code, or None if no
+        attempt got a response at all.
+        """
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        status = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._sleep(self.delay(attempt - 1))
+            start = time.time()
+            connection = None
+            try:
+                connection = self._checkout(parts.scheme, parts.netloc)
+                connection.request('PUT', path, body=body, headers=headers or {})
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (http_client.HTTPException, OSError) as exc:
+                if connection is not None:
+                    connection.close()
+                logger.warning("Response attempt %d to %s failed after %.0f ms: %s",
+                               attempt + 1, parts.netloc, (time.time() - start) * 1000, exc)
+                if self._observer:
+                    self._observer(None, time.time() - start)
+                continue
+            logger.info("Response attempt %d to %s: HTTP %s in %.0f ms",
+                        attempt + 1, parts.netloc, status, (time.time() - start) * 1000)
+            if self._observer:
+                self._observer(status, time.time() - start)
+            if response.will_close:
+                connection.close()
+            else:
+                self._checkin(parts.scheme, parts.netloc, connection)
+            if status not in RETRYABLE_STATUSES:
+                return status
+        return status
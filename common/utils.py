@@ -6,14 +6,17 @@ Author:         Adeel Ahmad (Refactored by AI)
 Description:    Common utility functions for RDS operations.
 """
 
-__version__ = "1.0.0"
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
 
-from __future__ import absolute_import, division,         print_function, unicode_literals
+__version__ = "1.0.0"
 
 import logging # Added
-import boto3
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from botocore.exceptions import ClientError # Added for completeness, though not in original snippet directly
 
+from common import clients, profiling
+
 # Logger Setup
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -22,18 +25,22 @@ if not logging.getLogger().handlers: # Avoid adding multiple handlers
     ch.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
     logger.addHandler(ch)
 
-# It's generally better to create client when needed or pass it,
-# but to match original structure closely for now:
-RDS = boto3.client('rds')
+# Shared client, constructed on first use (see common.clients).
+RDS = clients.LazyClient('rds')
+
+# Upper bound for worker pools used by fleet-wide operations. Kept small by
+# default because RDS control-plane APIs are throttled per account.
+DEFAULT_MAX_WORKERS = 10
 
-def query_db_cluster(instanceid):
+@profiling.PROFILER.entry_point('query_db_cluster')
+def query_db_cluster(instanceid, client=None):
     """
     Querying whether DB is Clustered or not.
-    Accepts DBInstanceIdentifier.
+    Accepts DBInstanceIdentifier and optionally the RDS client to use.
     Returns DBClusterIdentifier if clustered, otherwise False.
     """
     try:
-        db_instance = RDS.describe_db_instances(
+        db_instance = (client or RDS).describe_db_instances(
             DBInstanceIdentifier=instanceid
             )
         return db_instance['DBInstances'][0]['DBClusterIdentifier']
@@ -41,6 +48,29 @@ def query_db_cluster(instanceid):
         logger.warning("Could not find DBClusterIdentifier for %s or API error: %s", instanceid, e, exc_info=True)
         return False
 
+
+def map_concurrently(func, items, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Run func over items through a bounded thread pool.
+    Returns a dict of item -> (result, None) or (None, exception),
+    so one failing item never hides the outcome of the others.
+    """
+    items = list(items)
+    results = {}
+    if not items:
+        return results
+    workers = max(1, min(int(max_workers), len(items)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = dict((pool.submit(func, item), item) for item in items)
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                results[item] = (future.result(), None)
+            except Exception as exc: # pylint: disable=broad-except
+                logger.error("Concurrent task for %s failed: %s", item, exc)
+                results[item] = (None, exc)
+    return results
+
 if __name__ == "__main__":
     # Example usage or tests, can be expanded
     # This part is optional for the subtask, focus on the function movement
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           waiter.py
+Author:         Adeel Ahmad
+Description:    Wait for snapshots to become available with adaptive polling
+                and batched status checks.
+"""
+
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
+
+import logging
+import time
+
+from common import utils
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_MIN_DELAY = 5
+DEFAULT_MAX_DELAY = 60
+# Stop waiting this long before the Lambda deadline so there is still time
+# to respond to CloudFormation.
+DEFAULT_MARGIN_MS = 15000
+# Snapshot ids per Filters value list in one describe call.
+FILTER_BATCH = 100
+
+AVAILABLE = 'available'
+TERMINAL_STATUSES = ('available', 'failed', 'deleted', 'incompatible-restore', 'incompatible-parameters')
+
+_DESCRIBE = {
+    'instance': ('describe_db_snapshots', 'db-snapshot-id', 'DBSnapshots', 'DBSnapshotIdentifier'),
+    'cluster': ('describe_db_cluster_snapshots', 'db-cluster-snapshot-id',
+                'DBClusterSnapshots', 'DBClusterSnapshotIdentifier'),
+}
+
+
+def describe_snapshot_status(snapshots, client=None):
+    """
+    Look up many snapshots with one filtered describe call per kind
+    (per FILTER_BATCH ids). snapshots is a list of (kind, identifier).
+    Returns a dict of (kind, identifier) -> (Status, PercentProgress);
+    snapshots that no longer exist are absent.
+    """
+    client = client or utils.RDS
+    statuses = {}
+    for kind, (operation, filter_name, result_key, id_key) in _DESCRIBE.items():
+        identifiers = sorted(set(identifier for snapshot_kind, identifier in snapshots if snapshot_kind == kind))
+        for start in range(0, len(identifiers), FILTER_BATCH):
+            batch = identifiers[start:start + FILTER_BATCH]
+            pages = client.get_paginator(operation).paginate(
+                Filters=[{'Name': filter_name, 'Values': batch}])
+            for page in pages:
+                for snapshot in page.get(result_key, []):
+                    statuses[(kind, snapshot[id_key])] = (snapshot.get('Status'),
+                                                          snapshot.get('PercentProgress', 0))
+    return statuses
+
+
+def next_delay(delay, progress, min_delay=DEFAULT_MIN_DELAY, max_delay=DEFAULT_MAX_DELAY):
+    """
+    Adaptive backoff: keep polling quickly while snapshots advance by 10
+    points or more per poll, back off by 1.5x as progress slows and
+    double the delay when nothing moved at all.
+    """
+    if progress >= 10:
+        factor = 1.0
+    elif progress > 0:
+        factor = 1.5
+    else:
+        factor = 2.0
+    return max(min_delay, min(max_delay, delay * factor))
+
+
+def wait_for_snapshots(snapshots, client=None, remaining_ms=None, min_delay=DEFAULT_MIN_DELAY,
+                       max_delay=DEFAULT_MAX_DELAY, margin_ms=DEFAULT_MARGIN_MS, sleep=time.sleep):
+    """
+    Poll until every (kind, identifier) in snapshots reaches a terminal
+    status, or until the next sleep would run into margin_ms before the
+    deadline reported by remaining_ms() (e.g. context.get_remaining_time_in_millis).
+    Returns a dict of (kind, identifier) -> last seen status ('missing' if
+    the snapshot could not be found).
+    """
+    pending = set(snapshots)
+    results = {}
+    progress = dict((snapshot, 0) for snapshot in pending)
+    delay = min_delay
+    while pending:
+        statuses = describe_snapshot_status(list(pending), client)
+        advanced = []
+        for snapshot in sorted(pending):
+            status, percent = statuses.get(snapshot, ('missing', 0))
+            results[snapshot] = status
+            advanced.append((percent or 0) - progress[snapshot])
+            progress[snapshot] = percent or 0
+            logger.info("Snapshot %s (%s): %s, %s%%", snapshot[1], snapshot[0], status, percent)
+            if status in TERMINAL_STATUSES or status == 'missing':
+                pending.discard(snapshot)
+        if not pending:
+            break
+        delay = next_delay(delay, sum(advanced) / len(advanced), min_delay, max_delay)
+        if remaining_ms is not None and remaining_ms() - margin_ms < delay * 1000:
+            logger.warning("Stopping wait with %d snapshot(s) pending: time budget exhausted", len(pending))
+            break
+        sleep(delay)
+    return results
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           watchdog.py
+Author:         Adeel Ahmad
+Description:    Exactly one CloudFormation response per invocation, sent as
+                FAILED shortly before the Lambda deadline if the handler has
+                not responded by then.
+"""
+
+from __future__ import absolute_import, division, \
+        print_function, unicode_literals
+
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Respond this long before the deadline, enough for one response attempt.
+# Kept below the waiter's margin and the fleet time reserve, so those wind
+# down on their own first.
+DEFAULT_MARGIN_MS = 10000
+FAILED = "FAILED"
+# Short timeouts (Lambda's default is 3 s) keep most of their time for the
+# handler: the margin is at most this fraction of the remaining time.
+MAX_MARGIN_FRACTION = 0.25
+# Innermost frames of the handler thread reported on a timeout
+STACK_DEPTH = 3
+
+
+class Watchdog(object):
+    """
+    Guards the response of one invocation at a time. start() arms a timer
+    from the context's remaining time; respond() forwards only the first
+    response to respond_func(event, context, status, **kwargs) and drops
+    the others; stop() disarms the timer and responds FAILED if nothing was
+    sent and the work was not handed over.
+    """
+
+    def __init__(self, respond_func, margin_ms=DEFAULT_MARGIN_MS, timer=threading.Timer, clock=time.monotonic,
+                 observer=None):
+        self._respond_func = respond_func
+        self._observer = observer
+        self.margin_ms = margin_ms
+        self._timer_class = timer
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._timer = None
+        self._event = self._context = None
+        self._thread = None
+        self._started = None
+        self.phase = None
+        self.armed = False
+        self.responded = False
+        self.handed_over = False
+
+    def start(self, event, context):
+        """Arm for a new invocation."""
+        self.stop_timer()
+        with self._lock:
+            self._event, self._context = event, context
+            self._thread = threading.get_ident()
+            self._started = self._clock()
+            self.phase = 'start'
+            self.armed = True
+            self.responded = self.handed_over = False
+        remaining = context.get_remaining_time_in_millis()
+        delay = max(0, remaining - min(self.margin_ms, remaining * MAX_MARGIN_FRACTION)) / 1000
+        self._timer = self._timer_class(delay, self.expire)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def enter(self, phase):
+        """Name what the handler is doing, reported if the deadline hits."""
+        self.phase = phase
+        if self._observer is not None:
+            self._observer(phase)
+
+    def hand_over(self):
+        """
+        Another invocation will respond: no response is owed by this one.
+        Returns False, handing nothing over, if this invocation already
+        responded, e.g. the deadline hit first.
+        """
+        with self._lock:
+            if self.armed and self.responded:
+                return False
+            self.handed_over = True
+            return True
+
+    def respond(self, event, context, response_status, **kwargs):
+        """
+        Send the invocation's response unless one was already sent, returns
+        the sender's result or False. Passes straight through while disarmed.
+        """
+        with self._lock:
+            if self.armed and self.responded:
+                logger.warning("Dropping %s response, this invocation already responded", response_status)
+                return False
+            self.responded = True
+        return self._respond_func(event, context, response_status, **kwargs)
+
+    def diagnostics(self):
+        """Phase, elapsed time and innermost frames of the handler thread."""
+        frame = sys._current_frames().get(self._thread) # pylint: disable=protected-access
+        stack = traceback.extract_stack(frame)[-STACK_DEPTH:] if frame is not None else []
+        return {
+            'Phase': self.phase,
+            'ElapsedSeconds': round(self._clock() - self._started, 1),
+            'Stack': ['%s:%d %s' % (os.path.basename(entry.filename), entry.lineno, entry.name)
+                      for entry in reversed(stack)],
+        }
+
+    def expire(self):
+        """Timer callback: respond FAILED with diagnostics if still owed."""
+        # Claimed under the lock, so a concurrent hand_over() either wins or sees the response
+        with self._lock:
+            if not self.armed or self.responded or self.handed_over:
+                return
+            self.responded = True
+        data = self.diagnostics()
+        reason = "Timed out during %s after %.1f s, responding before the Lambda deadline." % (
+            data['Phase'], data['ElapsedSeconds'])
+        logger.error("%s Handler at: %s", reason, '; '.join(data['Stack']))
+        self._respond_func(self._event, self._context, FAILED, reason=reason, response_data=data)
+
+    def stop_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def stop(self, error=None):
+        """
+        Disarm at the end of the invocation. If no response was sent, and
+        the work was not handed over, respond FAILED now, naming error.
+        """
+        self.stop_timer()
+        if self.armed and not (self.responded or self.handed_over):
+            if error is not None:
+                reason = "Unexpected %s during %s: %s" % (type(error).__name__, self.phase, error)
+            else:
+                reason = "Handler finished during %s without responding." % self.phase
+            logger.error(reason)
+            self.respond(self._event, self._context, FAILED, reason=reason, response_data={'Phase': self.phase})
+        self.armed = False
@@ -14,19 +14,18 @@ from __future__ import absolute_import, division, \
 import datetime
 import logging # Added
 import os
+import threading
+import time
+# Module load, reported as the 'import' span of a profiled cold start
+LOAD_STARTED = time.perf_counter()
 from botocore.exceptions import ClientError
-import boto3
 try:
     import json
 except ImportError:
     import simplejson as json
-try:
-    from urllib2 import HTTPError, build_opener, HTTPHandler, Request
-except ImportError:
-    from urllib.error import HTTPError
-    from urllib.request import build_opener, HTTPHandler, Request
 
-from common.utils import query_db_cluster
+from common import checkpoint, clients, dedupe, events, export, group, hub, metrics, naming, profiling, ratelimit, replication, retention, \
+        serialization, topology, transport, utils, waiter, watchdog
 
 # Lambda specific logging setup
 logger = logging.getLogger()
@@ -34,10 +33,97 @@ logger.setLevel(logging.INFO)
 
 SUCCESS = "SUCCESS"
 FAILED = "FAILED"
-RDS = boto3.client('rds')
+RDS = clients.LazyClient('rds')
+LAMBDA = clients.LazyClient('lambda')
 DBSNAPSHOTID = os.environ.get('DBSnapshotIdentifier') # Expected to be a prefix for the snapshot identifier
 DBINSTANCEID = os.environ.get('DBInstanceIdentifier')
-NOW = datetime.datetime.now()
+# Fleet mode: comma separated identifiers and/or a tag filter selecting many targets
+FLEET_INSTANCEIDS = os.environ.get('DBInstanceIdentifiers')
+FLEET_CLUSTERIDS = os.environ.get('DBClusterIdentifiers')
+FLEET_TAG_KEY = os.environ.get('FleetTagKey')
+FLEET_TAG_VALUE = os.environ.get('FleetTagValue')
+# Hub mode: run the fleet in each of these accounts (ids or role ARNs) and regions
+HUB_ACCOUNTS = os.environ.get('HubAccounts')
+HUB_ROLE_NAME = os.environ.get('HubRoleName', hub.DEFAULT_ROLE_NAME)
+HUB_REGIONS = os.environ.get('HubRegions')
+HUB_MAX_WORKERS = int(os.environ.get('HubMaxWorkers', utils.DEFAULT_MAX_WORKERS))
+# (account, region) -> (topology index, snapshot catalog) of hub members
+HUB_CACHES = {}
+HUB_LOCK = threading.Lock()
+# Snapshot the fleet as one consistent group with this name
+SNAPSHOT_GROUP = os.environ.get('SnapshotGroup')
+FLEET_MAX_WORKERS = int(os.environ.get('FleetMaxWorkers', utils.DEFAULT_MAX_WORKERS))
+# No new target is started with less time left, the rest continue in a new invocation
+TIME_RESERVE_MS = int(os.environ.get('TimeReserveMillis', checkpoint.DEFAULT_RESERVE_MS))
+# Module level so the index survives warm invocations of the same container.
+TOPOLOGY = topology.TopologyIndex(ttl=int(os.environ.get('TopologyCacheTTL', topology.DEFAULT_TTL)))
+# Snapshot names: one per day (default), hour or CloudFormation request
+SNAPSHOT_NAME_GRANULARITY = os.environ.get('SnapshotNameGranularity', naming.DAILY).lower()
+# Cached snapshot listings, shared by duplicate checks, copies and pruning
+SNAPSHOTS = naming.SnapshotCatalog(ttl=int(os.environ.get('SnapshotCacheTTL', naming.DEFAULT_TTL)))
+# Retention: keep the newest snapshot of the last N days, ISO weeks and months.
+# Pruning is enabled as soon as any of the three is set.
+RETAIN_DAILY = int(os.environ.get('RetainDaily', 0))
+RETAIN_WEEKLY = int(os.environ.get('RetainWeekly', 0))
+RETAIN_MONTHLY = int(os.environ.get('RetainMonthly', 0))
+PRUNE_MAX_WORKERS = int(os.environ.get('PruneMaxWorkers', utils.DEFAULT_MAX_WORKERS))
+PRUNE_RATE = float(os.environ.get('PruneRatePerSecond', retention.DEFAULT_DELETE_RATE))
+# Optionally hold the CloudFormation response until snapshots are 'available'
+WAIT_FOR_AVAILABLE = os.environ.get('WaitForAvailable', 'false').lower() == 'true'
+WAIT_MIN_DELAY = float(os.environ.get('WaitMinDelay', waiter.DEFAULT_MIN_DELAY))
+WAIT_MAX_DELAY = float(os.environ.get('WaitMaxDelay', waiter.DEFAULT_MAX_DELAY))
+# Disaster recovery: copy available snapshots into these regions after each run
+COPY_REGIONS = os.environ.get('CopyRegions')
+COPY_MAX_CONCURRENT = int(os.environ.get('CopyMaxConcurrent', replication.DEFAULT_MAX_CONCURRENT_COPIES))
+COPY_KMS_KEY_IDS = os.environ.get('CopyKmsKeyIds') # region=key-arn pairs, comma separated
+# Analytics: export available snapshots to S3 as Parquet after each run
+EXPORT_BUCKET = os.environ.get('ExportBucket')
+EXPORT_ROLE_ARN = os.environ.get('ExportRoleArn')
+EXPORT_KMS_KEY_ID = os.environ.get('ExportKmsKeyId')
+EXPORT_S3_PREFIX = os.environ.get('ExportS3Prefix')
+EXPORT_MAX_CONCURRENT = int(os.environ.get('ExportMaxConcurrent', export.DEFAULT_MAX_CONCURRENT_EXPORTS))
+EXPORT_MAX_AGE_HOURS = float(os.environ.get('ExportMaxAgeHours', 24))
+# Epoch seconds of this container's last look at the export tasks: only
+# exports finished since then are measured, none twice by a warm container
+EXPORTS_CHECKED_AT = None
+# Event mode: repeated EventBridge deliveries of one event are dropped, per
+# container and, with EventDedupeTable, across containers
+EVENT_DEDUPE = dedupe.DedupeCache(ttl=int(os.environ.get('EventDedupeTTL', dedupe.DEFAULT_TTL)),
+                                  table=os.environ.get('EventDedupeTable'))
+# EMF metrics on stdout, off by default. When off no client hooks are installed.
+METRICS = metrics.Metrics(
+    namespace=os.environ.get('MetricsNamespace', metrics.DEFAULT_NAMESPACE),
+    enabled=os.environ.get('EnableMetrics', 'false').lower() == 'true',
+    dimensions={'FunctionName': os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'rds-backup')})
+# Every RDS call waits for a token of its read or write budget, the rates
+# back off on throttling and recover on success (calls per second)
+RATE_LIMITER = ratelimit.AdaptiveRateLimiter(
+    read_rate=float(os.environ.get('RDSReadRate', ratelimit.DEFAULT_READ_RATE)),
+    write_rate=float(os.environ.get('RDSWriteRate', ratelimit.DEFAULT_WRITE_RATE)),
+    min_rate=float(os.environ.get('RDSMinRate', ratelimit.DEFAULT_MIN_RATE)))
+ratelimit.install(RATE_LIMITER, METRICS, os.environ.get('RDSRateLimit', 'true').lower() == 'true')
+# Snapshot groups measure their skew from the moment each request is sent
+clients.add_client_hook(group.instrument)
+# Profile=true (or cpu,memory,spans) profiles the handler:
+# summary in the log, cProfile stats in ProfileDir. Nothing runs when unset.
+PROFILER = profiling.PROFILER
+PROFILER.configure(os.environ.get('Profile'), os.environ.get('ProfileDir', profiling.DEFAULT_OUTPUT_DIR),
+                   int(os.environ.get('ProfileTop', profiling.DEFAULT_TOP)))
+
+
+def observe_response(status, seconds):
+    """Feed every CloudFormation response attempt into the metrics."""
+    METRICS.add('ResponseLatency', seconds * 1000, 'Milliseconds', 'send')
+    if status is None or status >= 300:
+        METRICS.add('ResponseErrors', 1, 'Count', 'send')
+
+
+# One transport per container: keep-alive connections are reused across responses
+TRANSPORT = transport.ResponseTransport(
+    connect_timeout=float(os.environ.get('ResponseConnectTimeout', transport.DEFAULT_CONNECT_TIMEOUT)),
+    read_timeout=float(os.environ.get('ResponseReadTimeout', transport.DEFAULT_READ_TIMEOUT)),
+    retries=int(os.environ.get('ResponseRetries', transport.DEFAULT_RETRIES)),
+    observer=observe_response if METRICS.enabled else None)
 
 
 def send(event, context, response_status, reason= \
@@ -45,8 +131,13 @@ def send(event, context, response_status, reason= \
     """
     building own response function
     """
+    if not event.get('ResponseURL'):
+        # Scheduled (EventBridge) runs have no stack waiting for an answer
+        logger.info("No ResponseURL in the event, not sending the %s response", response_status)
+        return True
     response_data = response_data or {}
-    response_body = json.dumps(
+    # Handles datetimes in botocore responses and enforces the 4 KB limit
+    body = serialization.encode_response(
         {
             'Status': response_status,
             'Reason': reason or "See the details in \
@@ -59,33 +150,690 @@ def send(event, context, response_status, reason= \
             'Data': response_data
         }
     )
+    status = TRANSPORT.put(event['ResponseURL'], body, {
+        'Content-Type': 'application/json; charset=utf-8',
+        'Content-Length': str(len(body))
+        })
+    if status is not None and 200 <= status < 300:
+        logger.info("Status code: %s", status)
+        return True
+    logger.error("Failed executing HTTP request to %s: %s", event['ResponseURL'].split('?')[0], status)
+    return False
+
+
+# Arms on every invocation: responds FAILED before the Lambda deadline, or
+# when the handler exits without responding. send is looked up per call.
+WATCHDOG = watchdog.Watchdog(lambda *args, **kwargs: send(*args, **kwargs),
+                             margin_ms=int(os.environ.get('DeadlineMarginMillis', watchdog.DEFAULT_MARGIN_MS)),
+                             observer=PROFILER.phase if PROFILER.enabled else None)
+
+
+def respond(event, context, response_status, **kwargs):
+    """
+    send() through the watchdog, so each invocation responds exactly once
+    however its handler exits. Takes the same arguments as send().
+    """
+    return WATCHDOG.respond(event, context, response_status, **kwargs)
+
+
+def split_identifiers(value):
+    """
+    Normalise a comma separated string (env var) or a list
+    (ResourceProperties) of identifiers into a list of strings.
+    """
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        values = value
+    else:
+        values = str(value).split(',')
+    return [str(item).strip() for item in values if str(item).strip()]
+
+
+def instances_by_tag(tag_key, tag_value=None, index=None):
+    """
+    Return the DBInstanceIdentifiers carrying tag_key (and tag_value,
+    if given), answered from the cached topology sweep (index, default TOPOLOGY).
+    """
+    instance_ids = []
+    for record in (index or TOPOLOGY).instances():
+        tags = record.get('Tags', {})
+        if tag_key in tags and (tag_value is None or tags[tag_key] == tag_value):
+            instance_ids.append(record['DBInstanceIdentifier'])
+    return instance_ids
+
+
+def resolve_fleet(event, index=None):
+    """
+    Resolve the fleet of snapshot targets for this invocation, in the
+    account of index (default TOPOLOGY).
+    ResourceProperties take precedence over the environment.
+    Returns a sorted list of ('cluster'|'instance', identifier) tuples,
+    empty when fleet mode is not configured.
+    """
+    index = index or TOPOLOGY
+    properties = event.get('ResourceProperties') or {}
+    instance_ids = split_identifiers(properties.get('DBInstanceIdentifiers')) or \
+        split_identifiers(FLEET_INSTANCEIDS)
+    cluster_ids = split_identifiers(properties.get('DBClusterIdentifiers')) or \
+        split_identifiers(FLEET_CLUSTERIDS)
+    tag_key = properties.get('FleetTagKey', FLEET_TAG_KEY)
+    tag_value = properties.get('FleetTagValue', FLEET_TAG_VALUE)
+    if tag_key:
+        instance_ids.extend(instances_by_tag(tag_key, tag_value, index))
+
+    targets = set(('cluster', cluster_id) for cluster_id in cluster_ids)
+    # Instances belonging to a cluster are snapshotted through their cluster,
+    # several members of one cluster therefore collapse into a single target.
+    for instance_id, record in index.lookup_many(set(instance_ids)).items():
+        cluster_id = (record or {}).get('DBClusterIdentifier')
+        if cluster_id:
+            targets.add(('cluster', cluster_id))
+        else:
+            targets.add(('instance', instance_id))
+    return sorted(targets)
+
+
+def create_snapshot(kind, identifier, snapshot_identifier, tags=None, client=None):
+    """
+    Issue create_db_cluster_snapshot or create_db_snapshot for one target
+    through client (default RDS).
+    Returns the raw RDS response, ClientError is left to the caller.
+    """
+    client = client or RDS
+    extra = {'Tags': tags} if tags else {}
+    if kind == 'cluster':
+        logger.info("Attempting to create cluster snapshot for %s", identifier)
+        return client.create_db_cluster_snapshot(
+            DBClusterSnapshotIdentifier=snapshot_identifier,
+            DBClusterIdentifier=identifier,
+            **extra
+            )
+    logger.info("Attempting to create instance snapshot for %s", identifier)
+    return client.create_db_snapshot(
+        DBSnapshotIdentifier=snapshot_identifier,
+        DBInstanceIdentifier=identifier,
+        **extra
+        )
+
+
+def create_snapshot_once(kind, identifier, prefix, snapshot_identifier, tags=None, client=None, catalog=None):
+    """
+    create_snapshot unless snapshot_identifier already exists according to
+    the cached listing of identifier's prefix snapshots, so reruns and
+    retries cost no create call. Returns (response, created); for an
+    existing snapshot the response describes it in create response shape.
+    An existing snapshot that is neither available nor creating raises
+    naming.UnusableSnapshotError. client and catalog default to RDS and
+    SNAPSHOTS, i.e. this account.
+    """
+    client, catalog = client or RDS, catalog or SNAPSHOTS
+    existing = catalog.find(kind, identifier, prefix, snapshot_identifier, client)
+    if existing:
+        logger.info("Snapshot %s of %s already exists (%s), not creating it again",
+                    snapshot_identifier, identifier, existing.get('Status'))
+        return naming.reuse(existing), False
+    return create_new_snapshot(kind, identifier, prefix, snapshot_identifier, tags, client, catalog)
+
 
-    opener = build_opener(HTTPHandler)
-    request = Request(event['ResponseURL'], data=response_body)
-    request.add_header('Content-Type', 'application/json; charset=utf-8') # Changed Content-Type
-    request.add_header('Content-Length', len(response_body))
-    request.get_method = lambda: 'PUT'
+def create_new_snapshot(kind, identifier, prefix, snapshot_identifier, tags=None, client=None, catalog=None):
+    """
+    create_snapshot for a snapshot the cached listing does not know.
+    A snapshot created elsewhere in the meantime is reused, as in
+    create_snapshot_once. Returns (response, created).
+    """
+    client, catalog = client or RDS, catalog or SNAPSHOTS
     try:
-        response = opener.open(request)
-        logger.info("Status code: %s", response.getcode())
-        logger.info("Status message: %s", response.msg)
+        response = create_snapshot(kind, identifier, snapshot_identifier, tags, client)
+    except ClientError as error:
+        if error.response.get('Error', {}).get('Code') not in naming.ALREADY_EXISTS_CODES:
+            raise
+        # Created elsewhere since the listing was cached
+        catalog.invalidate(kind, identifier, prefix)
+        existing = catalog.find(kind, identifier, prefix, snapshot_identifier, client)
+        if not existing:
+            raise
+        return naming.reuse(existing), False
+    # The creation time is only known once listed again; until then the
+    # entry is never pruned and does not count towards retention.
+    catalog.add(kind, identifier, prefix, {'Identifier': snapshot_identifier, 'Kind': kind,
+                                           'CreateTime': None, 'Status': 'creating'})
+    return response, True
+
+
+def wait_for_available(snapshots, context):
+    """
+    Block until the (kind, identifier) snapshots are available or the
+    invocation runs low on time. Returns (kind, identifier) -> status.
+    """
+    WATCHDOG.enter('waiting for snapshots')
+    logger.info("Waiting for %d snapshot(s) to become available", len(snapshots))
+    return waiter.wait_for_snapshots(
+        snapshots, RDS, remaining_ms=context.get_remaining_time_in_millis,
+        min_delay=WAIT_MIN_DELAY, max_delay=WAIT_MAX_DELAY)
+
+
+def snapshot_available(kind, snapshot_identifier, response, event, context):
+    """
+    Single-target wait. Updates the Status in the create response when the
+    snapshot became available; otherwise reports FAILED and returns False.
+    """
+    status = wait_for_available([(kind, snapshot_identifier)], context).get((kind, snapshot_identifier))
+    if status == waiter.AVAILABLE:
+        for key in ('DBSnapshot', 'DBClusterSnapshot'):
+            if key in response:
+                response[key]['Status'] = status
         return True
-    except HTTPError as exc:
-        logger.error("Failed executing HTTP request to %s: %s", request.full_url, exc.code, exc_info=True)
+    reason = "Snapshot %s is '%s', not available." % (snapshot_identifier, status)
+    logger.error(reason)
+    respond(event, context, FAILED, reason=reason, response_data={})
+    return False
+
+
+def list_sources(sources, stage):
+    """
+    Snapshots of (kind, identifier, prefix) sources from the cached listing,
+    listed concurrently. A source that cannot be listed is logged, naming
+    stage, and skipped.
+    """
+    snapshots = []
+
+    def list_source(source):
+        kind, identifier, prefix = source
+        return SNAPSHOTS.snapshots(kind, identifier, prefix, RDS)
+
+    for source, (listed, error) in utils.map_concurrently(list_source, sources, FLEET_MAX_WORKERS).items():
+        if error is not None:
+            logger.error("Could not list snapshots of %s %s for %s: %s", source[0], source[1], stage, error)
+            continue
+        snapshots.extend(listed)
+    return snapshots
+
+
+def replicate_snapshots(sources):
+    """
+    Copy the available snapshots of (kind, identifier, prefix) sources into
+    every region in CopyRegions. Copies that already exist are skipped, so
+    each run also picks up snapshots that were still creating last time.
+    Failures are logged, never raised.
+    """
+    regions = split_identifiers(COPY_REGIONS)
+    if not regions or not sources:
+        return {}
+    snapshots = list_sources(sources, 'copying')
+    kms_key_ids = dict(pair.split('=', 1) for pair in split_identifiers(COPY_KMS_KEY_IDS) if '=' in pair)
+    return replication.copy_snapshots(snapshots, RDS.meta.region_name, regions,
+                                      COPY_MAX_CONCURRENT, kms_key_ids)
+
+
+def export_snapshots(sources):
+    """
+    Start S3 exports of the available snapshots of (kind, identifier,
+    prefix) sources created within ExportMaxAgeHours, within the account's
+    export task limit. Exports that exist are skipped and the rest of the
+    queue is deferred, so each run also picks up snapshots that were
+    still creating, or waiting for a slot, last time. The throughput of
+    exports finished since the last check is recorded as metrics.
+    Failures are logged, never raised.
+    """
+    global EXPORTS_CHECKED_AT
+    if not EXPORT_BUCKET or not sources:
+        return {}
+    missing = [name for name, value in (('ExportRoleArn', EXPORT_ROLE_ARN), ('ExportKmsKeyId', EXPORT_KMS_KEY_ID))
+               if not value]
+    if missing:
+        logger.error("ExportBucket is set without %s, no snapshots are exported", ' and '.join(missing))
+        return {}
+    snapshots = export.select_snapshots(list_sources(sources, 'exporting'), EXPORT_MAX_AGE_HOURS)
+    if not snapshots:
+        return {}
+    try:
+        checked_at = time.time()
+        tasks = export.describe_exports(RDS)
+        results = export.start_exports(snapshots, EXPORT_BUCKET, EXPORT_ROLE_ARN, EXPORT_KMS_KEY_ID,
+                                       EXPORT_S3_PREFIX, EXPORT_MAX_CONCURRENT, RDS, tasks)
+    except ClientError as error:
+        logger.error("Failed to start snapshot exports: %s", error, exc_info=True)
+        return {}
+    # A cold container cannot know what was measured before, it looks back
+    # as far as exports are started
+    since = EXPORTS_CHECKED_AT if EXPORTS_CHECKED_AT is not None else checked_at - EXPORT_MAX_AGE_HOURS * 3600
+    EXPORTS_CHECKED_AT = checked_at
+    task_ids = sorted(set(export.task_identifier(snapshot['Identifier']) for snapshot in snapshots))
+    for task in export.finished_since([tasks[task_id] for task_id in task_ids if task_id in tasks], since):
+        rate = export.throughput(task)
+        if rate['GBPerMinute'] is not None:
+            METRICS.add('ExportThroughput', rate['GBPerMinute'], 'None', 'export')
+    return results
+
+
+def prune_snapshots(sources):
+    """
+    Apply the retention policy to (kind, identifier, prefix) sources.
+    Expired snapshots are selected per source concurrently and deleted
+    together under one rate limit. Failures are logged, never raised,
+    so pruning cannot fail a backup that already succeeded.
+    """
+    if not (RETAIN_DAILY or RETAIN_WEEKLY or RETAIN_MONTHLY) or not sources:
+        return {}
+
+    def expired_for(source):
+        kind, identifier, prefix = source
+        return retention.select_expired(
+            SNAPSHOTS.snapshots(kind, identifier, prefix, RDS),
+            RETAIN_DAILY, RETAIN_WEEKLY, RETAIN_MONTHLY)
+
+    expired = []
+    for source, (selected, error) in utils.map_concurrently(expired_for, sources, FLEET_MAX_WORKERS).items():
+        if error is not None:
+            logger.error("Could not list snapshots of %s %s for pruning: %s", source[0], source[1], error)
+            continue
+        expired.extend(selected)
+    if not expired:
+        logger.info("Retention: nothing to prune")
+        return {}
+    results = retention.delete_snapshots(expired, RDS, PRUNE_MAX_WORKERS, PRUNE_RATE)
+    SNAPSHOTS.discard(identifier for identifier, (_, error) in results.items() if error is None)
+    failed = sum(1 for _, error in results.values() if error is not None)
+    logger.info("Retention: deleted %d snapshot(s), %d failed", len(results) - failed, failed)
+    return results
+
+
+def follow_up(sources):
+    """Copies, exports and retention of (kind, identifier, prefix) sources, after their snapshots."""
+    with PROFILER.span('copies'):
+        replicate_snapshots(sources)
+    with PROFILER.span('exports'):
+        export_snapshots(sources)
+    with PROFILER.span('retention'):
+        prune_snapshots(sources)
+
+
+def snapshot_sources(kind, snapshot_identifier):
+    """
+    The (kind, source, prefix) whose follow-ups a new snapshot affects, as
+    a list: empty unless this function named it (fleet or single mode).
+    """
+    if not DBSNAPSHOTID or not snapshot_identifier.startswith(str(DBSNAPSHOTID)):
+        return []
+    try:
+        if kind == 'cluster':
+            found = [snapshot['DBClusterIdentifier'] for snapshot in RDS.describe_db_cluster_snapshots(
+                DBClusterSnapshotIdentifier=snapshot_identifier).get('DBClusterSnapshots', [])]
+        else:
+            found = [snapshot['DBInstanceIdentifier'] for snapshot in RDS.describe_db_snapshots(
+                DBSnapshotIdentifier=snapshot_identifier).get('DBSnapshots', [])]
+    except ClientError as error:
+        if error.response.get('Error', {}).get('Code') not in events.SNAPSHOT_NOT_FOUND_CODES:
+            raise
+        found = []
+    if not found:
+        logger.info("Snapshot %s no longer exists, nothing to follow up", snapshot_identifier)
+        return []
+    source_id = found[0]
+    fleet_prefix = str(DBSNAPSHOTID) + source_id + "-"
+    return [(kind, source_id, fleet_prefix if snapshot_identifier.startswith(fleet_prefix) else str(DBSNAPSHOTID))]
+
+
+def backup_sources(kind, identifier):
+    """The (kind, source, prefix) of a database that finished a backup: its fleet and single mode names."""
+    if not DBSNAPSHOTID:
+        return []
+    sources = [(kind, identifier, str(DBSNAPSHOTID) + identifier + "-")]
+    if identifier == DBINSTANCEID:
+        sources.append((kind, identifier, str(DBSNAPSHOTID)))
+    return sources
+
+
+def event_handler(event, context):
+    """
+    Run the follow-ups of one RDS EventBridge event right away: copies,
+    exports and retention once a snapshot of this function is created,
+    instead of at the next scheduled run. Duplicate deliveries are dropped.
+    A failed event is released from the dedupe cache and re-raised, so the
+    asynchronous retry runs it again. Returns a summary; no CloudFormation
+    response is involved.
+    """
+    routed = events.route(event)
+    if routed is None:
+        return {'Action': None}
+    event_id = routed['EventId']
+    if event_id and EVENT_DEDUPE.seen(event_id):
+        logger.info("Dropping duplicate delivery of event %s (%s)", event_id, routed['Action'])
+        METRICS.add('EventDuplicates', 1, 'Count', 'events')
+        return dict(routed, Duplicate=True)
+    logger.info("Event %s: %s of %s %s", event_id, routed['Action'], routed['Kind'], routed['Identifier'])
+    try:
+        if routed['Action'] == events.SNAPSHOT_CREATED:
+            sources = snapshot_sources(routed['Kind'], routed['Identifier'])
+        else:
+            sources = backup_sources(routed['Kind'], routed['Identifier'])
+        # The cached listings still show these snapshots as creating
+        for kind, identifier, prefix in sources:
+            SNAPSHOTS.invalidate(kind, identifier, prefix)
+        follow_up(sources)
+    except Exception:
+        if event_id:
+            EVENT_DEDUPE.release(event_id)
+        raise
+    METRICS.add('Events', 1, 'Count', 'events')
+    return dict(routed, Sources=len(sources))
+
+
+def account_caches(account_id, region, client):
+    """Topology index and snapshot catalog of one hub member, kept across warm invocations."""
+    key = (account_id, region)
+    with HUB_LOCK:
+        if key not in HUB_CACHES:
+            HUB_CACHES[key] = (topology.TopologyIndex(client, ttl=TOPOLOGY.ttl),
+                               naming.SnapshotCatalog(ttl=SNAPSHOTS.ttl))
+        return HUB_CACHES[key]
+
+
+def hub_handler(event, context, accounts, suffix):
+    """
+    Run the fleet in every hub account and region concurrently, through the
+    role assumed in each account. Targets are resolved per account from the
+    same fleet definition. The result map is keyed '<account>/<region>/<target>';
+    an account that cannot be reached fails as '<account>/<region>'.
+    """
+    properties = event.get('ResourceProperties') or {}
+    regions = split_identifiers(properties.get('HubRegions')) or split_identifiers(HUB_REGIONS) or [None]
+
+    def backup_account(account_id, region, client):
+        index, catalog = account_caches(account_id, region, client)
+        targets = resolve_fleet(event, index)
+
+        def snapshot_target(target):
+            kind, identifier = target
+            prefix = str(DBSNAPSHOTID) + identifier + "-"
+            _, created = create_snapshot_once(kind, identifier, prefix, prefix + suffix, client=client,
+                                              catalog=catalog)
+            return created
+
+        return client.meta.region_name, utils.map_concurrently(snapshot_target, targets, FLEET_MAX_WORKERS)
+
+    WATCHDOG.enter('hub fan-out')
+    results = {}
+    swept = hub.fan_out(backup_account, accounts, regions, HUB_MAX_WORKERS)
+    for (account_id, region), (outcome, error) in sorted(swept.items(),
+                                                         key=lambda item: (item[0][0], item[0][1] or '')):
+        if error is not None:
+            region = region or 'default'
+            logger.error("Hub account %s in %s failed: %s", account_id, region, error)
+            results['%s/%s' % (account_id, region)] = {'Status': FAILED, 'Reason': str(error)}
+            continue
+        region, outcomes = outcome
+        for (kind, identifier), (created, failure) in sorted(outcomes.items()):
+            key = '%s/%s/%s' % (account_id, region, identifier)
+            if failure is None:
+                results[key] = {'Status': SUCCESS, 'Type': kind,
+                                'SnapshotIdentifier': str(DBSNAPSHOTID) + identifier + "-" + suffix}
+                if not created:
+                    results[key]['Existing'] = True
+            else:
+                results[key] = {'Status': FAILED, 'Type': kind, 'Reason': str(failure)}
+    failed = sum(1 for result in results.values() if result['Status'] == FAILED)
+    if failed:
+        reason = "%d hub snapshot(s) or account(s) failed across %d account(s)." % (failed, len(accounts))
+        logger.error(reason)
+        respond(event, context, FAILED, reason=reason, response_data=results)
+    else:
+        respond(event, context, SUCCESS, reason="Hub snapshots created in %d account(s)." % len(accounts),
+                response_data=results)
+    return results
+
+
+def group_handler(event, context, targets, suffix, name):
+    """
+    Snapshot targets as one consistent group: existing snapshots are looked
+    up first, then every remaining create call is released at the same
+    instant and tagged with the shared group id. The response carries the
+    per-target results, the group id and the measured skew.
+    """
+    group_id = group.group_id(name, suffix)
+    logger.info("Group mode: snapshotting %d target(s) as group %s", len(targets), group_id)
+    WATCHDOG.enter('snapshot group %s' % group_id)
+    results = {}
+    pending = []
+    # Everything but the create calls happens before the release
+    for kind, identifier in targets:
+        prefix = str(DBSNAPSHOTID) + identifier + "-"
+        existing = SNAPSHOTS.find(kind, identifier, prefix, prefix + suffix, RDS)
+        if existing and not naming.reusable(existing):
+            results[identifier] = {'Status': FAILED, 'Type': kind,
+                                   'Reason': "Snapshot %s already exists but is '%s'." % (prefix + suffix,
+                                                                                          existing.get('Status'))}
+        elif existing:
+            results[identifier] = {'Status': SUCCESS, 'Type': kind, 'SnapshotIdentifier': prefix + suffix,
+                                   'Existing': True}
+        else:
+            pending.append((kind, identifier))
+
+    def snapshot_member(target):
+        kind, identifier = target
+        prefix = str(DBSNAPSHOTID) + identifier + "-"
+        # Charged to the write budget instead of waiting for it, a 5/s
+        # budget would otherwise spread a group of 10 over a second
+        with ratelimit.unpaced():
+            return create_new_snapshot(kind, identifier, prefix, prefix + suffix, group.group_tags(group_id))
+
+    outcomes, skew = group.create_simultaneously(snapshot_member, pending)
+    for (kind, identifier), (outcome, error) in outcomes.items():
+        prefix = str(DBSNAPSHOTID) + identifier + "-"
+        if error is None:
+            results[identifier] = {'Status': SUCCESS, 'Type': kind, 'SnapshotIdentifier': prefix + suffix}
+            if not outcome[1]:
+                results[identifier]['Existing'] = True
+        else:
+            results[identifier] = {'Status': FAILED, 'Type': kind, 'Reason': str(error)}
+    METRICS.add('GroupIssueSkew', skew['IssueSkewMs'], 'Milliseconds', 'group')
+    failed = sum(1 for result in results.values() if result['Status'] == FAILED)
+    data = dict(results, GroupId=group_id, **skew)
+    if failed:
+        reason = "%d of %d member(s) of snapshot group %s failed." % (failed, len(targets), group_id)
+        logger.error(reason)
+        respond(event, context, FAILED, reason=reason, response_data=data)
+    else:
+        respond(event, context, SUCCESS, reason="Snapshot group %s created successfully." % group_id,
+                response_data=data)
+        sources = [(result['Type'], identifier, str(DBSNAPSHOTID) + identifier + "-")
+                   for identifier, result in results.items()]
+        follow_up(sources)
+    return data
+
+
+def continue_fleet(event, context, progress):
+    """
+    Hand the targets left over to a fresh asynchronous invocation of this
+    function, carrying progress in the event. Returns True once queued;
+    otherwise reports FAILED to CloudFormation and returns False. A fleet
+    whose invocation already responded (the watchdog's deadline) is not
+    continued, the chained invocation would respond a second time.
+    """
+    if not WATCHDOG.hand_over():
+        logger.error("Not continuing the fleet after %d target(s), this invocation already responded",
+                     len(progress.completed))
         return False
+    try:
+        following = progress.next_event(event)
+        LAMBDA.invoke(FunctionName=context.invoked_function_arn, InvocationType='Event',
+                      Payload=json.dumps(following).encode('utf-8'))
+    except (ClientError, ValueError) as error:
+        logger.error("Could not continue the fleet in a new invocation: %s", error, exc_info=True)
+        respond(event, context, FAILED, reason="Fleet stopped after %d target(s): %s" % (len(progress.completed), error),
+                response_data=fleet_results(progress))
+        return False
+    logger.info("Fleet continues in invocation %d, %d target(s) done so far",
+                progress.invocation + 1, len(progress.completed))
+    return True
+
 
+def fleet_results(progress):
+    """Per-target result map of every target progress has completed."""
+    results = {}
+    for identifier, (kind, created, reason) in sorted(progress.completed.items()):
+        if reason is None:
+            results[identifier] = {'Status': SUCCESS, 'Type': kind,
+                                   'SnapshotIdentifier': str(DBSNAPSHOTID) + identifier + "-" + progress.suffix}
+            if not created:
+                results[identifier]['Existing'] = True
+        else:
+            results[identifier] = {'Status': FAILED, 'Type': kind, 'Reason': reason}
+    return results
+
+
+def fleet_handler(event, context, targets, suffix, progress=None):
+    """
+    Snapshot every target concurrently and report a per-target
+    result map to CloudFormation. suffix is this invocation's name suffix.
+    Targets are only started while the invocation has time to spare; the
+    rest continue in a chained invocation that carries progress, a
+    checkpoint.Checkpoint, and the last one in the chain responds.
+    """
+    progress = progress or checkpoint.Checkpoint(suffix)
+    suffix = progress.suffix
+    reserve_ms = checkpoint.budget_reserve(TIME_RESERVE_MS, context.get_remaining_time_in_millis())
+    todo = [target for target in targets if target[1] not in progress.completed]
+    logger.info("Fleet mode: snapshotting %d of %d target(s) with up to %d workers (invocation %d)",
+                len(todo), len(targets), FLEET_MAX_WORKERS, progress.invocation)
+
+    def snapshot_target(target):
+        kind, identifier = target
+        # DBSNAPSHOTID is a shared prefix, the target keeps fleet names unique.
+        prefix = str(DBSNAPSHOTID) + identifier + "-"
+        _, created = create_snapshot_once(kind, identifier, prefix, prefix + suffix)
+        return created
+
+    WATCHDOG.enter('fleet snapshots')
+    outcomes, pending = checkpoint.run_within_budget(
+        snapshot_target, todo, context.get_remaining_time_in_millis, TIME_RESERVE_MS, FLEET_MAX_WORKERS)
+    for (kind, identifier), (created, error) in outcomes.items():
+        progress.record(kind, identifier, created, None if error is None else str(error))
+        if isinstance(error, ClientError) and \
+                error.response.get('Error', {}).get('Code') in topology.NOT_FOUND_CODES:
+            TOPOLOGY.invalidate(identifier)
+    if pending:
+        if not outcomes:
+            reason = "No time left to snapshot any of %d remaining target(s)." % len(pending)
+            logger.error(reason)
+            respond(event, context, FAILED, reason=reason, response_data=fleet_results(progress))
+            return None
+        continue_fleet(event, context, progress)
+        return None
+
+    results = fleet_results(progress)
+    failed = sum(1 for result in results.values() if result['Status'] == FAILED)
+
+    if WAIT_FOR_AVAILABLE:
+        created = dict(((result['Type'], result['SnapshotIdentifier']), identifier)
+                       for identifier, result in results.items() if result['Status'] == SUCCESS)
+        try:
+            statuses = wait_for_available(list(created), context)
+        except ClientError as error:
+            logger.error("Failed to poll fleet snapshot status: %s", error, exc_info=True)
+            statuses = dict((snapshot, 'unknown') for snapshot in created)
+        for snapshot, status in statuses.items():
+            result = results[created[snapshot]]
+            result['SnapshotStatus'] = status
+            if status != waiter.AVAILABLE:
+                failed += 1
+                result['Status'] = FAILED
+                result['Reason'] = "Snapshot %s is '%s', not available." % (snapshot[1], status)
+
+    if failed:
+        reason = "%d of %d fleet snapshot(s) failed." % (failed, len(targets))
+        logger.error(reason)
+        respond(event, context, FAILED, reason=reason, response_data=results)
+    else:
+        respond(event, context, SUCCESS,
+             reason="Fleet snapshots created successfully.", response_data=results)
+    sources = [(result['Type'], identifier, str(DBSNAPSHOTID) + identifier + "-")
+               for identifier, result in results.items() if result['Status'] == SUCCESS]
+    if context.get_remaining_time_in_millis() < reserve_ms:
+        logger.warning("Skipping copies and retention, too little time left; the next run catches up")
+        return results
+    follow_up(sources)
+    return results
 
+
+@PROFILER.entry_point('handler')
+@METRICS.entry_point('handler')
 def handler(event, context):
     """
-    Handler to create RDS Backups
+    Handler to create RDS Backups. Whatever happens inside, CloudFormation
+    gets exactly one response, at the latest shortly before the deadline.
+    Scheduled invocations carry no ResponseURL and respond to nobody.
+    RDS events from EventBridge run their follow-ups instead.
+    """
+    if events.is_rds_event(event):
+        return event_handler(event, context)
+    # Only CloudFormation waits for a response, scheduled runs are not guarded
+    if event.get('ResponseURL'):
+        WATCHDOG.start(event, context)
+    error = None
+    try:
+        return handle(event, context)
+    except Exception as unexpected: # pylint: disable=broad-except
+        # Responded FAILED below; not re-raised, an asynchronous retry of
+        # this invocation would respond a second time.
+        logger.error("Unexpected error in handler: %s", unexpected, exc_info=True)
+        error = unexpected
+        return None
+    finally:
+        WATCHDOG.stop(error)
+
+
+def handle(event, context):
+    """
+    Create the snapshot(s) of one invocation and respond to CloudFormation.
     """
-    logger.info("Received event: %s", json.dumps(event, indent=2))
+    with PROFILER.span('log event'):
+        logger.info("Received event: %s", json.dumps(event, indent=2))
     logger.info("Log stream name: %s", context.log_stream_name)
     logger.info("Log group name: %s", context.log_group_name)
     logger.info("Request ID: %s", context.aws_request_id)
     logger.info("Mem. limits(MB): %s", context.memory_limit_in_mb)
     logger.info("Time remaining (MS): %s", context.get_remaining_time_in_millis())
 
+    # Chained invocations carry the progress and name suffix of the first one
+    progress = checkpoint.Checkpoint.from_event(event)
+    # Per invocation: warm containers must not reuse an earlier date
+    try:
+        suffix = progress.suffix if progress else naming.snapshot_suffix(datetime.datetime.now(), SNAPSHOT_NAME_GRANULARITY,
+                                        event.get('RequestId') or context.aws_request_id)
+    except ValueError as error:
+        logger.error("Invalid snapshot naming: %s", error)
+        respond(event, context, FAILED, reason=str(error), response_data={})
+        return
+    properties = event.get('ResourceProperties') or {}
+    try:
+        accounts = hub.parse_accounts(properties.get('HubAccounts') or HUB_ACCOUNTS,
+                                      properties.get('HubRoleName', HUB_ROLE_NAME))
+    except ValueError as error:
+        logger.error("Invalid hub accounts: %s", error)
+        respond(event, context, FAILED, reason=str(error), response_data={})
+        return None
+    if accounts and DBSNAPSHOTID:
+        return hub_handler(event, context, accounts, suffix)
+    WATCHDOG.enter('resolving fleet')
+    try:
+        targets = resolve_fleet(event) if DBSNAPSHOTID else []
+    except ClientError as error:
+        logger.error("Failed to resolve fleet targets: %s", error, exc_info=True)
+        respond(event, context, FAILED, reason=str(error), response_data={})
+        return
+    if targets:
+        name = (event.get('ResourceProperties') or {}).get('SnapshotGroup', SNAPSHOT_GROUP)
+        if name:
+            try:
+                return group_handler(event, context, targets, suffix, name)
+            except ValueError as error:
+                logger.error("Invalid snapshot group: %s", error)
+                respond(event, context, FAILED, reason=str(error), response_data={})
+                return None
+        return fleet_handler(event, context, targets, suffix, progress)
+
     # Environment variable validation
     # These are already read globally, but we check them here in the handler's context
     if not DBINSTANCEID or not DBSNAPSHOTID:
@@ -93,45 +841,47 @@ def handler(event, context):
         logger.error(error_msg)
         # Attempt to get PhysicalResourceId for the send function, default if not found
         physical_resource_id = event.get('PhysicalResourceId', context.log_stream_name)
-        send(event, context, FAILED, reason=error_msg, physical_resource_id=physical_resource_id)
+        respond(event, context, FAILED, reason=error_msg, physical_resource_id=physical_resource_id)
         return
     
     response = {}
-    if query_db_cluster(DBINSTANCEID):
-        cluster_id = query_db_cluster(DBINSTANCEID) # Re-querying, but ensures it's fresh if global was stale. Could optimize.
+    # DBSNAPSHOTID (from env var) is used as a prefix for the snapshot identifier.
+    snapshot_identifier = str(DBSNAPSHOTID) + suffix
+    WATCHDOG.enter('snapshot of %s' % DBINSTANCEID)
+    cluster_id = TOPOLOGY.cluster_of(DBINSTANCEID)
+    if cluster_id:
         try:
-            logger.info("Attempting to create cluster snapshot for %s", cluster_id)
-            # DBSNAPSHOTID (from env var) is used as a prefix for the snapshot identifier.
-            snapshot_identifier = str(DBSNAPSHOTID) + NOW.strftime("%Y-%m-%d")
-            response = RDS.create_db_cluster_snapshot(
-                DBClusterSnapshotIdentifier=snapshot_identifier,
-                DBClusterIdentifier=cluster_id
-                )
+            response, created = create_snapshot_once('cluster', cluster_id, str(DBSNAPSHOTID), snapshot_identifier)
             logger.info("Successfully created cluster snapshot: %s", response.get('DBClusterSnapshot', {}).get('DBClusterSnapshotIdentifier'))
-            send(event, context, SUCCESS, reason="Cluster snapshot created successfully.", response_data=response)
-        except ClientError as error:
+            if WAIT_FOR_AVAILABLE and not snapshot_available('cluster', snapshot_identifier, response, event, context):
+                return
+            respond(event, context, SUCCESS, reason="Cluster snapshot created successfully." if created else
+                 "Cluster snapshot already exists.", response_data=response)
+            follow_up([('cluster', cluster_id, str(DBSNAPSHOTID))])
+        except (ClientError, naming.UnusableSnapshotError) as error:
             logger.error("Failed to create cluster snapshot for %s: %s", cluster_id, error, exc_info=True)
-            send(event, context, FAILED, reason=str(error), response_data={})
+            respond(event, context, FAILED, reason=str(error), response_data={})
     else:
         try:
-            logger.info("Attempting to create instance snapshot for %s", DBINSTANCEID)
-            # DBSNAPSHOTID (from env var) is used as a prefix for the snapshot identifier.
-            snapshot_identifier = str(DBSNAPSHOTID) + NOW.strftime("%Y-%m-%d")
-            response = RDS.create_db_snapshot(
-                DBSnapshotIdentifier=snapshot_identifier,
-                DBInstanceIdentifier=DBINSTANCEID
-                )
+            response, created = create_snapshot_once('instance', DBINSTANCEID, str(DBSNAPSHOTID), snapshot_identifier)
             logger.info("Successfully created instance snapshot: %s", response.get('DBSnapshot', {}).get('DBSnapshotIdentifier'))
+            if WAIT_FOR_AVAILABLE and not snapshot_available('instance', snapshot_identifier, response, event, context):
+                return
             
             if 'DBSnapshot' in response:
                 # Removing timestamp fields as they might cause issues with CloudFormation Custom Resource response handling
                 # or are not required by the stack for the custom resource to correctly complete.
                 response['DBSnapshot'].pop('SnapshotCreateTime', None) 
                 response['DBSnapshot'].pop('InstanceCreateTime', None) 
-            send(event, context, SUCCESS, reason="Instance snapshot created successfully.", response_data=response)
-        except ClientError as error:
+            respond(event, context, SUCCESS, reason="Instance snapshot created successfully." if created else
+                 "Instance snapshot already exists.", response_data=response)
+            follow_up([('instance', DBINSTANCEID, str(DBSNAPSHOTID))])
+        except (ClientError, naming.UnusableSnapshotError) as error:
             logger.error("Failed to create instance snapshot for %s: %s", DBINSTANCEID, error, exc_info=True)
-            send(event, context, FAILED, reason=str(error), response_data={})
+            respond(event, context, FAILED, reason=str(error), response_data={})
+
+
+PROFILER.add_span('import', time.perf_counter() - LOAD_STARTED)
 
 
 if __name__ == "__main__":
@@ -14,8 +14,8 @@ from __future__ import absolute_import, \
 import logging # Added
 import os
 import sys # Added
-import boto3
 
+from common import hub, inventory, profiling, ratelimit, utils
 from common.utils import query_db_cluster
 
 # Logger Setup
@@ -26,11 +26,51 @@ if not logging.getLogger().handlers: # Avoid adding multiple handlers
     ch.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
     logger.addHandler(ch)
 
-RDS = boto3.client('rds') # This RDS client is not used in this file anymore.
+# EMF metrics and the adaptive rate limit of every RDS call, see ratelimit.from_environment
+METRICS, RATE_LIMITER = ratelimit.from_environment('query_db')
+# Profiling of query_db_cluster, off unless PROFILE is set
+profiling.PROFILER.configure(os.environ.get('PROFILE'),
+                             os.environ.get('PROFILE_DIR', profiling.DEFAULT_OUTPUT_DIR),
+                             int(os.environ.get('PROFILE_TOP', profiling.DEFAULT_TOP)))
+
 # INSTANCEID is now retrieved in __main__ block
 
 
+@METRICS.entry_point('write_inventory')
+def write_inventory(fmt, regions=None, output=None, max_workers=utils.DEFAULT_MAX_WORKERS, accounts=None):
+    """
+    Stream every instance and cluster of regions (default: the session's
+    region) to output (a path, default stdout) as JSON Lines or CSV.
+    accounts (hub.parse_accounts output) sweeps those accounts through
+    their roles instead of the caller's own account.
+    Returns the number of records written.
+    """
+    records = inventory.inventory_regions(regions or [], max_workers=max_workers, accounts=accounts)
+    if not output:
+        return inventory.write(records, sys.stdout, fmt)
+    with open(output, 'w', newline='') as stream:
+        return inventory.write(records, stream, fmt)
+
+
 if __name__ == "__main__":
+    INVENTORY_FORMAT = os.environ.get('INVENTORY_FORMAT')
+    if INVENTORY_FORMAT:
+        REGIONS = [region.strip() for region in os.environ.get('INVENTORY_REGIONS', '').split(',') if region.strip()]
+        try:
+            ACCOUNTS = hub.parse_accounts(os.environ.get('HUB_ACCOUNTS'),
+                                          os.environ.get('HUB_ROLE_NAME', hub.DEFAULT_ROLE_NAME))
+            COUNT = write_inventory(INVENTORY_FORMAT.lower(), REGIONS, os.environ.get('INVENTORY_OUTPUT'),
+                                    int(os.environ.get('INVENTORY_MAX_WORKERS', utils.DEFAULT_MAX_WORKERS)),
+                                    ACCOUNTS)
+        except ValueError as ve:
+            logger.error("Configuration error: %s", ve)
+            sys.exit(1)
+        except Exception as e: # Any region failing fails the report
+            logger.error("Inventory failed: %s", e, exc_info=True)
+            sys.exit(1)
+        logger.info("Inventory written: %d record(s)", COUNT)
+        sys.exit(0)
+
     INSTANCEID = os.environ.get('DBINSTANCEID')
     if not INSTANCEID:
         logger.error("DBINSTANCEID environment variable not set. Exiting.")
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -- coding: utf-8 --
+"""
+File:           rds_export.py
+Author:         Adeel Ahmad
+Description:    Python Script to export RDS Backup snapshots to S3 as Parquet
+"""
+
+from __future__ import absolute_import, \
+        division, print_function, unicode_literals
+
+import logging
+import os
+import sys
+from botocore.exceptions import ClientError
+
+from common import clients, export, ratelimit
+
+# Logger Setup
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+if not logging.getLogger().handlers: # Avoid adding multiple handlers
+    ch = logging.StreamHandler()
+    ch.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    logger.addHandler(ch)
+
+RDS = clients.LazyClient('rds')
+# EMF metrics and the adaptive rate limit of every RDS call, see ratelimit.from_environment
+METRICS, RATE_LIMITER = ratelimit.from_environment('rds_export')
+
+
+def export_settings():
+    """Destination and pacing of the exports, from the environment."""
+    required = (('bucket', 'EXPORT_BUCKET'), ('iam_role_arn', 'EXPORT_ROLE_ARN'), ('kms_key_id', 'EXPORT_KMS_KEY_ID'))
+    settings = dict((key, os.environ.get(name)) for key, name in required)
+    missing = [name for key, name in required if not settings[key]]
+    if missing:
+        raise ValueError("Missing required environment variable(s): %s." % ', '.join(missing))
+    settings.update({
+        's3_prefix': os.environ.get('EXPORT_S3_PREFIX') or None,
+        'max_concurrent': int(os.environ.get('EXPORT_MAX_CONCURRENT', export.DEFAULT_MAX_CONCURRENT_EXPORTS)),
+        'timeout': float(os.environ.get('EXPORT_TIMEOUT', export.DEFAULT_TIMEOUT)),
+        'min_delay': float(os.environ.get('EXPORT_MIN_DELAY', export.DEFAULT_MIN_DELAY)),
+        'max_delay': float(os.environ.get('EXPORT_MAX_DELAY', export.DEFAULT_MAX_DELAY)),
+    })
+    return settings
+
+
+@METRICS.entry_point('export_snapshots')
+def export_snapshots(prefix):
+    """
+    Export the available snapshots whose identifier starts with prefix, and
+    created within EXPORT_MAX_AGE_HOURS if set, to S3. Runs up to
+    EXPORT_MAX_CONCURRENT tasks of the account at once, queues the rest and
+    waits for all of them. Prints per-export status and throughput.
+    Returns True if every export completed.
+    """
+    settings = export_settings()
+    max_age = os.environ.get('EXPORT_MAX_AGE_HOURS')
+    snapshots = export.list_candidates(prefix, float(max_age) if max_age else None, RDS)
+    logger.info("Exporting %d snapshot(s) with prefix %s", len(snapshots), prefix)
+    results, total_seconds = export.export_many(snapshots, client=RDS, **settings)
+    for result in results.values():
+        if result['GBPerMinute'] is not None:
+            METRICS.add('ExportThroughput', result['GBPerMinute'], 'None', 'export')
+    for line in export.format_report(results, total_seconds):
+        print(line)
+    return all(result['Status'] == export.COMPLETE for result in results.values())
+
+
+if __name__ == "__main__":
+    PREFIX = os.environ.get('DBSNAPSHOTID')
+    if not PREFIX:
+        logger.error("DBSNAPSHOTID environment variable not set. Exiting.")
+        sys.exit(1)
+    try:
+        sys.exit(0 if export_snapshots(PREFIX) else 1)
+    except ValueError as ve:
+        logger.error("Configuration error: %s", ve)
+        sys.exit(1)
+    except ClientError as error:
+        logger.error("Snapshot export failed: %s", error, exc_info=True)
+        sys.exit(1)
@@ -14,10 +14,10 @@ from __future__ import absolute_import, \
 import logging # Added
 import os
 import sys # Added
+import time
 from botocore.exceptions import ClientError
-import boto3
 
-from common.utils import query_db_cluster
+from common import clients, hub, profiling, ratelimit, restore, timeline, topology, utils, verify
 
 # Logger Setup
 logger = logging.getLogger(__name__)
@@ -27,9 +27,68 @@ if not logging.getLogger().handlers: # Avoid adding multiple handlers
     ch.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
     logger.addHandler(ch)
 
-RDS = boto3.client('rds')
+RDS = clients.LazyClient('rds')
+# Source instance -> cluster, looked up once by main and reused by verify_restore
+TOPOLOGY = topology.TopologyIndex()
+# EMF metrics and the adaptive rate limit of every RDS call, see ratelimit.from_environment
+METRICS, RATE_LIMITER = ratelimit.from_environment('rds_restore')
+# Profiling of main, restore_manifest and query_db_cluster, off unless PROFILE is set
+PROFILER = profiling.PROFILER
+PROFILER.configure(os.environ.get('PROFILE'), os.environ.get('PROFILE_DIR', profiling.DEFAULT_OUTPUT_DIR),
+                   int(os.environ.get('PROFILE_TOP', profiling.DEFAULT_TOP)))
 # INSTANCEID is now retrieved in __main__ block
 
+
+def restore_members():
+    """Whether restored clusters get their source members recreated (RESTORE_CLUSTER_MEMBERS)."""
+    return os.environ.get('RESTORE_CLUSTER_MEMBERS', 'true').lower() == 'true'
+
+
+def clone_requested():
+    """
+    Whether RESTORE_TYPE asks for copy-on-write clones ('clone') rather than
+    full restores ('full', the default).
+    """
+    restore_type = os.environ.get('RESTORE_TYPE', 'full').lower()
+    if restore_type not in ('full', 'clone'):
+        raise ValueError("RESTORE_TYPE must be 'full' or 'clone', got %r." % restore_type)
+    return restore_type == 'clone'
+
+
+def recovery_point(kind, source_id):
+    """
+    When RESTORE_TIME is set, the recovery point of source_id chosen from its
+    (cached) snapshot timeline, as (point, engine); otherwise (None, None).
+    """
+    restore_time = os.environ.get('RESTORE_TIME')
+    if not restore_time:
+        return None, None
+    try:
+        when = timeline.parse_time(restore_time)
+    except ValueError:
+        raise ValueError("RESTORE_TIME must be an ISO 8601 timestamp, got %r." % restore_time)
+    index = timeline.get_timeline(
+        kind, source_id, os.environ.get('DBSNAPSHOTID', ''), RDS,
+        path=os.environ.get('RESTORE_TIMELINE_CACHE') or None,
+        ttl=float(os.environ.get('RESTORE_TIMELINE_TTL', timeline.DEFAULT_CACHE_TTL)), when=when)
+    point = index.choose(when, os.environ.get('RESTORE_SOURCE', timeline.AUTO).lower())
+    logger.info("Restoring %s %s to %s from %s %s", kind, source_id, when.isoformat(), point['Source'],
+                point.get('SnapshotIdentifier', point['Time'].isoformat()))
+    return point, index.engine
+
+
+def restore_settings():
+    """Concurrency, rate and polling settings shared by every restore path."""
+    return {
+        'max_workers': int(os.environ.get('RESTORE_MAX_WORKERS', utils.DEFAULT_MAX_WORKERS)),
+        'rate': float(os.environ.get('RESTORE_RATE', restore.DEFAULT_RATE)),
+        'timeout': float(os.environ.get('RESTORE_TIMEOUT', restore.DEFAULT_TIMEOUT)),
+        'min_delay': float(os.environ.get('RESTORE_MIN_DELAY', restore.DEFAULT_MIN_DELAY)),
+        'max_delay': float(os.environ.get('RESTORE_MAX_DELAY', restore.DEFAULT_MAX_DELAY)),
+    }
+
+@PROFILER.entry_point('main')
+@METRICS.entry_point('main')
 def main(instanceid):
     """
     Main function restore from latest snapshot.
@@ -39,23 +98,38 @@ def main(instanceid):
         logger.error("DBINSTANCEID (passed as instanceid) is missing.")
         raise ValueError("DBINSTANCEID (passed as instanceid) is missing.")
 
-    if query_db_cluster(instanceid):
-        cluster_id = query_db_cluster(instanceid)
+    clone = clone_requested()
+    started = time.time()
+    cluster_id = TOPOLOGY.cluster_of(instanceid)
+    if cluster_id:
         new_cluster_id = os.environ.get('NEW_CLUSTER_ID')
         if not new_cluster_id:
             error_msg = "NEW_CLUSTER_ID environment variable is not set for clustered restore."
             logger.error(error_msg)
             raise ValueError(error_msg)
         try:
+            # Read the source topology first, a restored cluster has no instances
+            PROFILER.phase('cluster topology')
+            members = restore.cluster_members(cluster_id, new_cluster_id, RDS) if restore_members() else []
+            PROFILER.phase('recovery point')
+            point, engine = recovery_point('cluster', cluster_id)
             logger.info("Attempting to restore cluster %s to new cluster %s", cluster_id, new_cluster_id)
-            restore = RDS.restore_db_cluster_to_point_in_time(
-                DBClusterIdentifier=new_cluster_id,
-                SourceDBClusterIdentifier=cluster_id,
-                UseLatestRestorableTime=True
-                )
-            logger.info("Successfully initiated restore for cluster %s to new cluster %s. Status: %s",
-                        cluster_id, new_cluster_id, restore.get('DBCluster', {}).get('Status'))
-            return restore.get('DBCluster', {}).get('Status')
+            PROFILER.phase('restore request')
+            if point:
+                response, restore_type = restore.restore_to_point('cluster', cluster_id, new_cluster_id, point,
+                                                                  RDS, clone, engine)
+            else:
+                response, restore_type = restore.restore_cluster(cluster_id, new_cluster_id, RDS, clone)
+            logger.info("Successfully initiated %s restore for cluster %s to new cluster %s in %.1f s. Status: %s",
+                        restore_type, cluster_id, new_cluster_id, time.time() - started,
+                        response.get('DBCluster', {}).get('Status'))
+            if not members:
+                return response.get('DBCluster', {}).get('Status')
+            PROFILER.phase('cluster members')
+            result = restore.complete_cluster(new_cluster_id, members, RDS, **restore_settings())
+            logger.info("%s restore of cluster %s with instances %s: %s after %.0f s", restore_type,
+                        new_cluster_id, ', '.join(result['Instances']), result['Status'], time.time() - started)
+            return result['Status']
         except ClientError as error:
             logger.error("Failed to restore cluster %s to %s: %s", cluster_id, new_cluster_id, error, exc_info=True)
             raise error # Re-raise after logging
@@ -65,22 +139,113 @@ def main(instanceid):
             error_msg = "NEW_INSTANCEID environment variable not set for non-clustered restore."
             logger.error(error_msg)
             raise ValueError(error_msg)
+        if clone:
+            logger.warning("Clones need an Aurora cluster, doing a full restore of instance %s", instanceid)
         try:
+            PROFILER.phase('recovery point')
+            point, _ = recovery_point('instance', instanceid)
             logger.info("Attempting to restore instance %s to new instance %s", instanceid, new_instanceid)
-            restore = RDS.restore_db_instance_to_point_in_time(
-                SourceDBInstanceIdentifier=instanceid,
-                TargetDBInstanceIdentifier=new_instanceid,
-                UseLatestRestorableTime=True
-                )
+            PROFILER.phase('restore request')
+            if point:
+                response, _ = restore.restore_to_point('instance', instanceid, new_instanceid, point, RDS)
+            else:
+                response = RDS.restore_db_instance_to_point_in_time(
+                    SourceDBInstanceIdentifier=instanceid,
+                    TargetDBInstanceIdentifier=new_instanceid,
+                    UseLatestRestorableTime=True
+                    )
             logger.info("Successfully initiated restore for instance %s to new instance %s. Status: %s",
-                        instanceid, new_instanceid, restore.get('DBInstance', {}).get('DBInstanceStatus'))
-            return restore.get('DBInstance', {}).get('DBInstanceStatus')
+                        instanceid, new_instanceid, response.get('DBInstance', {}).get('DBInstanceStatus'))
+            return response.get('DBInstance', {}).get('DBInstanceStatus')
         except ClientError as error:
             logger.error("Failed to restore instance %s to %s: %s", instanceid, new_instanceid, error, exc_info=True)
             raise error # Re-raise after logging
 
 
+def verify_restore(instanceid, status):
+    """
+    Compare the restored database with its source when VERIFY_SOURCE_URL and
+    VERIFY_TARGET_URL are set, waiting for the restore to become available
+    first. For an exact match the source must not have changed since the
+    restore point, e.g. a quiesced source or a second restore to the same
+    point. Prints the tables that differ. Returns True if all tables match,
+    None if verification is not configured.
+    """
+    source_url, target_url = os.environ.get('VERIFY_SOURCE_URL'), os.environ.get('VERIFY_TARGET_URL')
+    if not source_url or not target_url:
+        return None
+    (source_connect, dialect), (target_connect, _) = verify.connector(source_url), verify.connector(target_url)
+    if status != restore.AVAILABLE:
+        if TOPOLOGY.cluster_of(instanceid):
+            kind, target = 'cluster', os.environ.get('NEW_CLUSTER_ID')
+        else:
+            kind, target = 'instance', os.environ.get('NEW_INSTANCEID')
+        logger.info("Waiting for %s %s before verifying it", kind, target)
+        status = restore.wait_for(kind, target, RDS, **restore_settings())
+        if status != restore.AVAILABLE:
+            logger.error("Cannot verify %s %s: it is %s", kind, target, status)
+            return False
+    tables = [table.strip() for table in os.environ.get('VERIFY_TABLES', '').split(',') if table.strip()]
+    results, total_seconds = verify.verify(
+        source_connect, target_connect, dialect, tables,
+        chunk_rows=int(os.environ.get('VERIFY_CHUNK_ROWS', verify.DEFAULT_CHUNK_ROWS)),
+        max_workers=int(os.environ.get('VERIFY_MAX_WORKERS', utils.DEFAULT_MAX_WORKERS)))
+    for line in verify.format_report(results, total_seconds):
+        print(line)
+    return all(result['Status'] == verify.MATCH for result in results.values())
+
+
+def hub_accounts():
+    """Hub accounts of HUB_ACCOUNTS (ids or role ARNs), empty for this account only."""
+    return hub.parse_accounts(os.environ.get('HUB_ACCOUNTS'), os.environ.get('HUB_ROLE_NAME', hub.DEFAULT_ROLE_NAME))
+
+
+@PROFILER.entry_point('restore_manifest')
+@METRICS.entry_point('restore_manifest')
+def restore_manifest(manifest):
+    """
+    Restore every source -> target pair of manifest (JSON text or file, see
+    common.restore.load_manifest) concurrently and wait until all are
+    available. Prints per-database and total recovery time. With
+    HUB_ACCOUNTS set, the manifest is restored in every hub account at once.
+    Returns True if every restore became available.
+    """
+    pairs = restore.load_manifest(manifest)
+    accounts = hub_accounts()
+    settings = dict(with_members=restore_members(), clone=clone_requested(), **restore_settings())
+    if not accounts:
+        logger.info("Restoring %d database(s) from manifest", len(pairs))
+        results, total_seconds = restore.restore_many(pairs, client=RDS, **settings)
+        for line in restore.format_report(results, total_seconds):
+            print(line)
+        return all(result['Status'] == restore.AVAILABLE for result in results.values())
+
+    logger.info("Restoring %d database(s) from manifest in %d hub account(s)", len(pairs), len(accounts))
+    swept = hub.fan_out(lambda account_id, region, client: restore.restore_many(pairs, client=client, **settings),
+                        accounts, max_workers=int(os.environ.get('HUB_MAX_WORKERS', utils.DEFAULT_MAX_WORKERS)))
+    succeeded = True
+    for (account_id, _), (outcome, error) in sorted(swept.items()):
+        print("Account %s:" % account_id)
+        if error is not None:
+            print("  FAILED: %s" % error)
+            succeeded = False
+            continue
+        results, total_seconds = outcome
+        for line in restore.format_report(results, total_seconds):
+            print("  " + line)
+        succeeded = succeeded and all(result['Status'] == restore.AVAILABLE for result in results.values())
+    return succeeded
+
+
 if __name__ == "__main__":
+    MANIFEST = os.environ.get('RESTORE_MANIFEST')
+    if MANIFEST:
+        try:
+            sys.exit(0 if restore_manifest(MANIFEST) else 1)
+        except ValueError as ve:
+            logger.error("Invalid restore manifest: %s", ve)
+            sys.exit(1)
+
     INSTANCEID = os.environ.get('DBINSTANCEID')
     if not INSTANCEID:
         logger.error("DBINSTANCEID environment variable not set. Exiting.")
@@ -90,6 +255,9 @@ if __name__ == "__main__":
     try:
         status = main(INSTANCEID)
         logger.info("Restore process finished with status: %s", status)
+        if verify_restore(INSTANCEID, status) is False:
+            logger.error("Restored database does not match its source.")
+            sys.exit(1)
     except ValueError as ve: # Catch specific ValueError for missing env vars in main
         logger.error("Configuration error: %s", ve)
         sys.exit(1)
@@ -0,0 +1,83 @@
+"""Unit tests for the common.checkpoint module."""
+
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from common import checkpoint
+
+
+class TestRunWithinBudget(unittest.TestCase):
+
+    def test_stops_taking_items_at_the_reserve(self):
+        remaining = iter([30000, 25000, 20000, 10000])
+
+        outcomes, pending = checkpoint.run_within_budget(
+            lambda item: item * 2, [1, 2, 3, 4, 5], lambda: next(remaining), reserve_ms=15000, max_workers=1)
+
+        self.assertEqual(outcomes, {1: (2, None), 2: (4, None), 3: (6, None)})
+        self.assertEqual(pending, [4, 5])
+
+    def test_short_budgets_scale_the_reserve(self):
+        # 14 s left: the reserve shrinks to 7 s
+        remaining = iter([14000, 12000, 6000])
+
+        outcomes, pending = checkpoint.run_within_budget(
+            lambda item: item, [1, 2, 3, 4], lambda: next(remaining), reserve_ms=15000, max_workers=1)
+
+        self.assertEqual(sorted(outcomes), [1, 2])
+        self.assertEqual(pending, [3, 4])
+
+    def test_the_first_item_always_starts(self):
+        outcomes, pending = checkpoint.run_within_budget(
+            lambda item: item, [1, 2], lambda: 0, reserve_ms=15000, max_workers=4)
+
+        self.assertEqual(outcomes, {1: (1, None)})
+        self.assertEqual(pending, [2])
+
+    def test_failures_are_outcomes(self):
+        def func(item):
+            if item == 2:
+                raise RuntimeError('boom')
+            return item
+
+        outcomes, pending = checkpoint.run_within_budget(func, [1, 2, 3], lambda: 60000, reserve_ms=0)
+
+        self.assertEqual(pending, [])
+        self.assertIsInstance(outcomes[2][1], RuntimeError)
+        self.assertEqual(outcomes[3], (3, None))
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def test_round_trip_through_the_event(self):
+        progress = checkpoint.Checkpoint('2023-01-01')
+        progress.record('instance', 'db-a', created=True)
+        progress.record('cluster', 'cluster-b', reason='Throttling')
+
+        following = progress.next_event({'RequestId': 'request-id'})
+        restored = checkpoint.Checkpoint.from_event(following)
+
+        self.assertEqual(following['RequestId'], 'request-id')
+        self.assertEqual(restored.suffix, '2023-01-01')
+        self.assertEqual(restored.invocation, 2)
+        self.assertEqual(restored.completed, {'db-a': ['instance', True, None],
+                                              'cluster-b': ['cluster', False, 'Throttling']})
+        self.assertIsNone(checkpoint.Checkpoint.from_event({}))
+
+    def test_checkpoint_is_compact(self):
+        progress = checkpoint.Checkpoint('2023-01-01')
+        for number in range(10000):
+            progress.record('instance', 'db-%05d' % number, created=True)
+
+        self.assertLess(len(progress.encode()), 64 * 1024)
+
+    def test_oversized_checkpoint_is_refused(self):
+        with self.assertRaises(ValueError):
+            checkpoint.Checkpoint('2023-01-01').next_event({'Padding': 'x' * checkpoint.MAX_PAYLOAD})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+"""Unit tests for the common.clients module."""
+
+import datetime
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import botocore.session
+
+from common import clients
+
+
+class TestClientFactory(unittest.TestCase):
+
+    def setUp(self):
+        clients.reset()
+        self.mock_session = MagicMock()
+        self.mock_session.client.side_effect = lambda service, region_name=None: MagicMock(name=service)
+        # Role sessions borrow the model loader of the shared botocore session
+        self.mock_session._session = botocore.session.get_session()
+        self.patch_session = patch('common.clients.get_session', return_value=self.mock_session)
+        self.patch_session.start()
+
+    def tearDown(self):
+        self.patch_session.stop()
+        clients.reset()
+
+    def test_clients_are_cached_per_service_and_region(self):
+        first = clients.get_client('rds')
+        self.assertIs(clients.get_client('rds'), first)
+        self.assertIsNot(clients.get_client('rds', 'eu-west-1'), first)
+        self.assertEqual(self.mock_session.client.call_count, 2)
+
+    def test_installed_client_is_used_by_lazy_clients(self):
+        stand_in = MagicMock(name='stand-in')
+        clients.install(stand_in)
+
+        clients.LazyClient('rds').describe_db_instances()
+
+        stand_in.describe_db_instances.assert_called_once_with()
+        self.mock_session.client.assert_not_called()
+
+    def test_lazy_client_defers_construction(self):
+        lazy = clients.LazyClient('rds')
+        self.mock_session.client.assert_not_called()
+
+        lazy.describe_db_instances(DBInstanceIdentifier='db-a')
+        lazy.describe_db_instances(DBInstanceIdentifier='db-b')
+
+        self.mock_session.client.assert_called_once_with('rds', region_name=None)
+        self.assertEqual(clients.get_client('rds').describe_db_instances.call_count, 2)
+
+    def test_lazy_client_ignores_private_lookups(self):
+        with self.assertRaises(AttributeError):
+            clients.LazyClient('rds').__deepcopy__
+        with self.assertRaises(AttributeError):
+            clients.LazyClient('rds')._is_coroutine
+        self.mock_session.client.assert_not_called()
+
+    def assume_role_returns(self, *lifetimes):
+        sts = MagicMock()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        sts.assume_role.side_effect = [{'Credentials': {
+            'AccessKeyId': 'AKIA%d' % number, 'SecretAccessKey': 'secret', 'SessionToken': 'token',
+            'Expiration': now + lifetime}} for number, lifetime in enumerate(lifetimes)]
+        self.mock_session.client.side_effect = lambda service, region_name=None: sts
+        self.mock_session.region_name = 'us-east-1'
+        return sts
+
+    def test_role_clients_use_assumed_credentials(self):
+        sts = self.assume_role_returns(datetime.timedelta(hours=1))
+
+        client = clients.get_client('rds', 'us-east-1', 'arn:aws:iam::111111111111:role/backup')
+        # Assumed on first use, not when the client is built
+        sts.assume_role.assert_not_called()
+        credentials = client._request_signer._credentials.get_frozen_credentials()
+
+        self.assertEqual(credentials.access_key, 'AKIA0')
+        sts.assume_role.assert_called_once_with(
+            RoleArn='arn:aws:iam::111111111111:role/backup', RoleSessionName='rds-backup')
+
+    def test_role_credentials_are_cached_until_shortly_before_expiry(self):
+        sts = self.assume_role_returns(datetime.timedelta(minutes=5), datetime.timedelta(hours=1))
+        role = 'arn:aws:iam::111111111111:role/backup'
+        east = clients.get_client('rds', 'us-east-1', role)
+        west = clients.get_client('rds', 'us-west-2', role)
+
+        # Five minutes left is inside botocore's refresh window: renewed once
+        self.assertEqual(east._request_signer._credentials.get_frozen_credentials().access_key, 'AKIA0')
+        self.assertEqual(east._request_signer._credentials.get_frozen_credentials().access_key, 'AKIA1')
+        # Regions share the role's credentials
+        self.assertEqual(west._request_signer._credentials.get_frozen_credentials().access_key, 'AKIA1')
+        self.assertEqual(sts.assume_role.call_count, 2)
+
+    def test_role_sessions_share_the_loaded_models(self):
+        self.mock_session.region_name = 'us-east-1'
+        loader = self.mock_session._session.get_component('data_loader')
+
+        for role in ('arn:aws:iam::111111111111:role/backup', 'arn:aws:iam::222222222222:role/backup'):
+            clients.get_client('rds', 'us-east-1', role)
+            self.assertIs(clients._ROLE_SESSIONS[role]._session.get_component('data_loader'), loader)
+
+    def test_roles_build_clients_without_the_cache_lock(self):
+        self.mock_session.region_name = 'us-east-1'
+        building = threading.Event()
+        release = threading.Event()
+        released = []
+        real_session = clients._assumed_session
+
+        def slow_session(role_arn, region=None):
+            building.set()
+            released.append(release.wait(2))
+            return real_session(role_arn, region)
+
+        with patch('common.clients._assumed_session', side_effect=slow_session):
+            worker = threading.Thread(target=clients.get_client,
+                                      args=('rds', 'us-east-1', 'arn:aws:iam::111111111111:role/backup'))
+            worker.start()
+            self.assertTrue(building.wait(5))
+            # Another key is served while the role client is being built
+            self.assertIsNotNone(clients.get_client('rds', 'eu-west-1'))
+            release.set()
+            worker.join(5)
+        self.assertEqual(released, [True])
+        self.assertEqual(len(clients._CLIENTS), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+"""Unit tests for the common.dedupe module."""
+
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from common import dedupe
+
+
+def client_error(code):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, 'PutItem')
+
+
+class TestDedupeCache(unittest.TestCase):
+
+    def setUp(self):
+        self.now = [1000.0]
+        self.client = MagicMock()
+
+    def cache(self, **kwargs):
+        return dedupe.DedupeCache(client=self.client, clock=lambda: self.now[0], **kwargs)
+
+    def test_memory_claims_expire(self):
+        cache = self.cache(ttl=60)
+        self.assertFalse(cache.seen('a'))
+        self.assertTrue(cache.seen('a'))
+        self.now[0] += 61
+        self.assertFalse(cache.seen('a'))
+        self.client.put_item.assert_not_called()
+
+    def test_oldest_claims_are_forgotten(self):
+        cache = self.cache(max_entries=2)
+        for key in ('a', 'b', 'c'):
+            cache.seen(key)
+        self.assertFalse(cache.seen('a'))
+        self.assertTrue(cache.seen('c'))
+
+    def test_table_claim_is_conditional(self):
+        cache = self.cache(ttl=60, table='events')
+        self.assertFalse(cache.seen('a'))
+        kwargs = self.client.put_item.call_args[1]
+        self.assertEqual(kwargs['TableName'], 'events')
+        self.assertEqual(kwargs['Item'], {'EventId': {'S': 'a'}, 'ExpiresAt': {'N': '1060'}})
+        self.assertEqual(kwargs['ExpressionAttributeValues'], {':now': {'N': '1000'}})
+
+        # Claimed by another container
+        self.client.put_item.side_effect = client_error('ConditionalCheckFailedException')
+        self.assertTrue(cache.seen('b'))
+
+    def test_table_errors_fail_open(self):
+        self.client.put_item.side_effect = client_error('ProvisionedThroughputExceededException')
+        self.assertFalse(self.cache(table='events').seen('a'))
+
+    def test_release(self):
+        cache = self.cache(table='events')
+        cache.seen('a')
+        self.client.delete_item.side_effect = client_error('ResourceNotFoundException')
+        cache.release('a')
+        self.client.delete_item.assert_called_once_with(TableName='events', Key={'EventId': {'S': 'a'}})
+        self.assertFalse(cache.seen('a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+"""Unit tests for the common.events module."""
+
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from common import events
+
+
+def rds_event(detail_type, message, identifier, event_id='event-1'):
+    return {'id': event_id, 'source': 'aws.rds', 'detail-type': detail_type,
+            'detail': {'Message': message, 'SourceIdentifier': identifier}}
+
+
+class TestEvents(unittest.TestCase):
+
+    def test_is_rds_event(self):
+        self.assertTrue(events.is_rds_event(rds_event('RDS DB Snapshot Event', 'Manual snapshot created', 'snap')))
+        self.assertFalse(events.is_rds_event({'RequestType': 'Create', 'ResourceProperties': {}}))
+        self.assertFalse(events.is_rds_event({'source': 'aws.ec2', 'detail-type': 'EC2 Instance State-change'}))
+        self.assertFalse(events.is_rds_event(None))
+
+    def test_snapshot_created(self):
+        routed = events.route(rds_event('RDS DB Cluster Snapshot Event', 'Manual cluster snapshot created',
+                                        'fleet-cluster-00001-2023-01-01'))
+        self.assertEqual(routed, {'Action': events.SNAPSHOT_CREATED, 'Kind': 'cluster',
+                                  'Identifier': 'fleet-cluster-00001-2023-01-01', 'EventId': 'event-1',
+                                  'Message': 'Manual cluster snapshot created'})
+
+    def test_backup_completed_from_the_source_arn(self):
+        event = rds_event('RDS DB Instance Event', 'Finished DB Instance backup', None)
+        event['detail']['SourceArn'] = 'arn:aws:rds:us-east-1:111111111111:db:db-00003'
+        routed = events.route(event)
+        self.assertEqual((routed['Action'], routed['Kind'], routed['Identifier']),
+                         (events.BACKUP_COMPLETED, 'instance', 'db-00003'))
+
+    def test_other_events_need_no_follow_up(self):
+        self.assertIsNone(events.route(rds_event('RDS DB Snapshot Event', 'Creating manual snapshot', 'snap')))
+        self.assertIsNone(events.route(rds_event('RDS DB Instance Event', 'DB instance restarted', 'db-00003')))
+        self.assertIsNone(events.route(rds_event('RDS DB Parameter Group Event', 'Updated parameter', 'group')))
+
+
+if __name__ == '__main__':
+    unittest.main()
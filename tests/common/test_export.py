@@ -0,0 +1,103 @@
+"""Unit tests for the common.export module."""
+
+import datetime
+import unittest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from common import export
+from tests.fake_rds import FakeRDS
+
+NOW = datetime.datetime(2023, 1, 2, 12, 0, tzinfo=datetime.timezone.utc)
+
+
+def snapshot(identifier, hours_old=1, status='available'):
+    return {'Identifier': identifier, 'Kind': 'instance', 'Status': status,
+            'CreateTime': NOW - datetime.timedelta(hours=hours_old),
+            'Arn': 'arn:aws:rds:us-east-1:111111111111:snapshot:' + identifier}
+
+
+def account(*tasks):
+    """Mock client whose describe_export_tasks sweep returns (identifier, status) tasks."""
+    client = MagicMock()
+    client.get_paginator.return_value.paginate.return_value = [{'ExportTasks': [
+        {'ExportTaskIdentifier': identifier, 'Status': status} for identifier, status in tasks]}]
+    return client
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.patch_logger = patch.object(export.logger, 'propagate', False)
+        self.patch_logger.start()
+
+    def tearDown(self):
+        self.patch_logger.stop()
+
+    def test_task_identifier_is_stable_and_bounded(self):
+        self.assertEqual(export.task_identifier('backup-db-a-2023-01-01'), 'export-backup-db-a-2023-01-01')
+        long_name = 'backup-' + 'x' * 70 + '-2023-01-01'
+        identifier = export.task_identifier(long_name)
+        self.assertEqual(len(identifier), export.MAX_TASK_IDENTIFIER)
+        self.assertEqual(identifier, export.task_identifier(long_name))
+        self.assertNotEqual(identifier, export.task_identifier(long_name.replace('01-01', '01-02')))
+
+    def test_select_snapshots_by_status_and_age(self):
+        selected = export.select_snapshots(
+            [snapshot('fresh'), snapshot('old', hours_old=30), snapshot('creating', status='creating')],
+            max_age_hours=24, now=NOW)
+        self.assertEqual([item['Identifier'] for item in selected], ['fresh'])
+
+    def test_throughput(self):
+        task = {'TaskStartTime': NOW, 'TaskEndTime': NOW + datetime.timedelta(minutes=20),
+                'TotalExtractedDataInGB': 50}
+        self.assertEqual(export.throughput(task), {'ExtractedGB': 50, 'Minutes': 20.0, 'GBPerMinute': 2.5})
+        self.assertIsNone(export.throughput({'TaskStartTime': NOW}, NOW)['GBPerMinute'])
+
+    def test_running_tasks_of_the_account_count_against_the_limit(self):
+        client = account(('export-snap-a', 'COMPLETE'), ('export-snap-b', 'IN_PROGRESS'),
+                         ('someone-elses-export', 'STARTING'), ('export-snap-f', 'FAILED'))
+
+        results = export.start_exports(
+            [snapshot('snap-a'), snapshot('snap-b'), snapshot('snap-c'), snapshot('snap-d'), snapshot('snap-f')],
+            'bucket', 'arn:aws:iam::111111111111:role/export', 'key', max_concurrent=3, client=client)
+
+        self.assertEqual(results, {'snap-a': 'exported', 'snap-b': 'exporting', 'snap-c': 'started',
+                                   'snap-d': 'deferred', 'snap-f': 'failed: FAILED'})
+        client.start_export_task.assert_called_once_with(
+            ExportTaskIdentifier='export-snap-c',
+            SourceArn='arn:aws:rds:us-east-1:111111111111:snapshot:snap-c',
+            S3BucketName='bucket',
+            IamRoleArn='arn:aws:iam::111111111111:role/export',
+            KmsKeyId='key')
+
+    def test_export_many_queues_beyond_the_limit(self):
+        clock = {'now': 0.0}
+        fake = FakeRDS(export_delay=600, export_size_gb=30, clock=lambda: clock['now'])
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            clock['now'] += seconds
+
+        results, total_seconds = export.export_many(
+            [snapshot('snap-%d' % number) for number in range(7)], 'bucket', 'role', 'key', 'analytics',
+            max_concurrent=5, client=fake, min_delay=60, max_delay=600, clock=lambda: clock['now'], sleep=sleep)
+
+        self.assertEqual(fake.max_running_exports, 5)
+        self.assertEqual(len(fake.export_tasks), 7)
+        self.assertTrue(all(result['Status'] == export.COMPLETE for result in results.values()))
+        self.assertEqual(results['snap-0']['GBPerMinute'], 3.0)
+        self.assertEqual(fake.export_tasks['export-snap-6']['S3Prefix'], 'analytics')
+        # One describe sweep per round, not one per task
+        self.assertEqual(fake.calls['DescribeExportTasks'], len(sleeps) + 1)
+        self.assertEqual(total_seconds, sum(sleeps))
+        lines = export.format_report(results, total_seconds)
+        self.assertIn('7/7 exports complete, 210.0 GB', lines[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
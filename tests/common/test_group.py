@@ -0,0 +1,69 @@
+"""Unit tests for the common.group module."""
+
+import threading
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from common import group
+
+
+class TestGroup(unittest.TestCase):
+
+    def test_group_id(self):
+        self.assertEqual(group.group_id('orders service', '2023-01-01'), 'orders-service-2023-01-01')
+        with self.assertRaises(ValueError):
+            group.group_id('!!', '2023-01-01')
+
+    def test_calls_are_released_together(self):
+        started = []
+        lock = threading.Lock()
+
+        def func(item):
+            with lock:
+                started.append(item)
+                running = len(started)
+            if item == 'c':
+                raise RuntimeError('boom')
+            return running
+
+        outcomes, skew = group.create_simultaneously(func, ['a', 'b', 'c'])
+
+        self.assertEqual(sorted(started), ['a', 'b', 'c'])
+        self.assertIsInstance(outcomes['c'][1], RuntimeError)
+        self.assertIsNone(outcomes['a'][1])
+        self.assertGreaterEqual(skew['IssueSkewMs'], 0)
+        self.assertIn('ResponseSkewMs', skew)
+
+    def test_issue_time_is_the_send_time(self):
+        client = MagicMock()
+        group.instrument(client)
+        event, before_send = client.meta.events.register.call_args[0]
+        # Each worker's own view of the time
+        local = threading.local()
+
+        def func(item):
+            # Waiting for a rate limit token before the request goes out
+            local.now = 1.0 if item == 'b' else 0.0
+            before_send()
+            local.now += 5
+            before_send()
+            return item
+
+        _, skew = group.create_simultaneously(func, ['a', 'b'], clock=lambda: getattr(local, 'now', 0.0))
+
+        self.assertEqual(event, 'before-send')
+        self.assertEqual(skew['IssueSkewMs'], 1000)
+        # Sends outside a group are not recorded
+        before_send()
+
+    def test_group_size_is_bounded(self):
+        with self.assertRaises(ValueError):
+            group.create_simultaneously(lambda item: item, range(group.MAX_GROUP_SIZE + 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
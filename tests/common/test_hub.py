@@ -0,0 +1,51 @@
+"""Unit tests for the common.hub module."""
+
+import unittest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from common import hub
+
+
+class TestHub(unittest.TestCase):
+
+    def test_parse_accounts_builds_role_arns(self):
+        self.assertEqual(hub.parse_accounts(' 111111111111, arn:aws-cn:iam::222222222222:role/custom ,', 'backup'), [
+            ('111111111111', 'arn:aws:iam::111111111111:role/backup'),
+            ('222222222222', 'arn:aws-cn:iam::222222222222:role/custom')])
+        self.assertEqual(hub.parse_accounts(['333333333333'])[0][1],
+                         'arn:aws:iam::333333333333:role/rds-backup-hub')
+        self.assertEqual(hub.parse_accounts(None), [])
+
+    def test_parse_accounts_rejects_anything_else(self):
+        with self.assertRaisesRegex(ValueError, "12 digit account id"):
+            hub.parse_accounts('12345')
+
+    def test_fan_out_runs_every_account_and_region(self):
+        accounts = hub.parse_accounts('111111111111,222222222222')
+        factory = MagicMock(side_effect=lambda role_arn, region: (role_arn, region))
+
+        def work(account_id, region, client):
+            if account_id == '222222222222' and region == 'eu-west-1':
+                raise RuntimeError('AccessDenied')
+            return client
+
+        results = hub.fan_out(work, accounts, ['us-east-1', 'eu-west-1'], max_workers=2, client_factory=factory)
+
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results[('111111111111', 'eu-west-1')],
+                         (('arn:aws:iam::111111111111:role/rds-backup-hub', 'eu-west-1'), None))
+        self.assertIsInstance(results[('222222222222', 'eu-west-1')][1], RuntimeError)
+        self.assertEqual(factory.call_count, 4)
+
+    @patch('common.clients.get_client')
+    def test_client_for_uses_the_role_pool(self, mock_get_client):
+        hub.client_for('arn:aws:iam::111111111111:role/hub', 'us-east-1')
+        mock_get_client.assert_called_once_with('rds', 'us-east-1', 'arn:aws:iam::111111111111:role/hub')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""Unit tests for the common.inventory module."""
+
+import csv
+import datetime
+import io
+import json
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from botocore.exceptions import ClientError
+
+from common import inventory
+from tests.fake_rds import FakeRDS
+
+NOW = datetime.datetime(2023, 1, 2, 12, 0, tzinfo=datetime.timezone.utc)
+
+
+class TestInventory(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeRDS(instances=4, cluster_every=4)
+        self.fake.add_snapshot('instance', 'db-00002', 'old', NOW - datetime.timedelta(days=2))
+        self.fake.add_snapshot('instance', 'db-00002', 'new', NOW - datetime.timedelta(hours=6))
+        self.fake.add_snapshot('instance', 'db-00002', 'pending', NOW, status='creating')
+        self.fake.add_snapshot('cluster', 'cluster-00000', 'cluster-snap', NOW - datetime.timedelta(hours=1))
+
+    def test_records_cover_clusters_and_instances(self):
+        records = dict(((record['Kind'], record['Identifier']), record)
+                       for record in inventory.inventory(self.fake, now=NOW))
+
+        self.assertEqual(sorted(records), [('cluster', 'cluster-00000'), ('instance', 'db-00000'),
+                                           ('instance', 'db-00001'), ('instance', 'db-00002'),
+                                           ('instance', 'db-00003')])
+        self.assertEqual(records[('cluster', 'cluster-00000')]['Members'], 2)
+        self.assertEqual(records[('instance', 'db-00002')]['LatestSnapshot'], 'new')
+        self.assertEqual(records[('instance', 'db-00002')]['LatestSnapshotAgeHours'], 6.0)
+        # Cluster members report their cluster's snapshots
+        self.assertEqual(records[('instance', 'db-00001')]['Cluster'], 'cluster-00000')
+        self.assertEqual(records[('instance', 'db-00001')]['LatestSnapshotAgeHours'], 1.0)
+        self.assertIsNone(records[('instance', 'db-00003')]['LatestSnapshot'])
+        self.assertEqual(records[('instance', 'db-00003')]['Region'], 'us-east-1')
+
+    def test_one_sweep_regardless_of_fleet_size(self):
+        fake = FakeRDS(instances=250)
+
+        self.assertEqual(sum(1 for _ in inventory.inventory(fake, now=NOW)), 250)
+        self.assertEqual(fake.calls['DescribeDBInstances'], 3)
+        self.assertEqual(fake.calls['DescribeDBClusters'], 1)
+
+    def test_regions_are_swept_concurrently(self):
+        fakes = {'us-east-1': self.fake, 'eu-west-1': FakeRDS(instances=3, region='eu-west-1')}
+
+        records = list(inventory.inventory_regions(sorted(fakes), lambda region, role_arn: fakes[region],
+                                                   max_workers=2, now=NOW))
+
+        self.assertEqual(sum(1 for record in records if record['Region'] == 'eu-west-1'), 3)
+        self.assertEqual(sum(1 for record in records if record['Region'] == 'us-east-1'), 5)
+
+    def test_accounts_are_swept_through_their_roles(self):
+        roles = []
+
+        def client_for(region, role_arn):
+            roles.append(role_arn)
+            return FakeRDS(instances=2, region=region)
+
+        accounts = [('111111111111', 'arn:aws:iam::111111111111:role/hub'),
+                    ('222222222222', 'arn:aws:iam::222222222222:role/hub')]
+        records = list(inventory.inventory_regions(['us-east-1'], client_for, now=NOW, accounts=accounts))
+
+        self.assertEqual(sorted(roles), [role for _, role in accounts])
+        self.assertEqual(sorted(set(record['Account'] for record in records)), ['111111111111', '222222222222'])
+        self.assertEqual(len(records), 4)
+
+    def test_failed_region_is_raised_after_the_others(self):
+        def client_for(region, role_arn):
+            if region == 'eu-west-1':
+                raise ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'denied'}}, 'DescribeDBSnapshots')
+            return self.fake
+
+        records = []
+        with self.assertRaises(ClientError):
+            for record in inventory.inventory_regions(['us-east-1', 'eu-west-1'], client_for, now=NOW):
+                records.append(record)
+        self.assertEqual(len(records), 5)
+
+    def test_jsonl_and_csv_output(self):
+        jsonl, rows = io.StringIO(), io.StringIO()
+
+        self.assertEqual(inventory.write(inventory.inventory(self.fake, now=NOW), jsonl, 'jsonl'), 5)
+        inventory.write(inventory.inventory(self.fake, now=NOW), rows, 'csv')
+
+        lines = [json.loads(line) for line in jsonl.getvalue().splitlines()]
+        self.assertEqual(lines[0]['LatestSnapshotTime'], '2023-01-02T11:00:00+00:00')
+        parsed = list(csv.DictReader(io.StringIO(rows.getvalue())))
+        self.assertEqual(tuple(parsed[0]), inventory.FIELDS)
+        self.assertEqual(parsed[-1]['LatestSnapshot'], '')
+        with self.assertRaises(ValueError):
+            inventory.write([], io.StringIO(), 'xml')
+
+
+if __name__ == '__main__':
+    unittest.main()
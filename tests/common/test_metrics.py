@@ -0,0 +1,113 @@
+"""Unit tests for the common.metrics module."""
+
+import unittest
+import io
+import json
+import sys
+import os
+
+import boto3
+from botocore.awsrequest import AWSResponse
+from botocore.config import Config
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from common import metrics
+
+
+DESCRIBE_RESPONSE = (b'<DescribeDBInstancesResponse><DescribeDBInstancesResult><DBInstances/>'
+                     b'</DescribeDBInstancesResult><ResponseMetadata><RequestId>1</RequestId>'
+                     b'</ResponseMetadata></DescribeDBInstancesResponse>')
+THROTTLE_RESPONSE = (b'<ErrorResponse><Error><Type>Sender</Type><Code>Throttling</Code>'
+                     b'<Message>Rate exceeded</Message></Error><RequestId>2</RequestId></ErrorResponse>')
+
+
+class FakeRawResponse(object):
+    """Minimal urllib3-like body for AWSResponse."""
+
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, *args, **kwargs):
+        yield self.body
+
+
+def documents(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = io.StringIO()
+        self.metrics = metrics.Metrics(namespace='Test', enabled=True,
+                                       dimensions={'FunctionName': 'fn'}, stream=self.stream)
+
+    def test_flush_writes_emf(self):
+        self.metrics.add('Snapshots', 2)
+        self.metrics.add('Latency', 10.0, 'Milliseconds', 'CreateDBSnapshot')
+        self.metrics.add('Latency', 20.0, 'Milliseconds', 'CreateDBSnapshot')
+
+        self.metrics.flush()
+
+        create, entry = documents(self.stream)
+        self.assertEqual(create['Operation'], 'CreateDBSnapshot')
+        self.assertEqual(create['Latency'], [10.0, 20.0])
+        self.assertEqual(create['_aws']['CloudWatchMetrics'][0], {
+            'Namespace': 'Test',
+            'Dimensions': [['FunctionName', 'Operation']],
+            'Metrics': [{'Name': 'Latency', 'Unit': 'Milliseconds'}]})
+        self.assertEqual(entry['Snapshots'], 2)
+        self.assertEqual(entry['FunctionName'], 'fn')
+
+        # Values are reset after a flush
+        self.metrics.flush()
+        self.assertEqual(len(documents(self.stream)), 2)
+
+    def test_disabled_is_silent(self):
+        disabled = metrics.Metrics(enabled=False, stream=self.stream)
+        disabled.add('Snapshots', 1)
+        with disabled.timer('Duration'):
+            pass
+        disabled.flush()
+
+        self.assertEqual(self.stream.getvalue(), '')
+
+    def test_entry_point_flags_cold_start(self):
+        @self.metrics.entry_point('handler')
+        def handler(event, context):
+            return event
+
+        self.assertEqual(handler('first', None), 'first')
+        handler('second', None)
+
+        first, second = documents(self.stream)
+        self.assertEqual(first['ColdStart'], 1)
+        self.assertEqual(second['ColdStart'], 0)
+        self.assertIn('Duration', first)
+
+    def test_instrument_times_api_calls(self):
+        client = boto3.client('rds', region_name='us-east-1',
+                              aws_access_key_id='testing', aws_secret_access_key='testing',
+                              config=Config(retries={'total_max_attempts': 2, 'mode': 'standard'}))
+        self.metrics.instrument(client)
+        # Answer at the HTTP layer: one throttle, then success
+        replies = [(400, THROTTLE_RESPONSE), (200, DESCRIBE_RESPONSE)]
+
+        def fake_send(request, **kwargs):
+            status, body = replies.pop(0)
+            return AWSResponse(request.url, status, {}, FakeRawResponse(body))
+        client.meta.events.register('before-send.rds', fake_send)
+
+        client.describe_db_instances()
+
+        self.metrics.flush()
+        describe = documents(self.stream)[0]
+        self.assertEqual(describe['Operation'], 'DescribeDBInstances')
+        self.assertEqual(describe['ApiCalls'], 1)
+        self.assertEqual(describe['ApiThrottles'], 1)
+        self.assertEqual(describe['ApiRetries'], 1)
+        self.assertIn('ApiLatency', describe)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+"""Unit tests for the common.naming module."""
+
+import unittest
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from common import naming
+from tests.fake_rds import FakeRDS
+
+
+class TestSnapshotSuffix(unittest.TestCase):
+
+    def test_granularities(self):
+        now = datetime.datetime(2023, 1, 2, 13, 45)
+        self.assertEqual(naming.snapshot_suffix(now), '2023-01-02')
+        self.assertEqual(naming.snapshot_suffix(now, naming.HOURLY), '2023-01-02-13')
+        self.assertEqual(naming.snapshot_suffix(now, naming.REQUEST, 'A1B2_c3--d4'), '2023-01-02-a1b2-c3-d4')
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            naming.snapshot_suffix(datetime.datetime(2023, 1, 2), 'weekly')
+        with self.assertRaises(ValueError):
+            naming.snapshot_suffix(datetime.datetime(2023, 1, 2), naming.REQUEST, None)
+
+
+class TestSnapshotCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.now = [0.0]
+        self.catalog = naming.SnapshotCatalog(ttl=60, clock=lambda: self.now[0])
+        self.fake = FakeRDS(instances=1)
+        self.fake.add_snapshot('instance', 'db-00000', 'daily-2023-01-01', datetime.datetime(2023, 1, 1))
+
+    def test_listing_is_cached_until_ttl(self):
+        self.assertTrue(self.catalog.find('instance', 'db-00000', 'daily-', 'daily-2023-01-01', self.fake))
+        self.assertIsNone(self.catalog.find('instance', 'db-00000', 'daily-', 'daily-2023-01-02', self.fake))
+        self.assertEqual(self.fake.calls['DescribeDBSnapshots'], 1)
+
+        self.now[0] = 61
+        self.catalog.snapshots('instance', 'db-00000', 'daily-', self.fake)
+        self.assertEqual(self.fake.calls['DescribeDBSnapshots'], 2)
+
+    def test_add_discard_invalidate(self):
+        self.catalog.snapshots('instance', 'db-00000', 'daily-', self.fake)
+        self.catalog.add('instance', 'db-00000', 'daily-', {'Identifier': 'daily-2023-01-02', 'Kind': 'instance'})
+        self.assertTrue(self.catalog.find('instance', 'db-00000', 'daily-', 'daily-2023-01-02', self.fake))
+
+        self.catalog.discard(['daily-2023-01-01'])
+        self.assertIsNone(self.catalog.find('instance', 'db-00000', 'daily-', 'daily-2023-01-01', self.fake))
+        self.assertEqual(self.fake.calls['DescribeDBSnapshots'], 1)
+
+        self.catalog.invalidate('instance', 'db-00000', 'daily-')
+        self.assertTrue(self.catalog.find('instance', 'db-00000', 'daily-', 'daily-2023-01-01', self.fake))
+        self.assertEqual(self.fake.calls['DescribeDBSnapshots'], 2)
+
+    def test_as_response(self):
+        existing = self.catalog.find('instance', 'db-00000', 'daily-', 'daily-2023-01-01', self.fake)
+
+        response = naming.as_response(existing)
+
+        self.assertEqual(response['DBSnapshot']['DBSnapshotIdentifier'], 'daily-2023-01-01')
+        self.assertEqual(response['DBSnapshot']['DBInstanceIdentifier'], 'db-00000')
+        self.assertEqual(response['DBSnapshot']['Status'], 'available')
+
+
+    def test_only_available_or_creating_snapshots_are_reused(self):
+        existing = self.catalog.find('instance', 'db-00000', 'daily-', 'daily-2023-01-01', self.fake)
+
+        self.assertEqual(naming.reuse(existing), naming.as_response(existing))
+        self.assertTrue(naming.reusable(dict(existing, Status='creating')))
+        for status in ('failed', 'deleting', 'incompatible-restore'):
+            with self.assertRaisesRegex(naming.UnusableSnapshotError, status):
+                naming.reuse(dict(existing, Status=status))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+"""Unit tests for the common.profiling module."""
+
+import unittest
+from unittest.mock import patch
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from common import profiling
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.now = [100.0]
+
+    def profiler(self, modes, **kwargs):
+        return profiling.Profiler(modes, output_dir=self.directory, clock=lambda: self.now[0], **kwargs)
+
+    def test_parse_modes(self):
+        self.assertEqual(profiling.parse_modes('true'), profiling.MODES)
+        self.assertEqual(profiling.parse_modes(' Memory, cpu '), (profiling.CPU, profiling.MEMORY))
+        self.assertEqual(profiling.parse_modes('spans,disk'), (profiling.SPANS,))
+        for value in (None, '', 'false'):
+            self.assertEqual(profiling.parse_modes(value), ())
+
+    def test_disabled_profiler_does_nothing(self):
+        profiler = self.profiler(None)
+
+        @profiler.entry_point('main')
+        def main():
+            with profiler.span('work'):
+                profiler.phase('next')
+            return 'done'
+
+        with patch('common.profiling.cProfile.Profile') as profile:
+            self.assertEqual(main(), 'done')
+        profile.assert_not_called()
+        self.assertIsNone(profiler.last_report)
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_spans_and_phases(self):
+        profiler = self.profiler('spans')
+        profiler.add_span('import', 0.25)
+
+        @profiler.entry_point('query')
+        def query():
+            self.now[0] += 0.5
+
+        @profiler.entry_point('handler')
+        def handler():
+            self.now[0] += 1
+            profiler.phase('fleet')
+            with profiler.span('copies'):
+                query()
+            self.now[0] += 2
+
+        handler()
+
+        report = profiler.last_report
+        self.assertEqual(report['Name'], 'handler')
+        self.assertEqual(report['Milliseconds'], 3500)
+        self.assertEqual(report['Spans'], [('import', None, 250), ('start', 0, 1000), ('query', 1000, 500),
+                                           ('copies', 1000, 500), ('fleet', 1000, 2500)])
+        self.assertIsNone(report['StatsFile'])
+        # The nested entry point was not profiled on its own
+        handler()
+        self.assertEqual(profiler.last_report['Spans'][0], ('start', 0, 1000))
+
+    def test_cpu_and_memory(self):
+        profiler = profiling.Profiler('cpu,memory', output_dir=os.path.join(self.directory, 'profiles'), top=3)
+
+        def allocate():
+            return [bytearray(1024) for _ in range(512)]
+
+        @profiler.entry_point('main')
+        def main():
+            return len(allocate())
+
+        self.assertEqual(main(), 512)
+
+        report = profiler.last_report
+        self.assertGreater(report['PeakMemoryKiB'], 512)
+        self.assertEqual(len(report['TopAllocators']), 3)
+        self.assertTrue(report['TopAllocators'][0][0].startswith('test_profiling.py:'))
+        self.assertTrue(any('(allocate)' in where for where, _, _ in report['TopFunctions']))
+        self.assertGreater(pstats.Stats(report['StatsFile']).total_calls, 0)
+        self.assertFalse(tracemalloc.is_tracing())
+
+        lines = profiling.format_report(report)
+        self.assertIn('Profile of main', lines[0])
+        self.assertEqual(sum(1 for line in lines if line.startswith('  cpu')), 3)
+
+    def test_unwritable_directory_keeps_the_summary(self):
+        profiler = profiling.Profiler('cpu', output_dir=os.path.join(self.directory, 'file'))
+        open(os.path.join(self.directory, 'file'), 'w').close()
+
+        with self.assertRaises(RuntimeError):
+            profiler.entry_point('main')(self.fail_with)()
+
+        self.assertIsNone(profiler.last_report['StatsFile'])
+        self.assertTrue(profiler.last_report['TopFunctions'])
+
+    @staticmethod
+    def fail_with():
+        raise RuntimeError('boom')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+"""Unit tests for the common.ratelimit module."""
+
+import io
+import json
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import boto3
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+from common import clients, metrics, ratelimit
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestAdaptiveRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = ratelimit.AdaptiveRateLimiter(read_rate=10, write_rate=4, min_rate=1,
+                                                     clock=self.clock, sleep=self.clock.sleep)
+
+    def test_operations_are_split_into_read_and_write_budgets(self):
+        self.assertEqual(ratelimit.budget('DescribeDBInstances'), ratelimit.READ)
+        self.assertEqual(ratelimit.budget('ListTagsForResource'), ratelimit.READ)
+        self.assertEqual(ratelimit.budget('CreateDBSnapshot'), ratelimit.WRITE)
+        self.assertEqual(ratelimit.budget('RestoreDBClusterToPointInTime'), ratelimit.WRITE)
+
+    def test_throttles_halve_the_rate_down_to_the_floor(self):
+        for _ in range(5):
+            self.limiter.throttled('CreateDBSnapshot')
+
+        stats = self.limiter.stats()
+        self.assertEqual(stats['write']['Rate'], 1.0)
+        self.assertEqual(stats['write']['Throttles'], 5)
+        self.assertEqual(stats['read']['Rate'], 10.0)
+
+    def test_successes_recover_the_rate_up_to_the_ceiling(self):
+        self.limiter.throttled('DescribeDBInstances')
+        self.limiter.succeeded('DescribeDBInstances')
+        self.assertEqual(self.limiter.stats()['read']['Rate'], 5.5)
+
+        for _ in range(20):
+            self.limiter.succeeded('DescribeDBInstances')
+        self.assertEqual(self.limiter.stats()['read']['Rate'], 10.0)
+
+    def test_acquire_paces_calls_at_the_reduced_rate(self):
+        self.limiter.throttled('CreateDBSnapshot')
+        for _ in range(6):
+            self.limiter.acquire('CreateDBSnapshot')
+
+        # Burst of 4, then one call every 1 / 2 s
+        self.assertEqual(self.clock.sleeps, [0.5, 0.5])
+
+    def test_unpaced_calls_are_charged_not_delayed(self):
+        with ratelimit.unpaced():
+            for _ in range(8):
+                self.assertEqual(self.limiter.acquire('CreateDBSnapshot'), 0.0)
+        self.assertEqual(self.clock.sleeps, [])
+
+        # The next call waits out the debt of the four calls beyond the burst
+        self.limiter.acquire('CreateDBSnapshot')
+        self.assertEqual(self.clock.sleeps, [1.25])
+
+    def test_queue_depth_counts_waiting_callers(self):
+        entered, release = threading.Event(), threading.Event()
+        limiter = ratelimit.AdaptiveRateLimiter(read_rate=1, write_rate=1,
+                                                sleep=lambda seconds: (entered.set(), release.wait()))
+        limiter.acquire('DescribeDBInstances')
+        worker = threading.Thread(target=limiter.acquire, args=('DescribeDBInstances',))
+        worker.start()
+        entered.wait(5)
+
+        self.assertEqual(limiter.stats()['read']['QueueDepth'], 1)
+        release.set()
+        worker.join(5)
+        self.assertEqual(limiter.stats()['read']['QueueDepth'], 0)
+
+    def test_publish_records_gauges_on_flush(self):
+        stream = io.StringIO()
+        collected = metrics.Metrics(enabled=True, stream=stream)
+        collected.add_collector(self.limiter.publish)
+
+        collected.flush()
+
+        documents = dict((document['Operation'], document)
+                         for document in map(json.loads, stream.getvalue().splitlines()))
+        self.assertEqual(documents['WriteOperations']['RateLimit'], 4.0)
+        self.assertEqual(documents['ReadOperations']['RateLimitQueueDepth'], 0)
+
+
+class TestInstrument(unittest.TestCase):
+
+    def setUp(self):
+        self.client = boto3.session.Session(region_name='us-east-1').client(
+            'rds', aws_access_key_id='key', aws_secret_access_key='secret')
+        self.limiter = ratelimit.AdaptiveRateLimiter(read_rate=10, write_rate=4)
+        self.limiter.instrument(self.client)
+        self.stubber = Stubber(self.client)
+        self.stubber.activate()
+
+    def tearDown(self):
+        self.stubber.deactivate()
+
+    def test_calls_take_tokens_and_report_their_outcome(self):
+        self.limiter.acquire = MagicMock(wraps=self.limiter.acquire)
+        self.stubber.add_client_error('create_db_snapshot', 'Throttling')
+        self.stubber.add_response('describe_db_instances', {'DBInstances': []})
+
+        with self.assertRaises(ClientError):
+            self.client.create_db_snapshot(DBSnapshotIdentifier='snap', DBInstanceIdentifier='db')
+        self.client.describe_db_instances()
+
+        self.assertEqual([call[0][0] for call in self.limiter.acquire.call_args_list],
+                         ['CreateDBSnapshot', 'DescribeDBInstances'])
+        stats = self.limiter.stats()
+        self.assertEqual(stats['write']['Rate'], 2.0)
+        self.assertEqual(stats['write']['Throttles'], 1)
+        self.assertEqual(stats['read']['Throttles'], 0)
+
+    def test_accounts_and_regions_have_budgets_of_their_own(self):
+        clients.reset()
+        self.addCleanup(clients.reset)
+        members = {}
+        for role_arn in ('arn:aws:iam::111111111111:role/hub', 'arn:aws:iam::222222222222:role/hub'):
+            member = boto3.session.Session(region_name='eu-west-1').client(
+                'rds', aws_access_key_id='key', aws_secret_access_key='secret')
+            clients.install(member, 'rds', 'eu-west-1', role_arn)
+            self.limiter.instrument(member)
+            members[role_arn] = Stubber(member)
+            members[role_arn].activate()
+            self.addCleanup(members[role_arn].deactivate)
+        first = 'arn:aws:iam::111111111111:role/hub'
+        members[first].add_client_error('create_db_snapshot', 'Throttling')
+
+        with self.assertRaises(ClientError):
+            members[first].client.create_db_snapshot(DBSnapshotIdentifier='snap', DBInstanceIdentifier='db')
+
+        self.assertIs(self.limiter.partition(first, 'eu-west-1'), self.limiter.partition(first, 'eu-west-1'))
+        self.assertEqual(self.limiter.partition(first, 'eu-west-1').stats()['write']['Rate'], 2.0)
+        self.assertEqual(self.limiter.partition('arn:aws:iam::222222222222:role/hub', 'eu-west-1')
+                         .stats()['write']['Rate'], 4.0)
+        self.assertEqual(self.limiter.partition(first, 'us-east-1').stats()['write']['Rate'], 4.0)
+        # The default account's budget is untouched
+        self.assertEqual(self.limiter.stats()['write']['Throttles'], 0)
+
+    def test_other_services_and_stand_ins_are_left_alone(self):
+        sts = boto3.session.Session(region_name='us-east-1').client(
+            'sts', aws_access_key_id='key', aws_secret_access_key='secret')
+        self.limiter.instrument(sts)
+        self.limiter.instrument(object())
+
+        self.assertEqual(self.limiter.stats()['read']['Throttles'], 0)
+
+
+class TestFromEnvironment(unittest.TestCase):
+
+    @patch('common.clients.add_client_hook')
+    def test_scripts_rate_limit_every_call_by_default(self, add_client_hook):
+        recorder, limiter = ratelimit.from_environment('query_db', {'RDS_READ_RATE': '4'})
+
+        self.assertEqual(limiter.max_rates[ratelimit.READ], 4.0)
+        self.assertFalse(recorder.enabled)
+        self.assertEqual([call_args[0][0] for call_args in add_client_hook.call_args_list], [limiter.instrument])
+
+    @patch('common.clients.add_client_hook')
+    def test_switches(self, add_client_hook):
+        recorder, limiter = ratelimit.from_environment('rds_export', {'RDS_RATE_LIMIT': 'false',
+                                                                      'ENABLE_METRICS': 'true'})
+
+        self.assertEqual(recorder.dimensions, {'Script': 'rds_export'})
+        self.assertEqual([call_args[0][0] for call_args in add_client_hook.call_args_list], [recorder.instrument])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+"""Unit tests for the common.replication module."""
+
+import unittest
+from unittest.mock import patch, MagicMock
+from botocore.exceptions import ClientError
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from common import replication
+
+
+def snapshot(identifier, kind='instance', status='available'):
+    return {'Identifier': identifier, 'Kind': kind, 'Status': status,
+            'Arn': 'arn:aws:rds:us-east-1:111111111111:snapshot:' + identifier}
+
+
+def destination(*existing):
+    """Mock destination client whose describe call returns the existing copies."""
+    client = MagicMock()
+    client.get_paginator.return_value.paginate.return_value = [{'DBSnapshots': [
+        {'DBSnapshotIdentifier': identifier, 'Status': status} for identifier, status in existing]}]
+    return client
+
+
+class TestReplication(unittest.TestCase):
+
+    def setUp(self):
+        self.patch_logger = patch.object(replication.logger, 'propagate', False)
+        self.patch_logger.start()
+
+    def tearDown(self):
+        self.patch_logger.stop()
+
+    def test_existing_copies_are_skipped(self):
+        client = destination(('snap-a', 'available'), ('snap-b', 'creating'))
+
+        results = replication.copy_to_region(
+            [snapshot('snap-a'), snapshot('snap-b'), snapshot('snap-c')],
+            'us-east-1', 'us-west-2', client=client)
+
+        self.assertEqual(results, {'snap-a': 'exists', 'snap-b': 'copying', 'snap-c': 'started'})
+        client.copy_db_snapshot.assert_called_once_with(
+            SourceDBSnapshotIdentifier='arn:aws:rds:us-east-1:111111111111:snapshot:snap-c',
+            TargetDBSnapshotIdentifier='snap-c',
+            SourceRegion='us-east-1',
+            CopyTags=True)
+
+    def test_in_flight_copies_count_against_cap(self):
+        client = destination(('snap-a', 'creating'))
+
+        results = replication.copy_to_region(
+            [snapshot('snap-a'), snapshot('snap-b'), snapshot('snap-c')],
+            'us-east-1', 'us-west-2', max_concurrent=2, client=client)
+
+        self.assertEqual(results, {'snap-a': 'copying', 'snap-b': 'started', 'snap-c': 'deferred'})
+
+    def test_cluster_copy_with_kms_key(self):
+        client = MagicMock()
+        client.get_paginator.return_value.paginate.return_value = [{}]
+
+        replication.copy_to_region([snapshot('snap-c', kind='cluster')], 'us-east-1', 'eu-west-1',
+                                   kms_key_id='key-eu', client=client)
+
+        client.get_paginator.assert_any_call('describe_db_cluster_snapshots')
+        client.copy_db_cluster_snapshot.assert_called_once_with(
+            SourceDBClusterSnapshotIdentifier='arn:aws:rds:us-east-1:111111111111:snapshot:snap-c',
+            TargetDBClusterSnapshotIdentifier='snap-c',
+            SourceRegion='us-east-1',
+            CopyTags=True,
+            KmsKeyId='key-eu')
+
+    @patch('common.clients.get_client')
+    def test_copy_snapshots_fans_out_per_region(self, mock_get_client):
+        regional = {'us-west-2': destination(), 'eu-west-1': destination()}
+        regional['eu-west-1'].copy_db_snapshot.side_effect = ClientError(
+            {'Error': {'Code': 'SnapshotQuotaExceeded', 'Message': 'quota'}}, 'copy_db_snapshot')
+        mock_get_client.side_effect = lambda service, region: regional[region]
+
+        report = replication.copy_snapshots(
+            [snapshot('snap-a'), snapshot('snap-new', status='creating')],
+            'us-east-1', ['us-west-2', 'eu-west-1'])
+
+        self.assertEqual(report['us-west-2'], {'snap-a': 'started'})
+        self.assertTrue(report['eu-west-1']['snap-a'].startswith('failed: '))
+        # Snapshots still creating at the source are left for the next run
+        regional['us-west-2'].copy_db_snapshot.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+"""Unit tests for the common.restore module."""
+
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from botocore.exceptions import ClientError
+
+from common import restore
+from tests.fake_rds import FakeRDS
+
+
+class FakeClock(object):
+    """Shared clock for the stand-in and the orchestrator, advanced by sleep()."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestLoadManifest(unittest.TestCase):
+
+    def test_formats(self):
+        expected = [('db-a', 'db-a-dr'), ('db-b', 'db-b-dr')]
+        self.assertEqual(restore.load_manifest('{"db-b": "db-b-dr", "db-a": "db-a-dr"}'), expected)
+        self.assertEqual(restore.load_manifest(
+            '[{"Source": "db-a", "Target": "db-a-dr"}, ["db-b", "db-b-dr"]]'), expected)
+
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as manifest:
+            manifest.write('{"db-a": "db-a-dr"}')
+        self.addCleanup(os.remove, manifest.name)
+        self.assertEqual(restore.load_manifest(manifest.name), expected[:1])
+
+    def test_rejects_duplicate_targets(self):
+        with self.assertRaises(ValueError):
+            restore.load_manifest('{"db-a": "dr", "db-b": "dr"}')
+
+
+class TestRestoreMany(unittest.TestCase):
+
+    def setUp(self):
+        self.patch_logger = patch.object(restore.logger, 'propagate', False)
+        self.patch_logger.start()
+        self.clock = FakeClock()
+        # db-00000/db-00001 form cluster-00000, the others are standalone
+        self.fake = FakeRDS(instances=5, cluster_every=5, restore_delay=100, clock=self.clock)
+
+    def tearDown(self):
+        self.patch_logger.stop()
+
+    def restore_many(self, pairs, **kwargs):
+        return restore.restore_many(pairs, self.fake, rate=1000, min_delay=15, max_delay=60,
+                                    clock=self.clock, sleep=self.clock.sleep, **kwargs)
+
+    def test_restores_concurrently_and_tracks_together(self):
+        pairs = [('db-%05d' % number, 'dr-%05d' % number) for number in (2, 3, 4)]
+
+        results, total = self.restore_many(pairs)
+
+        self.assertEqual(set(result['Status'] for result in results.values()), {'available'})
+        self.assertEqual(results['dr-00004']['Type'], 'instance')
+        self.assertEqual(results['dr-00004']['Seconds'], 121.875)
+        self.assertEqual(total, 121.875)
+        # One batched describe per poll, not one per database
+        self.assertEqual(self.clock.sleeps, [15, 22.5, 33.75, 50.625])
+        self.assertEqual(self.fake.calls['DescribeDBInstances'], 4 + len(pairs))
+
+    def test_one_source_into_two_targets(self):
+        results, _ = self.restore_many([('db-00003', 'copy-a'), ('db-00003', 'copy-b')])
+
+        self.assertEqual(sorted(results), ['copy-a', 'copy-b'])
+        self.assertEqual([result['Source'] for result in results.values()], ['db-00003', 'db-00003'])
+        self.assertEqual(set(result['Status'] for result in results.values()), {'available'})
+        lines = restore.format_report(results, 200)
+        self.assertEqual(lines[-1], '2/2 restores available, total recovery time 200 s')
+
+    def test_cluster_members_are_recreated_in_parallel(self):
+        self.fake.add_instance('cluster-00000-reader-2', 'cluster-00000')
+        self.fake.instances['db-00001']['DBParameterGroups'] = [{'DBParameterGroupName': 'custom-pg'}]
+
+        results, total = self.restore_many([('db-00001', 'dr-cluster')])
+
+        result = results['dr-cluster']
+        self.assertEqual((result['Type'], result['Status']), ('cluster', 'available'))
+        # Writer first, then readers in promotion tier order, all in the same poll
+        self.assertEqual(result['Instances'], ['dr-cluster-db-00000', 'dr-cluster-db-00001', 'dr-cluster-reader-2'])
+        self.assertEqual(self.fake.calls['CreateDBInstance'], 3)
+        created = self.fake.instances['dr-cluster-db-00001']
+        self.assertEqual(created['DBClusterIdentifier'], 'dr-cluster')
+        self.assertEqual(created['DBParameterGroups'], [{'DBParameterGroupName': 'custom-pg'}])
+        self.assertEqual(created['DBInstanceClass'], 'db.r6g.large')
+        # Cluster restore (100 s) plus one instance boot (100 s), not three
+        self.assertLess(total, 300)
+        self.assertEqual(result['Seconds'], total)
+
+    def test_cluster_without_members(self):
+        results, _ = self.restore_many([('db-00001', 'dr-cluster')], with_members=False)
+
+        self.assertEqual(results['dr-cluster']['Status'], 'available')
+        self.assertEqual(results['dr-cluster']['Instances'], [])
+        self.assertEqual(self.fake.calls['CreateDBInstance'], 0)
+
+    def test_complete_cluster(self):
+        specs = restore.cluster_members('cluster-00000', 'dr-cluster', self.fake)
+        self.fake.restore_db_cluster_to_point_in_time(DBClusterIdentifier='dr-cluster',
+                                                      SourceDBClusterIdentifier='cluster-00000')
+
+        result = restore.complete_cluster('dr-cluster', specs, self.fake, rate=1000, min_delay=15,
+                                          clock=self.clock, sleep=self.clock.sleep)
+
+        self.assertEqual(result['Status'], 'available')
+        self.assertEqual(sorted(self.fake.clusters['dr-cluster']['DBClusterMembers'][0].items()),
+                         [('DBInstanceIdentifier', 'dr-cluster-db-00000'), ('IsClusterWriter', True),
+                          ('PromotionTier', 1)])
+
+    def test_clone_is_faster_than_full_restore(self):
+        self.fake.clone_delay = 10
+        results, _ = self.restore_many([('db-00001', 'dr-clone')], with_members=False, clone=True)
+
+        self.assertEqual(results['dr-clone']['RestoreType'], 'copy-on-write')
+        self.assertEqual(self.fake.clusters['dr-clone']['CloneGroupId'], 'clone-group')
+        self.assertEqual(results['dr-clone']['Seconds'], 15)
+
+    def test_clone_falls_back_to_full_restore(self):
+        self.fake.clone_supported = False
+
+        response, restore_type = restore.restore_cluster('cluster-00000', 'dr-full', self.fake, clone=True)
+
+        self.assertEqual(restore_type, 'full')
+        self.assertIsNone(response['DBCluster']['CloneGroupId'])
+        self.assertEqual(self.fake.calls['RestoreDBClusterToPointInTime'], 2)
+
+    def test_clone_does_not_hide_other_errors(self):
+        with self.assertRaises(ClientError):
+            restore.restore_cluster('cluster-missing', 'dr-full', self.fake, clone=True)
+        self.assertEqual(self.fake.calls['RestoreDBClusterToPointInTime'], 1)
+
+    def test_member_identifier(self):
+        self.assertEqual(restore.member_identifier('orders-reader-1', 'orders', 'orders-dr'), 'orders-dr-reader-1')
+        self.assertEqual(restore.member_identifier('db-1', 'orders', 'orders-dr'), 'orders-dr-db-1')
+        self.assertEqual(len(restore.member_identifier('x' * 40, 'orders', 'y' * 40)), 63)
+
+    def test_failed_start_does_not_block_others(self):
+        results, _ = self.restore_many([('db-missing', 'dr-a'), ('db-00003', 'dr-b')])
+
+        self.assertTrue(results['dr-a']['Status'].startswith('failed: '))
+        self.assertEqual(results['dr-b']['Status'], 'available')
+
+    def test_timeout(self):
+        results, total = self.restore_many([('db-00003', 'dr-b')], timeout=50)
+
+        self.assertEqual(results['dr-b']['Status'], 'timeout')
+        self.assertIsNone(results['dr-b']['Seconds'])
+        self.assertLessEqual(total, 50)
+
+    def test_format_report(self):
+        lines = restore.format_report({'dr-a': {'Source': 'db-a', 'Target': 'dr-a', 'Type': 'instance',
+                                                'RestoreType': 'full', 'Status': 'available', 'Seconds': 61.2}}, 75)
+        self.assertEqual(len(lines), 3)
+        self.assertIn('61', lines[1])
+        self.assertEqual(lines[-1], '1/1 restores available, total recovery time 75 s')
+
+
+if __name__ == '__main__':
+    unittest.main()
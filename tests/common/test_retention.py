@@ -0,0 +1,120 @@
+"""Unit tests for the common.retention module."""
+
+import unittest
+from unittest.mock import patch, MagicMock
+import datetime
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from common import retention
+from common.ratelimit import TokenBucket
+
+
+def synthetic_snapshots(count, start=datetime.datetime(2020, 1, 1), step=datetime.timedelta(hours=1)):
+    """One snapshot per step, oldest first."""
+    return [{'Identifier': 'snap-%06d' % number, 'Kind': 'instance',
+             'CreateTime': start + number * step, 'Status': 'available'}
+            for number in range(count)]
+
+
+class TestSelectExpired(unittest.TestCase):
+
+    def test_daily_weekly_monthly_buckets(self):
+        # One snapshot a day for a whole year, the newest is 2023-12-31 (a Sunday)
+        snapshots = synthetic_snapshots(365, datetime.datetime(2023, 1, 1), datetime.timedelta(days=1))
+
+        expired = retention.select_expired(snapshots, daily=7, weekly=4, monthly=3)
+        kept = set(snapshot['Identifier'] for snapshot in snapshots) - \
+            set(snapshot['Identifier'] for snapshot in expired)
+        kept_days = sorted(snapshot['CreateTime'].date() for snapshot in snapshots
+                           if snapshot['Identifier'] in kept)
+
+        # Last 7 days, plus the newest of the 3 earlier ISO weeks, plus the
+        # newest of November and October.
+        self.assertEqual(kept_days, [
+            datetime.date(2023, 10, 31), datetime.date(2023, 11, 30),
+            datetime.date(2023, 12, 10), datetime.date(2023, 12, 17),
+            datetime.date(2023, 12, 24)] +
+            [datetime.date(2023, 12, day) for day in range(25, 32)])
+        self.assertEqual(len(expired), 365 - 12)
+
+    def test_tens_of_thousands_of_snapshots(self):
+        snapshots = synthetic_snapshots(50000)
+
+        expired = retention.select_expired(snapshots, daily=30, weekly=12, monthly=24)
+
+        # Every kept snapshot is the newest of its bucket, so at most 66 survive
+        self.assertLessEqual(len(snapshots) - len(expired), 30 + 12 + 24)
+        self.assertGreaterEqual(len(snapshots) - len(expired), 30)
+        self.assertEqual(expired[0]['CreateTime'] > expired[-1]['CreateTime'], True)
+
+    def test_incomplete_snapshots_are_never_expired(self):
+        snapshots = synthetic_snapshots(10, step=datetime.timedelta(days=1))
+        snapshots[0]['Status'] = 'creating'
+        snapshots.append({'Identifier': 'no-time', 'Kind': 'instance', 'CreateTime': None})
+
+        expired = retention.select_expired(snapshots, daily=1, weekly=0, monthly=0)
+
+        identifiers = [snapshot['Identifier'] for snapshot in expired]
+        self.assertEqual(len(identifiers), 8)
+        self.assertNotIn('snap-000000', identifiers)
+        self.assertNotIn('no-time', identifiers)
+
+
+class TestListAndDelete(unittest.TestCase):
+
+    def setUp(self):
+        self.patch_logger = patch.object(retention.logger, 'propagate', False)
+        self.patch_logger.start()
+
+    def tearDown(self):
+        self.patch_logger.stop()
+
+    def test_list_snapshots_filters_prefix(self):
+        mock_rds_client = MagicMock()
+        mock_rds_client.get_paginator.return_value.paginate.return_value = [
+            {'DBSnapshots': [{'DBSnapshotIdentifier': 'daily-2023-01-01', 'Status': 'available',
+                              'SnapshotCreateTime': datetime.datetime(2023, 1, 1)}]},
+            {'DBSnapshots': [{'DBSnapshotIdentifier': 'other-2023-01-01', 'Status': 'available'}]},
+        ]
+
+        snapshots = retention.list_snapshots('instance', 'db-a', 'daily-', mock_rds_client)
+
+        mock_rds_client.get_paginator.assert_called_once_with('describe_db_snapshots')
+        mock_rds_client.get_paginator.return_value.paginate.assert_called_once_with(
+            DBInstanceIdentifier='db-a', SnapshotType='manual')
+        self.assertEqual([snapshot['Identifier'] for snapshot in snapshots], ['daily-2023-01-01'])
+
+    def test_delete_snapshots_uses_matching_api(self):
+        mock_rds_client = MagicMock()
+        results = retention.delete_snapshots(
+            [{'Identifier': 'a', 'Kind': 'instance'}, {'Identifier': 'b', 'Kind': 'cluster'}],
+            mock_rds_client, max_workers=2, rate=100)
+
+        mock_rds_client.delete_db_snapshot.assert_called_once_with(DBSnapshotIdentifier='a')
+        mock_rds_client.delete_db_cluster_snapshot.assert_called_once_with(DBClusterSnapshotIdentifier='b')
+        self.assertEqual(sorted(results), ['a', 'b'])
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_acquire_waits_once_burst_is_spent(self):
+        clock = MagicMock(return_value=0.0)
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            clock.return_value += seconds
+
+        bucket = TokenBucket(rate=2, capacity=2, clock=clock, sleep=sleep)
+
+        self.assertEqual(bucket.acquire(), 0.0)
+        self.assertEqual(bucket.acquire(), 0.0)
+        self.assertAlmostEqual(bucket.acquire(), 0.5)
+        self.assertEqual(len(sleeps), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+"""Unit tests for the common.serialization module."""
+
+import unittest
+import datetime
+import decimal
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from common import serialization
+
+
+def response_body(data, reason='ok'):
+    return {'Status': 'SUCCESS', 'Reason': reason, 'PhysicalResourceId': 'log-stream',
+            'StackId': 'stack-id', 'RequestId': 'request-id', 'LogicalResourceId': 'logical-id',
+            'Data': data}
+
+
+class TestSerialization(unittest.TestCase):
+
+    def test_dumps_botocore_types(self):
+        encoded = serialization.dumps({
+            'When': datetime.datetime(2023, 1, 1, 12, 30),
+            'Day': datetime.date(2023, 1, 2),
+            'Size': decimal.Decimal('1.5'),
+            'Blob': b'\x00\x01',
+            'Zones': set(['b', 'a']),
+        })
+
+        self.assertEqual(json.loads(encoded), {
+            'When': '2023-01-01T12:30:00', 'Day': '2023-01-02', 'Size': 1.5,
+            'Blob': 'AAE=', 'Zones': ['a', 'b']})
+
+    def test_project_keeps_snapshot_fields(self):
+        projected = serialization.project({
+            'DBSnapshot': {'DBSnapshotIdentifier': 'snap', 'Status': 'creating',
+                           'AvailabilityZone': 'us-east-1a', 'TagList': [], 'ProcessorFeatures': []},
+            'ResponseMetadata': {'HTTPHeaders': {}},
+        })
+
+        self.assertEqual(projected, {'DBSnapshot': {'DBSnapshotIdentifier': 'snap', 'Status': 'creating'}})
+
+    def test_encode_response_fits_budget(self):
+        data = dict(('target-%04d' % number, {'Status': 'SUCCESS', 'SnapshotIdentifier': 'x' * 40})
+                    for number in range(200))
+
+        encoded = serialization.encode_response(response_body(data))
+        decoded = json.loads(encoded.decode('utf-8'))
+
+        self.assertLessEqual(len(encoded), serialization.RESPONSE_BUDGET)
+        self.assertIn(serialization.TRUNCATED_KEY, decoded['Data'])
+        kept = set(decoded['Data']) - set([serialization.TRUNCATED_KEY])
+        self.assertTrue(kept)
+        self.assertTrue(kept.isdisjoint(decoded['Data'][serialization.TRUNCATED_KEY].split(',')) or
+                        decoded['Data'][serialization.TRUNCATED_KEY].endswith(' keys'))
+
+    def test_encode_response_drops_largest_entries_first(self):
+        data = {'small': 'a', 'large': 'b' * 5000}
+
+        decoded = json.loads(serialization.encode_response(response_body(data)).decode('utf-8'))
+
+        self.assertEqual(decoded['Data'], {'small': 'a', serialization.TRUNCATED_KEY: 'large'})
+
+    def test_long_reason_is_trimmed(self):
+        decoded = json.loads(serialization.encode_response(response_body({}, reason='r' * 5000)).decode('utf-8'))
+
+        self.assertEqual(len(decoded['Reason']), serialization.MAX_REASON)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+"""Unit tests for the common.timeline module."""
+
+import unittest
+from unittest.mock import patch
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from common import restore, timeline
+from tests.fake_rds import FakeRDS
+
+UTC = datetime.timezone.utc
+
+
+def at(day, hour=0):
+    return datetime.datetime(2023, 1, day, hour, tzinfo=UTC)
+
+
+class TestTimeline(unittest.TestCase):
+
+    def setUp(self):
+        self.patch_logger = patch.object(timeline.logger, 'propagate', False)
+        self.patch_logger.start()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        # Point in time restores possible from Jan 8th, daily snapshots from Jan 1st
+        self.fake = FakeRDS(instances=3, cluster_every=3, backup_window=(at(8), at(10, 12)))
+        for day in range(1, 11):
+            self.fake.add_snapshot('cluster', 'cluster-00000', 'daily-2023-01-%02d' % day, at(day, 2))
+        self.fake.add_snapshot('cluster', 'cluster-00000', 'adhoc-2023-01-05', at(5, 12))
+        self.fake.add_snapshot('cluster', 'cluster-00000', 'daily-failed', at(6, 2), status='failed')
+        self.fake.add_snapshot('instance', 'db-00002', 'daily-2023-01-03', at(3, 2))
+
+    def tearDown(self):
+        self.patch_logger.stop()
+
+    def test_parse_time(self):
+        self.assertEqual(timeline.parse_time('2023-01-05T03:00:00Z'), at(5, 3))
+        self.assertEqual(timeline.parse_time('2023-01-05 03:00'), at(5, 3))
+        self.assertEqual(timeline.parse_time('2023-01-05T05:00:00+02:00'), at(5, 3))
+
+    def test_build_keeps_available_prefixed_snapshots(self):
+        index = timeline.Timeline.build('cluster', 'cluster-00000', 'daily-', self.fake)
+
+        self.assertEqual(len(index.snapshots), 10)
+        self.assertEqual(index.window, (at(8), at(10, 12)))
+        self.assertEqual(index.engine, 'aurora-postgresql')
+        self.assertEqual(self.fake.calls['DescribeDBClusterSnapshots'], 1)
+
+    def test_choose(self):
+        index = timeline.Timeline.build('cluster', 'cluster-00000', 'daily-', self.fake)
+
+        # Covered by the backup window: restore to exactly that time
+        self.assertEqual(index.choose(at(9, 7)), {'Source': 'pitr', 'Time': at(9, 7)})
+        # Older: the last daily snapshot before 03:00 on the 5th
+        self.assertEqual(index.choose('2023-01-05T03:00:00Z'),
+                         {'Source': 'snapshot', 'Time': at(5, 2), 'SnapshotIdentifier': 'daily-2023-01-05'})
+        self.assertEqual(index.choose(at(5, 1))['SnapshotIdentifier'], 'daily-2023-01-04')
+        self.assertEqual(index.choose(at(9, 7), 'snapshot')['SnapshotIdentifier'], 'daily-2023-01-09')
+        with self.assertRaises(ValueError):
+            index.choose(at(5), 'pitr')
+        with self.assertRaises(ValueError):
+            index.choose(at(1, 1))
+
+    def test_snapshot_before_matches_linear_scan(self):
+        start = datetime.datetime(2020, 1, 1, tzinfo=UTC)
+        snapshots = [(start + datetime.timedelta(hours=7 * number), 's%05d' % number) for number in range(5000)]
+        index = timeline.Timeline('instance', 'db', 'x', reversed(snapshots))
+
+        for hours in (0, 1, 6, 7, 8, 34999, 35000, 40000):
+            when = start + datetime.timedelta(hours=hours)
+            expected = [snapshot for snapshot in snapshots if snapshot[0] <= when][-1:]
+            self.assertEqual(index.snapshot_before(when), expected[0] if expected else None)
+
+    def test_cache_avoids_api_calls(self):
+        path = os.path.join(self.directory, 'timeline.json')
+        clock = [1000.0]
+        first = timeline.get_timeline('cluster', 'cluster-00000', 'daily-', self.fake, path, ttl=60,
+                                      clock=lambda: clock[0])
+        calls = sum(self.fake.calls.values())
+
+        clock[0] += 30
+        cached = timeline.get_timeline('cluster', 'cluster-00000', 'daily-', self.fake, path, ttl=60,
+                                       clock=lambda: clock[0])
+        self.assertEqual(sum(self.fake.calls.values()), calls)
+        self.assertEqual(cached.snapshots, first.snapshots)
+        self.assertEqual(cached.window, first.window)
+        self.assertEqual(cached.choose(at(5, 3)), first.choose(at(5, 3)))
+
+        # Another prefix, or an expired entry, is rebuilt
+        timeline.get_timeline('cluster', 'cluster-00000', 'adhoc-', self.fake, path, ttl=60, clock=lambda: clock[0])
+        clock[0] += 120
+        timeline.get_timeline('cluster', 'cluster-00000', 'adhoc-', self.fake, path, ttl=60, clock=lambda: clock[0])
+        self.assertEqual(self.fake.calls['DescribeDBClusterSnapshots'], 3)
+
+    def test_cached_window_is_refreshed_for_later_times(self):
+        path = os.path.join(self.directory, 'timeline.json')
+        timeline.get_timeline('cluster', 'cluster-00000', 'daily-', self.fake, path)
+        # The cluster has kept backing up since the timeline was cached
+        self.fake.clusters['cluster-00000']['LatestRestorableTime'] = at(10, 18)
+
+        cached = timeline.get_timeline('cluster', 'cluster-00000', 'daily-', self.fake, path, when=at(10, 6))
+        self.assertEqual(cached.window, (at(8), at(10, 12)))
+        self.assertEqual(self.fake.calls['DescribeDBClusters'], 1)
+
+        refreshed = timeline.get_timeline('cluster', 'cluster-00000', 'daily-', self.fake, path, when=at(10, 15))
+        self.assertEqual(refreshed.choose(at(10, 15)), {'Source': timeline.PITR, 'Time': at(10, 15)})
+        self.assertEqual(self.fake.calls['DescribeDBClusterSnapshots'], 1)
+        # The refreshed window is cached too
+        self.assertEqual(timeline.load(path, 'cluster', 'cluster-00000', 'daily-').window, (at(8), at(10, 18)))
+
+    def test_instance_window_and_restore(self):
+        index = timeline.Timeline.build('instance', 'db-00002', 'daily-', self.fake)
+        self.assertEqual(index.window, (at(8), at(10, 12)))
+
+        response, restore_type = restore.restore_to_point('instance', 'db-00002', 'db-restored',
+                                                          index.choose(at(4)), self.fake)
+        self.assertEqual(restore_type, 'snapshot')
+        self.assertEqual(self.fake.calls['RestoreDBInstanceFromDBSnapshot'], 1)
+        self.assertIn('db-restored', self.fake.instances)
+
+    def test_cluster_restore_from_snapshot(self):
+        index = timeline.Timeline.build('cluster', 'cluster-00000', 'daily-', self.fake)
+
+        response, restore_type = restore.restore_to_point('cluster', 'cluster-00000', 'dr', index.choose(at(4)),
+                                                          self.fake, engine=index.engine)
+
+        self.assertEqual(restore_type, 'snapshot')
+        self.assertEqual(response['DBCluster']['Engine'], 'aurora-postgresql')
+
+
+if __name__ == '__main__':
+    unittest.main()
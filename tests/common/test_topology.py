@@ -0,0 +1,113 @@
+"""Unit tests for the common.topology module."""
+
+import unittest
+from unittest.mock import patch, MagicMock
+from botocore.exceptions import ClientError
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from common.topology import TopologyIndex, logger as topology_logger
+
+
+class FakeClock(object):
+    """Manually advanced clock so TTL expiry is deterministic."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTopologyIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.patch_topology_logger = patch.object(topology_logger, 'propagate', False)
+        self.patch_topology_logger.start()
+
+        self.clock = FakeClock()
+        self.mock_rds_client = MagicMock()
+        self.mock_rds_client.get_paginator.return_value.paginate.side_effect = lambda: iter(self.pages.pop(0))
+        self.pages = []
+        self.index = TopologyIndex(client=self.mock_rds_client, ttl=300, negative_ttl=60, clock=self.clock)
+
+    def tearDown(self):
+        self.patch_topology_logger.stop()
+
+    def queue_sweep(self, instances):
+        self.pages.append([{'DBInstances': list(instances)}])
+
+    def test_lookup_many_uses_one_sweep(self):
+        self.queue_sweep([
+            {'DBInstanceIdentifier': 'db-a', 'DBClusterIdentifier': 'cluster-1', 'Engine': 'aurora-mysql',
+             'DBInstanceStatus': 'available', 'DBInstanceArn': 'arn:a'},
+            {'DBInstanceIdentifier': 'db-b', 'Engine': 'postgres', 'DBInstanceStatus': 'available'},
+        ])
+
+        records = self.index.lookup_many(['db-a', 'db-b', 'db-missing'])
+
+        self.assertEqual(records['db-a']['DBClusterIdentifier'], 'cluster-1')
+        self.assertEqual(records['db-a']['Arn'], 'arn:a')
+        self.assertIsNone(records['db-b']['DBClusterIdentifier'])
+        self.assertIsNone(records['db-missing'])
+        self.mock_rds_client.get_paginator.assert_called_once_with('describe_db_instances')
+        # Cached answers, including the negative one, need no further API calls
+        self.assertEqual(self.index.cluster_of('db-a'), 'cluster-1')
+        self.assertFalse(self.index.cluster_of('db-missing'))
+        self.mock_rds_client.describe_db_instances.assert_not_called()
+
+    def test_ttl_expiry_triggers_new_sweep(self):
+        self.queue_sweep([{'DBInstanceIdentifier': 'db-a'}])
+        self.queue_sweep([{'DBInstanceIdentifier': 'db-a', 'DBClusterIdentifier': 'cluster-2'}])
+
+        self.assertIsNone(self.index.lookup_many(['db-a'])['db-a']['DBClusterIdentifier'])
+        self.clock.now += 301
+        self.assertEqual(self.index.lookup_many(['db-a'])['db-a']['DBClusterIdentifier'], 'cluster-2')
+
+    def test_targeted_lookup_expires_after_ttl(self):
+        self.mock_rds_client.describe_db_instances.side_effect = [
+            {'DBInstances': [{'DBInstanceIdentifier': 'db-a', 'DBClusterIdentifier': 'cluster-1'}]},
+            {'DBInstances': [{'DBInstanceIdentifier': 'db-a'}]},
+        ]
+
+        self.assertEqual(self.index.cluster_of('db-a'), 'cluster-1')
+        self.clock.now += 299
+        self.assertEqual(self.index.cluster_of('db-a'), 'cluster-1')
+        self.clock.now += 2
+        self.assertFalse(self.index.cluster_of('db-a'))
+        self.assertEqual(self.mock_rds_client.describe_db_instances.call_count, 2)
+
+    def test_targeted_lookup_and_negative_cache(self):
+        self.mock_rds_client.describe_db_instances.side_effect = ClientError(
+            {'Error': {'Code': 'DBInstanceNotFound', 'Message': 'gone'}}, 'describe_db_instances')
+
+        self.assertIsNone(self.index.lookup('db-gone'))
+        self.assertIsNone(self.index.lookup('db-gone'))
+        self.assertEqual(self.mock_rds_client.describe_db_instances.call_count, 1)
+
+        self.clock.now += 61
+        self.assertIsNone(self.index.lookup('db-gone'))
+        self.assertEqual(self.mock_rds_client.describe_db_instances.call_count, 2)
+
+    def test_targeted_lookup_reraises_other_errors(self):
+        self.mock_rds_client.describe_db_instances.side_effect = ClientError(
+            {'Error': {'Code': 'Throttling', 'Message': 'slow down'}}, 'describe_db_instances')
+
+        with self.assertRaises(ClientError):
+            self.index.lookup('db-a')
+        # cluster_of keeps the query_db_cluster contract and answers False
+        self.assertFalse(self.index.cluster_of('db-a'))
+
+    def test_invalidate(self):
+        self.mock_rds_client.describe_db_instances.return_value = {
+            'DBInstances': [{'DBInstanceIdentifier': 'db-a', 'DBClusterIdentifier': 'cluster-1'}]}
+        self.assertEqual(self.index.cluster_of('db-a'), 'cluster-1')
+        self.index.invalidate('db-a')
+        self.assertEqual(self.index.cluster_of('db-a'), 'cluster-1')
+        self.assertEqual(self.mock_rds_client.describe_db_instances.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
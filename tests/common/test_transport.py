@@ -0,0 +1,92 @@
+"""Unit tests for the common.transport module."""
+
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import threading
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from common import transport
+
+
+class RecordingHandler(BaseHTTPRequestHandler):
+    """Answers PUTs with the next queued status and records each request."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append((self.path, self.client_address[1], body))
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestResponseTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.patch_logger = patch.object(transport.logger, 'propagate', False)
+        self.patch_logger.start()
+        self.server = HTTPServer(('127.0.0.1', 0), RecordingHandler)
+        self.server.requests = []
+        self.server.statuses = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/bucket/key?X-Amz-Signature=abc' % self.server.server_port
+        self.sleeps = []
+        self.transport = transport.ResponseTransport(retries=2, sleep=self.sleeps.append)
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.patch_logger.stop()
+
+    def test_put_reuses_connection(self):
+        self.assertEqual(self.transport.put(self.url, b'{"a": 1}'), 200)
+        self.assertEqual(self.transport.put(self.url, b'{"b": 2}'), 200)
+
+        self.assertEqual([request[0] for request in self.server.requests],
+                         ['/bucket/key?X-Amz-Signature=abc'] * 2)
+        self.assertEqual(self.server.requests[0][2], b'{"a": 1}')
+        # Same client port: both PUTs travelled over one keep-alive connection
+        self.assertEqual(self.server.requests[0][1], self.server.requests[1][1])
+
+    def test_retries_server_errors(self):
+        self.server.statuses = [503, 500]
+
+        self.assertEqual(self.transport.put(self.url, b'{}'), 200)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(self.sleeps), 2)
+
+    def test_client_errors_are_not_retried(self):
+        self.server.statuses = [403]
+
+        self.assertEqual(self.transport.put(self.url, b'{}'), 403)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_connection_failures_give_up_after_retries(self):
+        self.server.shutdown()
+        self.server.server_close()
+        unreachable = transport.ResponseTransport(connect_timeout=0.5, retries=1, sleep=self.sleeps.append)
+
+        self.assertIsNone(unreachable.put(self.url, b'{}'))
+        self.assertEqual(len(self.sleeps), 1)
+
+    def test_backoff_is_bounded(self):
+        for attempt in range(10):
+            self.assertLessEqual(self.transport.delay(attempt), transport.DEFAULT_MAX_BACKOFF)
+
+
+if __name__ == '__main__':
+    unittest.main()
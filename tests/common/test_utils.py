@@ -11,7 +11,7 @@ import os
 # If common is a top-level directory alongside tests:
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
-from common.utils import query_db_cluster, logger as utils_logger # import logger to suppress its output during tests
+from common.utils import query_db_cluster, map_concurrently, logger as utils_logger # import logger to suppress its output during tests
 
 class TestQueryDBCluster(unittest.TestCase):
 
@@ -90,5 +90,31 @@ class TestQueryDBCluster(unittest.TestCase):
         pass # Skipping this more complex case as it might require code changes not in scope.
 
 
+class TestMapConcurrently(unittest.TestCase):
+
+    def setUp(self):
+        self.patch_utils_logger = patch.object(utils_logger, 'propagate', False)
+        self.patch_utils_logger.start()
+
+    def tearDown(self):
+        self.patch_utils_logger.stop()
+
+    def test_results_and_errors_are_kept_per_item(self):
+        def square(value):
+            if value == 3:
+                raise ValueError("bad item")
+            return value * value
+
+        results = map_concurrently(square, [1, 2, 3], max_workers=2)
+
+        self.assertEqual(results[1], (1, None))
+        self.assertEqual(results[2], (4, None))
+        self.assertIsNone(results[3][0])
+        self.assertIsInstance(results[3][1], ValueError)
+
+    def test_empty_input(self):
+        self.assertEqual(map_concurrently(lambda item: item, []), {})
+
+
 if __name__ == '__main__':
     unittest.main()
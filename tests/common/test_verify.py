@@ -0,0 +1,114 @@
+"""Unit tests for the common.verify module, against SQLite stand-ins."""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from common import verify
+
+
+class TestVerify(unittest.TestCase):
+
+    def setUp(self):
+        self.patch_logger = patch.object(verify.logger, 'propagate', False)
+        self.patch_logger.start()
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, 'source.db')
+        connection = sqlite3.connect(self.source)
+        connection.execute('CREATE TABLE orders (id INTEGER PRIMARY KEY, customer TEXT, total REAL, note BLOB)')
+        connection.executemany('INSERT INTO orders VALUES (?, ?, ?, ?)',
+                               [(number, 'customer-%d' % (number % 7), number * 1.5, b'\x00\x01')
+                                for number in range(1, 1001)])
+        connection.execute('CREATE TABLE "audit log" (event TEXT, at TEXT)')
+        connection.executemany('INSERT INTO "audit log" VALUES (?, ?)', [('login', '2023-01-01')] * 3)
+        connection.commit()
+        connection.close()
+        self.target = os.path.join(self.directory, 'target.db')
+        shutil.copyfile(self.source, self.target)
+
+    def tearDown(self):
+        self.patch_logger.stop()
+        shutil.rmtree(self.directory)
+
+    def change_target(self, *statements):
+        connection = sqlite3.connect(self.target)
+        for statement in statements:
+            connection.execute(statement)
+        connection.commit()
+        connection.close()
+
+    def run_verify(self, **kwargs):
+        source_connect, dialect = verify.connector('sqlite:///' + self.source)
+        target_connect, _ = verify.connector('sqlite:///' + self.target)
+        return verify.verify(source_connect, target_connect, dialect, **kwargs)[0]
+
+    def test_identical_databases_match(self):
+        results = self.run_verify(chunk_rows=100)
+
+        self.assertEqual(results['orders']['Status'], verify.MATCH)
+        self.assertEqual(results['orders']['Chunks'], 10)
+        self.assertEqual((results['orders']['SourceRows'], results['orders']['TargetRows']), (1000, 1000))
+        self.assertEqual(results['audit log']['Chunks'], 1)
+        self.assertEqual(results['audit log']['Status'], verify.MATCH)
+
+    def test_changed_rows_are_located_by_key_range(self):
+        self.change_target("UPDATE orders SET total = 0 WHERE id = 450",
+                           "INSERT INTO orders VALUES (5000, 'late', 1, NULL)",
+                           'DELETE FROM "audit log" WHERE rowid = 1')
+
+        results = self.run_verify(chunk_rows=100)
+
+        self.assertEqual(results['orders']['Status'], verify.MISMATCH)
+        self.assertEqual(results['orders']['MismatchedChunks'], [(401, 501), (901, None)])
+        self.assertEqual(results['orders']['TargetRows'], 1001)
+        self.assertEqual(results['audit log']['MismatchedChunks'], ['all rows'])
+        lines = verify.format_report(results, 1.0)
+        self.assertIn('0/2 tables match, 1003 source rows compared', lines[-1])
+
+    def test_row_order_does_not_matter(self):
+        self.change_target('CREATE TABLE copy AS SELECT * FROM "audit log" ORDER BY rowid DESC',
+                           'DELETE FROM "audit log"', 'INSERT INTO "audit log" SELECT * FROM copy',
+                           'DROP TABLE copy')
+        self.assertEqual(self.run_verify()['audit log']['Status'], verify.MATCH)
+
+    def test_missing_table_is_an_error(self):
+        self.change_target('DROP TABLE orders')
+        results = self.run_verify(tables=['orders', 'audit log'])
+        self.assertEqual((results['orders']['Status'], results['orders']['Error']), (verify.ERROR, 'missing in target'))
+        self.assertEqual(results['audit log']['Status'], verify.MATCH)
+
+    def test_thousands_of_tables_share_a_small_pool(self):
+        for path in (self.source, self.target):
+            connection = sqlite3.connect(path)
+            for number in range(2000):
+                connection.execute('CREATE TABLE t%04d (id INTEGER PRIMARY KEY, value TEXT)' % number)
+                connection.execute("INSERT INTO t%04d VALUES (1, 'x')" % number)
+            connection.commit()
+            connection.close()
+        connections = []
+        connect = verify.connector('sqlite:///' + self.source)[0]
+
+        def counting_connect():
+            connections.append(connect())
+            return connections[-1]
+
+        results, _ = verify.verify(counting_connect, verify.connector('sqlite:///' + self.target)[0],
+                                   verify.DIALECTS['sqlite'], max_workers=4)
+
+        self.assertEqual(len(results), 2002)
+        self.assertTrue(all(result['Status'] == verify.MATCH for result in results.values()))
+        self.assertLessEqual(len(connections), 4)
+
+    def test_connector_rejects_unknown_schemes(self):
+        with self.assertRaisesRegex(ValueError, "Database URL must start with one of"):
+            verify.connector('oracle://scott@db/orcl')
+
+
+if __name__ == '__main__':
+    unittest.main()
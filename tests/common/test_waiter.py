@@ -0,0 +1,82 @@
+"""Unit tests for the common.waiter module."""
+
+import unittest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from common import waiter
+
+
+def pages(*snapshots):
+    """Wrap describe_db_snapshots entries into a single paginator page."""
+    return [{'DBSnapshots': [{'DBSnapshotIdentifier': identifier, 'Status': status, 'PercentProgress': percent}
+                             for identifier, status, percent in snapshots]}]
+
+
+class TestWaiter(unittest.TestCase):
+
+    def setUp(self):
+        self.patch_logger = patch.object(waiter.logger, 'propagate', False)
+        self.patch_logger.start()
+        self.mock_rds_client = MagicMock()
+        self.sleeps = []
+
+    def tearDown(self):
+        self.patch_logger.stop()
+
+    def test_next_delay_backs_off_as_progress_slows(self):
+        self.assertEqual(waiter.next_delay(5, 25), 5)
+        self.assertEqual(waiter.next_delay(10, 3), 15)
+        self.assertEqual(waiter.next_delay(10, 0), 20)
+        self.assertEqual(waiter.next_delay(50, 0), waiter.DEFAULT_MAX_DELAY)
+
+    def test_batches_status_checks_into_one_filtered_call(self):
+        self.mock_rds_client.get_paginator.return_value.paginate.return_value = pages(
+            ('snap-a', 'available', 100), ('snap-b', 'creating', 40))
+
+        statuses = waiter.describe_snapshot_status(
+            [('instance', 'snap-a'), ('instance', 'snap-b')], self.mock_rds_client)
+
+        self.mock_rds_client.get_paginator.assert_called_once_with('describe_db_snapshots')
+        self.mock_rds_client.get_paginator.return_value.paginate.assert_called_once_with(
+            Filters=[{'Name': 'db-snapshot-id', 'Values': ['snap-a', 'snap-b']}])
+        self.assertEqual(statuses[('instance', 'snap-b')], ('creating', 40))
+
+    def test_waits_until_available(self):
+        self.mock_rds_client.get_paginator.return_value.paginate.side_effect = [
+            pages(('snap-a', 'creating', 10)),
+            pages(('snap-a', 'creating', 12)),
+            pages(('snap-a', 'available', 100)),
+        ]
+
+        statuses = waiter.wait_for_snapshots([('instance', 'snap-a')], self.mock_rds_client,
+                                             min_delay=5, sleep=self.sleeps.append)
+
+        self.assertEqual(statuses, {('instance', 'snap-a'): 'available'})
+        # Progress of 10 keeps the fast interval, then 2 points backs off
+        self.assertEqual(self.sleeps, [5, 7.5])
+
+    def test_stops_before_deadline(self):
+        self.mock_rds_client.get_paginator.return_value.paginate.return_value = pages(('snap-a', 'creating', 0))
+
+        statuses = waiter.wait_for_snapshots([('instance', 'snap-a')], self.mock_rds_client,
+                                             remaining_ms=lambda: 20000, margin_ms=15000,
+                                             sleep=self.sleeps.append)
+
+        self.assertEqual(statuses, {('instance', 'snap-a'): 'creating'})
+        self.assertEqual(self.sleeps, [])
+
+    def test_missing_snapshot_is_terminal(self):
+        self.mock_rds_client.get_paginator.return_value.paginate.return_value = [{'DBSnapshots': []}]
+
+        statuses = waiter.wait_for_snapshots([('instance', 'snap-gone')], self.mock_rds_client,
+                                             sleep=self.sleeps.append)
+
+        self.assertEqual(statuses, {('instance', 'snap-gone'): 'missing'})
+
+
+if __name__ == '__main__':
+    unittest.main()
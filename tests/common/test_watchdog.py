@@ -0,0 +1,107 @@
+"""Unit tests for the common.watchdog module."""
+
+import threading
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from common import watchdog
+
+
+class TestWatchdog(unittest.TestCase):
+
+    def setUp(self):
+        self.responses = []
+        self.responded = threading.Event()
+
+        def respond(event, context, status, **kwargs):
+            self.responses.append((status, kwargs))
+            self.responded.set()
+            return True
+
+        self.guard = watchdog.Watchdog(respond, margin_ms=0)
+        self.context = MagicMock()
+        self.context.get_remaining_time_in_millis.return_value = 60000
+
+    def tearDown(self):
+        self.guard.stop_timer()
+
+    def test_only_the_first_response_is_sent(self):
+        self.guard.start({}, self.context)
+
+        self.assertTrue(self.guard.respond({}, self.context, 'SUCCESS', reason='done'))
+        self.assertFalse(self.guard.respond({}, self.context, 'FAILED', reason='again'))
+        self.guard.stop()
+
+        self.assertEqual(self.responses, [('SUCCESS', {'reason': 'done'})])
+
+    def test_deadline_responds_failed_with_diagnostics(self):
+        self.context.get_remaining_time_in_millis.return_value = 50
+        self.guard.start({}, self.context)
+        self.guard.enter('creating snapshot')
+
+        # The handler is stuck until the watchdog has responded
+        self.assertTrue(self.responded.wait(5))
+        self.guard.respond({}, self.context, 'SUCCESS')
+        self.guard.stop()
+
+        self.assertEqual(len(self.responses), 1)
+        status, kwargs = self.responses[0]
+        self.assertEqual(status, 'FAILED')
+        self.assertIn('creating snapshot', kwargs['reason'])
+        self.assertEqual(kwargs['response_data']['Phase'], 'creating snapshot')
+        self.assertTrue(kwargs['response_data']['Stack'])
+
+    def test_short_timeouts_keep_most_of_their_time(self):
+        delays = []
+        timer = MagicMock(side_effect=lambda delay, callback: delays.append(delay) or MagicMock())
+        guard = watchdog.Watchdog(lambda *args, **kwargs: True, timer=timer)
+        for remaining in (3000, 10000, 60000):
+            self.context.get_remaining_time_in_millis.return_value = remaining
+            guard.start({}, self.context)
+            guard.respond({}, self.context, 'SUCCESS')
+            guard.stop()
+
+        # 3 s (the Lambda default) and 10 s lose a quarter, longer ones the full margin
+        self.assertEqual(delays, [2.25, 7.5, 50.0])
+
+    def test_exit_without_response_fails(self):
+        self.guard.start({}, self.context)
+        self.guard.enter('resolving fleet')
+
+        self.guard.stop(RuntimeError('boom'))
+
+        status, kwargs = self.responses[0]
+        self.assertEqual(status, 'FAILED')
+        self.assertEqual(kwargs['reason'], 'Unexpected RuntimeError during resolving fleet: boom')
+
+    def test_handed_over_invocations_do_not_respond(self):
+        self.guard.start({}, self.context)
+        self.assertTrue(self.guard.hand_over())
+
+        self.guard.expire()
+        self.guard.stop()
+
+        self.assertEqual(self.responses, [])
+
+    def test_no_hand_over_after_the_deadline_responded(self):
+        self.guard.start({}, self.context)
+        self.guard.expire()
+
+        self.assertIs(self.guard.hand_over(), False)
+        self.guard.stop()
+
+        self.assertEqual([status for status, _ in self.responses], ['FAILED'])
+
+    def test_disarmed_watchdog_passes_responses_through(self):
+        self.guard.respond({}, self.context, 'SUCCESS')
+        self.guard.respond({}, self.context, 'SUCCESS')
+
+        self.assertEqual(len(self.responses), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,411 @@
+"""In-process stand-in for the RDS API, for offline tests and benchmarks.
+
+FakeRDS implements the subset of the boto3 RDS client this project uses,
+with configurable per-call latency, throttling rate and fleet size. Plug it
+into every entry point with ``common.clients.install(FakeRDS(...))``.
+"""
+
+import collections
+import datetime
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+ACCOUNT = '123456789012'
+PAGE_SIZE = 100
+
+
+class FakePaginator(object):
+    """Marker based paginator over one FakeRDS describe method."""
+
+    def __init__(self, method):
+        self.method = method
+
+    def paginate(self, **kwargs):
+        marker = None
+        while True:
+            if marker:
+                kwargs['Marker'] = marker
+            page = self.method(**kwargs)
+            yield page
+            marker = page.get('Marker')
+            if not marker:
+                return
+
+
+class FakeMeta(object):
+    def __init__(self, region_name):
+        self.region_name = region_name
+
+
+class FakeRDS(object):
+    """
+    Thread safe in-memory RDS. Instances are named db-00000 .. and every
+    `cluster_every`-th pair of instances shares a cluster.
+    """
+
+    def __init__(self, instances=0, cluster_every=0, latency=0.0, throttle_rate=0.0,
+                 region='us-east-1', seed=0, restore_delay=0.0, clone_delay=None, clone_supported=True,
+                 backup_window=None, export_delay=0.0, export_size_gb=10.0, clock=time.time):
+        self.meta = FakeMeta(region)
+        # (earliest, latest) restorable times of every source, None disables PITR
+        self.backup_window = backup_window
+        self.latency = latency
+        # Restored instances and clusters stay 'creating' this many seconds
+        self.restore_delay = restore_delay
+        # Copy-on-write clones are ready after clone_delay (default restore_delay)
+        self.clone_delay = restore_delay if clone_delay is None else clone_delay
+        self.clone_supported = clone_supported
+        # Export tasks complete after export_delay, having extracted export_size_gb
+        self.export_delay = export_delay
+        self.export_size_gb = export_size_gb
+        self.export_tasks = collections.OrderedDict()
+        self._export_ready_at = {}
+        # Most export tasks seen running at once
+        self.max_running_exports = 0
+        self._clock = clock
+        self._ready_at = {}
+        self.throttle_rate = throttle_rate
+        self.calls = collections.Counter()
+        self.instances = collections.OrderedDict()
+        self.clusters = collections.OrderedDict()
+        self.snapshots = collections.OrderedDict()
+        self.cluster_snapshots = collections.OrderedDict()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        for number in range(instances):
+            cluster_id = None
+            if cluster_every and number % cluster_every < 2:
+                cluster_id = 'cluster-%05d' % (number // cluster_every)
+            self.add_instance('db-%05d' % number, cluster_id)
+
+    # Fleet setup
+
+    def add_instance(self, instance_id, cluster_id=None, engine=None, tags=None):
+        engine = engine or ('aurora-postgresql' if cluster_id else 'postgres')
+        self.instances[instance_id] = {
+            'DBInstanceIdentifier': instance_id,
+            'DBInstanceArn': self._arn('db', instance_id),
+            'DBInstanceStatus': 'available',
+            'DBInstanceClass': 'db.r6g.large',
+            'Engine': engine,
+            'DBParameterGroups': [{'DBParameterGroupName': 'default.%s' % engine}],
+            'TagList': [{'Key': key, 'Value': value} for key, value in (tags or {}).items()],
+        }
+        if self.backup_window:
+            self.instances[instance_id]['LatestRestorableTime'] = self.backup_window[1]
+        if cluster_id:
+            self.instances[instance_id]['DBClusterIdentifier'] = cluster_id
+            cluster = self.clusters.setdefault(cluster_id, {
+                'DBClusterIdentifier': cluster_id,
+                'DBClusterArn': self._arn('cluster', cluster_id),
+                'Status': 'available',
+                'Engine': engine,
+                'DBClusterMembers': [],
+            })
+            if self.backup_window:
+                cluster['EarliestRestorableTime'], cluster['LatestRestorableTime'] = self.backup_window
+            cluster['DBClusterMembers'].append({
+                'DBInstanceIdentifier': instance_id,
+                'IsClusterWriter': not cluster['DBClusterMembers'],
+                'PromotionTier': 1,
+            })
+
+    def add_snapshot(self, kind, source_id, identifier, create_time, status='available'):
+        """Add a manual snapshot taken at create_time."""
+        if kind == 'cluster':
+            self.cluster_snapshots[identifier] = {
+                'DBClusterSnapshotIdentifier': identifier, 'DBClusterIdentifier': source_id,
+                'SnapshotCreateTime': create_time, 'Engine': self.clusters[source_id]['Engine'],
+                'SnapshotType': 'manual', 'Status': status}
+        else:
+            self.snapshots[identifier] = {
+                'DBSnapshotIdentifier': identifier, 'DBInstanceIdentifier': source_id,
+                'SnapshotCreateTime': create_time, 'Engine': self.instances[source_id]['Engine'],
+                'SnapshotType': 'manual', 'Status': status}
+
+    # Plumbing
+
+    def _arn(self, kind, identifier):
+        return 'arn:aws:rds:%s:%s:%s:%s' % (self.meta.region_name, ACCOUNT, kind, identifier)
+
+    def _call(self, operation):
+        with self._lock:
+            self.calls[operation] += 1
+            throttled = self.throttle_rate and self._random.random() < self.throttle_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if throttled:
+            self.calls['Throttled'] += 1
+            raise ClientError({'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'}}, operation)
+
+    @staticmethod
+    def _not_found(code, operation, identifier):
+        return ClientError({'Error': {'Code': code, 'Message': '%s not found' % identifier}}, operation)
+
+    @staticmethod
+    def _page(items, key, Marker=None, MaxRecords=PAGE_SIZE):
+        start = int(Marker or 0)
+        page = {key: items[start:start + MaxRecords]}
+        if start + MaxRecords < len(items):
+            page['Marker'] = str(start + MaxRecords)
+        return page
+
+    @staticmethod
+    def _filter(items, filters, names):
+        for item_filter in filters or []:
+            field = names.get(item_filter['Name'])
+            if field:
+                values = set(item_filter['Values'])
+                items = [item for item in items if item.get(field) in values]
+        return items
+
+    def _settle(self):
+        now = self._clock()
+        with self._lock:
+            for identifier, ready_at in list(self._ready_at.items()):
+                if ready_at <= now:
+                    del self._ready_at[identifier]
+                    for items, key in ((self.instances, 'DBInstanceStatus'), (self.clusters, 'Status')):
+                        if identifier in items:
+                            items[identifier][key] = 'available'
+
+    def get_paginator(self, operation):
+        return FakePaginator(getattr(self, operation))
+
+    # Describe
+
+    def describe_db_instances(self, DBInstanceIdentifier=None, Filters=None, **page):
+        self._call('DescribeDBInstances')
+        self._settle()
+        if DBInstanceIdentifier:
+            if DBInstanceIdentifier not in self.instances:
+                raise self._not_found('DBInstanceNotFound', 'DescribeDBInstances', DBInstanceIdentifier)
+            return {'DBInstances': [dict(self.instances[DBInstanceIdentifier])]}
+        items = self._filter(list(self.instances.values()), Filters, {'db-instance-id': 'DBInstanceIdentifier',
+                                                                      'db-cluster-id': 'DBClusterIdentifier'})
+        return self._page(items, 'DBInstances', **page)
+
+    def describe_db_clusters(self, DBClusterIdentifier=None, Filters=None, **page):
+        self._call('DescribeDBClusters')
+        self._settle()
+        if DBClusterIdentifier:
+            if DBClusterIdentifier not in self.clusters:
+                raise self._not_found('DBClusterNotFoundFault', 'DescribeDBClusters', DBClusterIdentifier)
+            return {'DBClusters': [dict(self.clusters[DBClusterIdentifier])]}
+        items = self._filter(list(self.clusters.values()), Filters, {'db-cluster-id': 'DBClusterIdentifier'})
+        return self._page(items, 'DBClusters', **page)
+
+    def describe_db_instance_automated_backups(self, DBInstanceIdentifier=None, **page):
+        self._call('DescribeDBInstanceAutomatedBackups')
+        if not self.backup_window or DBInstanceIdentifier not in self.instances:
+            return {'DBInstanceAutomatedBackups': []}
+        return {'DBInstanceAutomatedBackups': [{
+            'DBInstanceIdentifier': DBInstanceIdentifier,
+            'Status': 'active',
+            'RestoreWindow': {'EarliestTime': self.backup_window[0], 'LatestTime': self.backup_window[1]},
+        }]}
+
+    def describe_db_snapshots(self, DBInstanceIdentifier=None, DBSnapshotIdentifier=None,
+                              SnapshotType=None, Filters=None, **page):
+        self._call('DescribeDBSnapshots')
+        items = [snapshot for snapshot in self.snapshots.values()
+                 if (DBInstanceIdentifier is None or snapshot['DBInstanceIdentifier'] == DBInstanceIdentifier) and
+                 (DBSnapshotIdentifier is None or snapshot['DBSnapshotIdentifier'] == DBSnapshotIdentifier) and
+                 (SnapshotType is None or snapshot['SnapshotType'] == SnapshotType)]
+        items = self._filter(items, Filters, {'db-snapshot-id': 'DBSnapshotIdentifier',
+                                              'db-instance-id': 'DBInstanceIdentifier'})
+        return self._page(items, 'DBSnapshots', **page)
+
+    def describe_db_cluster_snapshots(self, DBClusterIdentifier=None, DBClusterSnapshotIdentifier=None,
+                                      SnapshotType=None, Filters=None, **page):
+        self._call('DescribeDBClusterSnapshots')
+        items = [snapshot for snapshot in self.cluster_snapshots.values()
+                 if (DBClusterIdentifier is None or snapshot['DBClusterIdentifier'] == DBClusterIdentifier) and
+                 (DBClusterSnapshotIdentifier is None or
+                  snapshot['DBClusterSnapshotIdentifier'] == DBClusterSnapshotIdentifier) and
+                 (SnapshotType is None or snapshot['SnapshotType'] == SnapshotType)]
+        items = self._filter(items, Filters, {'db-cluster-snapshot-id': 'DBClusterSnapshotIdentifier',
+                                              'db-cluster-id': 'DBClusterIdentifier'})
+        return self._page(items, 'DBClusterSnapshots', **page)
+
+    # Snapshots
+
+    def create_db_snapshot(self, DBSnapshotIdentifier, DBInstanceIdentifier, Tags=None):
+        self._call('CreateDBSnapshot')
+        with self._lock:
+            if DBInstanceIdentifier not in self.instances:
+                raise self._not_found('DBInstanceNotFound', 'CreateDBSnapshot', DBInstanceIdentifier)
+            if DBSnapshotIdentifier in self.snapshots:
+                raise ClientError({'Error': {'Code': 'DBSnapshotAlreadyExists', 'Message': 'exists'}},
+                                  'CreateDBSnapshot')
+            snapshot = {
+                'DBSnapshotIdentifier': DBSnapshotIdentifier,
+                'DBInstanceIdentifier': DBInstanceIdentifier,
+                'DBSnapshotArn': self._arn('snapshot', DBSnapshotIdentifier),
+                'SnapshotCreateTime': datetime.datetime.utcnow(),
+                'InstanceCreateTime': datetime.datetime(2020, 1, 1),
+                'Engine': self.instances[DBInstanceIdentifier]['Engine'],
+                'SnapshotType': 'manual',
+                'Status': 'available',
+                'PercentProgress': 100,
+                'TagList': list(Tags or []),
+            }
+            self.snapshots[DBSnapshotIdentifier] = snapshot
+        return {'DBSnapshot': dict(snapshot)}
+
+    def create_db_cluster_snapshot(self, DBClusterSnapshotIdentifier, DBClusterIdentifier, Tags=None):
+        self._call('CreateDBClusterSnapshot')
+        with self._lock:
+            if DBClusterIdentifier not in self.clusters:
+                raise self._not_found('DBClusterNotFoundFault', 'CreateDBClusterSnapshot', DBClusterIdentifier)
+            if DBClusterSnapshotIdentifier in self.cluster_snapshots:
+                raise ClientError({'Error': {'Code': 'DBClusterSnapshotAlreadyExistsFault', 'Message': 'exists'}},
+                                  'CreateDBClusterSnapshot')
+            snapshot = {
+                'DBClusterSnapshotIdentifier': DBClusterSnapshotIdentifier,
+                'DBClusterIdentifier': DBClusterIdentifier,
+                'DBClusterSnapshotArn': self._arn('cluster-snapshot', DBClusterSnapshotIdentifier),
+                'SnapshotCreateTime': datetime.datetime.utcnow(),
+                'Engine': self.clusters[DBClusterIdentifier]['Engine'],
+                'SnapshotType': 'manual',
+                'Status': 'available',
+                'PercentProgress': 100,
+                'TagList': list(Tags or []),
+            }
+            self.cluster_snapshots[DBClusterSnapshotIdentifier] = snapshot
+        return {'DBClusterSnapshot': dict(snapshot)}
+
+    def delete_db_snapshot(self, DBSnapshotIdentifier):
+        self._call('DeleteDBSnapshot')
+        with self._lock:
+            if DBSnapshotIdentifier not in self.snapshots:
+                raise self._not_found('DBSnapshotNotFound', 'DeleteDBSnapshot', DBSnapshotIdentifier)
+            return {'DBSnapshot': self.snapshots.pop(DBSnapshotIdentifier)}
+
+    def delete_db_cluster_snapshot(self, DBClusterSnapshotIdentifier):
+        self._call('DeleteDBClusterSnapshot')
+        with self._lock:
+            if DBClusterSnapshotIdentifier not in self.cluster_snapshots:
+                raise self._not_found('DBClusterSnapshotNotFoundFault', 'DeleteDBClusterSnapshot',
+                                      DBClusterSnapshotIdentifier)
+            return {'DBClusterSnapshot': self.cluster_snapshots.pop(DBClusterSnapshotIdentifier)}
+
+    # Exports
+
+    def _running_exports(self):
+        return [task for task in self.export_tasks.values() if task['Status'] != 'COMPLETE']
+
+    def start_export_task(self, ExportTaskIdentifier, SourceArn, S3BucketName, IamRoleArn, KmsKeyId, **kwargs):
+        self._call('StartExportTask')
+        with self._lock:
+            if ExportTaskIdentifier in self.export_tasks:
+                raise ClientError({'Error': {'Code': 'ExportTaskAlreadyExists', 'Message': 'exists'}},
+                                  'StartExportTask')
+            now = self._clock()
+            self.export_tasks[ExportTaskIdentifier] = {
+                'ExportTaskIdentifier': ExportTaskIdentifier, 'SourceArn': SourceArn,
+                'S3Bucket': S3BucketName, 'S3Prefix': kwargs.get('S3Prefix', ''), 'IamRoleArn': IamRoleArn,
+                'KmsKeyId': KmsKeyId, 'Status': 'STARTING', 'PercentProgress': 0,
+                'TaskStartTime': datetime.datetime.fromtimestamp(now, datetime.timezone.utc),
+            }
+            self._export_ready_at[ExportTaskIdentifier] = now + self.export_delay
+            self.max_running_exports = max(self.max_running_exports, len(self._running_exports()))
+            return dict(self.export_tasks[ExportTaskIdentifier])
+
+    def describe_export_tasks(self, **page):
+        self._call('DescribeExportTasks')
+        now = self._clock()
+        with self._lock:
+            for identifier, task in self.export_tasks.items():
+                if task['Status'] == 'COMPLETE':
+                    continue
+                if self._export_ready_at[identifier] <= now:
+                    task.update(Status='COMPLETE', PercentProgress=100, TotalExtractedDataInGB=self.export_size_gb,
+                                TaskEndTime=datetime.datetime.fromtimestamp(self._export_ready_at[identifier],
+                                                                            datetime.timezone.utc))
+                else:
+                    task['Status'] = 'IN_PROGRESS'
+            items = [dict(task) for task in self.export_tasks.values()]
+        return self._page(items, 'ExportTasks', **page)
+
+    # Restores
+
+    def create_db_instance(self, DBInstanceIdentifier, DBInstanceClass, Engine, DBClusterIdentifier=None,
+                           DBParameterGroupName=None, PromotionTier=1, **kwargs):
+        self._call('CreateDBInstance')
+        with self._lock:
+            if DBInstanceIdentifier in self.instances:
+                raise ClientError({'Error': {'Code': 'DBInstanceAlreadyExists', 'Message': 'exists'}},
+                                  'CreateDBInstance')
+            if DBClusterIdentifier and DBClusterIdentifier not in self.clusters:
+                raise self._not_found('DBClusterNotFoundFault', 'CreateDBInstance', DBClusterIdentifier)
+            self.add_instance(DBInstanceIdentifier, DBClusterIdentifier, Engine)
+            instance = self.instances[DBInstanceIdentifier]
+            instance.update(DBInstanceClass=DBInstanceClass, DBInstanceStatus='creating', PromotionTier=PromotionTier)
+            if DBParameterGroupName:
+                instance['DBParameterGroups'] = [{'DBParameterGroupName': DBParameterGroupName}]
+            self._ready_at[DBInstanceIdentifier] = self._clock() + self.restore_delay
+            return {'DBInstance': dict(instance)}
+
+    def restore_db_instance_to_point_in_time(self, SourceDBInstanceIdentifier, TargetDBInstanceIdentifier, **kwargs):
+        self._call('RestoreDBInstanceToPointInTime')
+        if SourceDBInstanceIdentifier not in self.instances:
+            raise self._not_found('DBInstanceNotFound', 'RestoreDBInstanceToPointInTime',
+                                  SourceDBInstanceIdentifier)
+        with self._lock:
+            self.add_instance(TargetDBInstanceIdentifier, engine=self.instances[SourceDBInstanceIdentifier]['Engine'])
+            self.instances[TargetDBInstanceIdentifier]['DBInstanceStatus'] = 'creating'
+            self._ready_at[TargetDBInstanceIdentifier] = self._clock() + self.restore_delay
+            return {'DBInstance': dict(self.instances[TargetDBInstanceIdentifier])}
+
+    def restore_db_instance_from_db_snapshot(self, DBInstanceIdentifier, DBSnapshotIdentifier, **kwargs):
+        self._call('RestoreDBInstanceFromDBSnapshot')
+        if DBSnapshotIdentifier not in self.snapshots:
+            raise self._not_found('DBSnapshotNotFound', 'RestoreDBInstanceFromDBSnapshot', DBSnapshotIdentifier)
+        with self._lock:
+            self.add_instance(DBInstanceIdentifier, engine=self.snapshots[DBSnapshotIdentifier]['Engine'])
+            self.instances[DBInstanceIdentifier]['DBInstanceStatus'] = 'creating'
+            self._ready_at[DBInstanceIdentifier] = self._clock() + self.restore_delay
+            return {'DBInstance': dict(self.instances[DBInstanceIdentifier])}
+
+    def restore_db_cluster_from_snapshot(self, DBClusterIdentifier, SnapshotIdentifier, Engine, **kwargs):
+        self._call('RestoreDBClusterFromSnapshot')
+        if SnapshotIdentifier not in self.cluster_snapshots:
+            raise self._not_found('DBClusterSnapshotNotFoundFault', 'RestoreDBClusterFromSnapshot',
+                                  SnapshotIdentifier)
+        with self._lock:
+            self.clusters[DBClusterIdentifier] = {
+                'DBClusterIdentifier': DBClusterIdentifier,
+                'DBClusterArn': self._arn('cluster', DBClusterIdentifier),
+                'Status': 'creating',
+                'Engine': Engine,
+                'DBClusterMembers': [],
+            }
+            self._ready_at[DBClusterIdentifier] = self._clock() + self.restore_delay
+            return {'DBCluster': dict(self.clusters[DBClusterIdentifier])}
+
+    def restore_db_cluster_to_point_in_time(self, DBClusterIdentifier, SourceDBClusterIdentifier,
+                                            RestoreType='full-copy', **kwargs):
+        self._call('RestoreDBClusterToPointInTime')
+        if SourceDBClusterIdentifier not in self.clusters:
+            raise self._not_found('DBClusterNotFoundFault', 'RestoreDBClusterToPointInTime',
+                                  SourceDBClusterIdentifier)
+        if RestoreType == 'copy-on-write' and not self.clone_supported:
+            raise ClientError({'Error': {'Code': 'InvalidParameterCombination',
+                                         'Message': 'Cloning is not supported for this cluster'}},
+                              'RestoreDBClusterToPointInTime')
+        with self._lock:
+            self.clusters[DBClusterIdentifier] = {
+                'DBClusterIdentifier': DBClusterIdentifier,
+                'DBClusterArn': self._arn('cluster', DBClusterIdentifier),
+                'Status': 'creating',
+                'Engine': self.clusters[SourceDBClusterIdentifier]['Engine'],
+                'DBClusterMembers': [],
+                'CloneGroupId': 'clone-group' if RestoreType == 'copy-on-write' else None,
+            }
+            delay = self.clone_delay if RestoreType == 'copy-on-write' else self.restore_delay
+            self._ready_at[DBClusterIdentifier] = self._clock() + delay
+            return {'DBCluster': dict(self.clusters[DBClusterIdentifier])}
@@ -0,0 +1,396 @@
+"""End to end runs of the entry points against the in-process FakeRDS."""
+
+import unittest
+from unittest.mock import patch, MagicMock
+import datetime
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from botocore.exceptions import ClientError
+
+import lambda_function
+import rds_restore
+from common import clients, dedupe, naming, profiling, topology, utils
+from tests.fake_rds import FakeRDS
+
+# The real send, before setUp patches it
+SEND = lambda_function.send
+
+
+class TestAgainstFakeRDS(unittest.TestCase):
+
+    def setUp(self):
+        clients.reset()
+        # 10 instances, db-00000/db-00001 and db-00005/db-00006 form two clusters
+        self.fake = FakeRDS(instances=10, cluster_every=5)
+        clients.install(self.fake)
+
+        self.mock_context = MagicMock()
+        self.mock_context.log_stream_name = 'log-stream'
+        self.mock_context.get_remaining_time_in_millis = MagicMock(return_value=30000)
+        self.mock_event = {
+            'StackId': 'stack-id',
+            'RequestId': 'request-id',
+            'LogicalResourceId': 'logical-id',
+            'ResponseURL': 'http://example.com/cfnresponse',
+        }
+        self.patches = [
+            patch('lambda_function.TOPOLOGY', topology.TopologyIndex()),
+            patch('rds_restore.TOPOLOGY', topology.TopologyIndex()),
+            patch('lambda_function.DBSNAPSHOTID', 'fleet-'),
+            patch('lambda_function.SNAPSHOTS', naming.SnapshotCatalog()),
+            patch('lambda_function.datetime'),
+            patch('lambda_function.send', return_value=True),
+            patch.object(logging.getLogger(), 'disabled', True),
+        ]
+        for active in self.patches:
+            active.start()
+        lambda_function.datetime.datetime.now.return_value = datetime.datetime(2023, 1, 1, 12, 0, 0)
+
+    def tearDown(self):
+        for active in reversed(self.patches):
+            active.stop()
+        clients.reset()
+
+    def test_query_db_cluster(self):
+        self.assertEqual(utils.query_db_cluster('db-00006'), 'cluster-00001')
+        self.assertFalse(utils.query_db_cluster('db-00007'))
+        self.assertEqual(self.fake.calls['DescribeDBInstances'], 2)
+
+    def test_fleet_handler_snapshots_every_target_once(self):
+        self.mock_event['ResourceProperties'] = {
+            'DBInstanceIdentifiers': ['db-%05d' % number for number in range(10)]}
+
+        lambda_function.handler(self.mock_event, self.mock_context)
+
+        self.assertEqual(sorted(self.fake.cluster_snapshots),
+                         ['fleet-cluster-00000-2023-01-01', 'fleet-cluster-00001-2023-01-01'])
+        self.assertEqual(len(self.fake.snapshots), 6)
+        self.assertEqual(self.fake.calls['CreateDBClusterSnapshot'], 2)
+        args, kwargs = lambda_function.send.call_args
+        self.assertEqual(args[2], lambda_function.SUCCESS)
+        self.assertEqual(len(kwargs['response_data']), 8)
+
+    def test_rerun_is_a_local_no_op(self):
+        self.mock_event['ResourceProperties'] = {'DBInstanceIdentifiers': ['db-00003', 'db-00004']}
+
+        lambda_function.handler(self.mock_event, self.mock_context)
+        calls = sum(self.fake.calls.values())
+        results = lambda_function.handler(self.mock_event, self.mock_context)
+
+        self.assertEqual(self.fake.calls['CreateDBSnapshot'], 2)
+        # Topology and snapshot listings are cached: no API call at all
+        self.assertEqual(sum(self.fake.calls.values()), calls)
+        self.assertTrue(results['db-00003']['Existing'])
+        self.assertEqual(lambda_function.send.call_args[0][2], lambda_function.SUCCESS)
+
+    def test_warm_container_uses_the_invocation_date(self):
+        self.mock_event['ResourceProperties'] = {'DBInstanceIdentifiers': ['db-00003']}
+        lambda_function.handler(self.mock_event, self.mock_context)
+        lambda_function.datetime.datetime.now.return_value = datetime.datetime(2023, 1, 2, 0, 5, 0)
+
+        lambda_function.handler(self.mock_event, self.mock_context)
+
+        self.assertEqual(sorted(self.fake.snapshots), ['fleet-db-00003-2023-01-01', 'fleet-db-00003-2023-01-02'])
+
+    def test_short_budget_still_snapshots(self):
+        self.mock_event['ResourceProperties'] = {'DBInstanceIdentifiers': ['db-00003']}
+        self.mock_context.get_remaining_time_in_millis.return_value = 14000
+
+        results = lambda_function.handler(self.mock_event, self.mock_context)
+
+        self.assertEqual(self.fake.calls['CreateDBSnapshot'], 1)
+        self.assertEqual(results['db-00003']['Status'], lambda_function.SUCCESS)
+        self.assertEqual(lambda_function.send.call_args[0][2], lambda_function.SUCCESS)
+
+    def test_large_fleet_finishes_through_chained_invocations(self):
+        self.mock_event['ResourceProperties'] = {
+            'DBInstanceIdentifiers': ['db-%05d' % number for number in range(10)]}
+        queued = []
+
+        def context():
+            # Every look at the clock costs 6 s: three targets per invocation
+            remaining = iter(range(48000, -48000, -6000))
+            chained = MagicMock(log_stream_name='log-stream', invoked_function_arn='arn:function')
+            chained.get_remaining_time_in_millis.side_effect = lambda: next(remaining)
+            return chained
+
+        with patch('lambda_function.FLEET_MAX_WORKERS', 1), \
+                patch('lambda_function.LAMBDA') as mock_lambda:
+            mock_lambda.invoke.side_effect = lambda **kwargs: queued.append(json.loads(kwargs['Payload']))
+            lambda_function.handler(self.mock_event, context())
+            # The chain crosses midnight and keeps its first suffix
+            lambda_function.datetime.datetime.now.return_value = datetime.datetime(2023, 1, 2, 0, 5, 0)
+            while queued:
+                results = lambda_function.handler(queued.pop(0), context())
+
+        self.assertEqual(mock_lambda.invoke.call_count, 2)
+        self.assertEqual(self.fake.calls['CreateDBSnapshot'] + self.fake.calls['CreateDBClusterSnapshot'], 8)
+        self.assertTrue(all(name.endswith('-2023-01-01') for name in self.fake.snapshots))
+        lambda_function.send.assert_called_once()
+        self.assertEqual(lambda_function.send.call_args[0][2], lambda_function.SUCCESS)
+        self.assertEqual(len(results), 8)
+
+    def test_fleet_is_not_chained_after_the_deadline_responded(self):
+        self.mock_event['ResourceProperties'] = {
+            'DBInstanceIdentifiers': ['db-%05d' % number for number in range(10)]}
+        create = self.fake.create_db_snapshot
+
+        def hung_create(**kwargs):
+            # The deadline hits while the first create hangs
+            lambda_function.WATCHDOG.expire()
+            return create(**kwargs)
+
+        remaining = iter(range(48000, -48000, -6000))
+        self.mock_context.get_remaining_time_in_millis = lambda: next(remaining)
+        with patch('lambda_function.FLEET_MAX_WORKERS', 1), \
+                patch('lambda_function.LAMBDA') as mock_lambda, \
+                patch.object(self.fake, 'create_db_snapshot', side_effect=hung_create):
+            lambda_function.handler(self.mock_event, self.mock_context)
+
+        mock_lambda.invoke.assert_not_called()
+        lambda_function.send.assert_called_once()
+        self.assertEqual(lambda_function.send.call_args[0][2], lambda_function.FAILED)
+        self.assertIn('Timed out', lambda_function.send.call_args[1]['reason'])
+
+    def test_snapshot_group_is_tagged_and_released_together(self):
+        self.mock_event['ResourceProperties'] = {'DBInstanceIdentifiers': ['db-00000', 'db-00003', 'db-00004'],
+                                                 'SnapshotGroup': 'orders'}
+
+        data = lambda_function.handler(self.mock_event, self.mock_context)
+        rerun = lambda_function.handler(self.mock_event, self.mock_context)
+
+        self.assertEqual(data['GroupId'], 'orders-2023-01-01')
+        self.assertGreaterEqual(data['IssueSkewMs'], 0)
+        tags = [snapshot['TagList'] for snapshot in list(self.fake.snapshots.values()) +
+                list(self.fake.cluster_snapshots.values())]
+        self.assertEqual(tags, [[{'Key': 'SnapshotGroup', 'Value': 'orders-2023-01-01'}]] * 3)
+        self.assertTrue(all(rerun[identifier]['Existing'] for identifier in ('cluster-00000', 'db-00003', 'db-00004')))
+        self.assertEqual(self.fake.calls['CreateDBSnapshot'], 2)
+        self.assertEqual(lambda_function.send.call_args[0][2], lambda_function.SUCCESS)
+
+    def test_hub_snapshots_every_account_through_its_role(self):
+        self.mock_event['ResourceProperties'] = {'DBInstanceIdentifiers': ['db-00000', 'db-00003'],
+                                                 'HubAccounts': '111111111111,222222222222'}
+        members = {'arn:aws:iam::111111111111:role/rds-backup-hub': FakeRDS(instances=5, cluster_every=5),
+                   'arn:aws:iam::222222222222:role/rds-backup-hub': FakeRDS(instances=5)}
+
+        with patch('lambda_function.HUB_CACHES', {}), \
+                patch('common.clients.get_client', side_effect=lambda service, region, role: members[role]):
+            results = lambda_function.handler(self.mock_event, self.mock_context)
+            rerun = lambda_function.handler(self.mock_event, self.mock_context)
+
+        first, second = members.values()
+        self.assertEqual(sorted(first.cluster_snapshots), ['fleet-cluster-00000-2023-01-01'])
+        self.assertEqual(sorted(second.snapshots), ['fleet-db-00000-2023-01-01', 'fleet-db-00003-2023-01-01'])
+        self.assertEqual(sorted(results), ['111111111111/us-east-1/cluster-00000', '111111111111/us-east-1/db-00003',
+                                           '222222222222/us-east-1/db-00000', '222222222222/us-east-1/db-00003'])
+        # The hub's own account is left alone, and reruns reuse every account's caches
+        self.assertEqual(sum(self.fake.calls.values()), 0)
+        self.assertTrue(all(result['Existing'] for result in rerun.values()))
+        self.assertEqual(second.calls['CreateDBSnapshot'], 2)
+        self.assertEqual(lambda_function.send.call_args[0][2], lambda_function.SUCCESS)
+
+    def test_new_snapshots_are_exported_within_the_limit(self):
+        self.mock_event['ResourceProperties'] = {
+            'DBInstanceIdentifiers': ['db-%05d' % number for number in range(2, 5)] + ['db-00007', 'db-00008']}
+        self.fake.export_delay = 3600
+
+        with patch('lambda_function.EXPORT_BUCKET', 'analytics'), \
+                patch('lambda_function.EXPORT_ROLE_ARN', 'arn:aws:iam::123456789012:role/export'), \
+                patch('lambda_function.EXPORT_KMS_KEY_ID', 'key-id'), \
+                patch('lambda_function.EXPORT_MAX_CONCURRENT', 3):
+            lambda_function.handler(self.mock_event, self.mock_context)
+            # Just created snapshots are still 'creating' in the listing
+            self.assertEqual(self.fake.export_tasks, {})
+            # A later run, once the listings expired
+            lambda_function.SNAPSHOTS.invalidate()
+            lambda_function.handler(self.mock_event, self.mock_context)
+            started = dict(self.fake.export_tasks)
+            lambda_function.handler(self.mock_event, self.mock_context)
+
+        self.assertEqual(len(started), 3)
+        # The slots are still taken: nothing is started twice, two stay queued
+        self.assertEqual(self.fake.export_tasks, started)
+        self.assertEqual(self.fake.calls['StartExportTask'], 3)
+        self.assertEqual(lambda_function.send.call_args[0][2], lambda_function.SUCCESS)
+
+    def test_export_throughput_is_recorded_once(self):
+        self.mock_event['ResourceProperties'] = {'DBInstanceIdentifiers': ['db-00003', 'db-00004']}
+        self.fake.export_delay = 0.001
+
+        with patch('lambda_function.EXPORT_BUCKET', 'analytics'), \
+                patch('lambda_function.EXPORT_ROLE_ARN', 'arn:aws:iam::123456789012:role/export'), \
+                patch('lambda_function.EXPORT_KMS_KEY_ID', 'key-id'), \
+                patch('lambda_function.EXPORTS_CHECKED_AT', None), \
+                patch.object(lambda_function.METRICS, 'add') as add:
+            lambda_function.handler(self.mock_event, self.mock_context)
+            lambda_function.SNAPSHOTS.invalidate()
+            # Starts both exports, which finish almost right away
+            lambda_function.handler(self.mock_event, self.mock_context)
+            lambda_function.handler(self.mock_event, self.mock_context)
+            lambda_function.handler(self.mock_event, self.mock_context)
+
+        recorded = [call_args[0] for call_args in add.call_args_list if call_args[0][0] == 'ExportThroughput']
+        self.assertEqual(len(recorded), 2)
+        self.assertEqual(self.fake.calls['StartExportTask'], 2)
+
+    def test_exports_need_a_role_and_key(self):
+        self.mock_event['ResourceProperties'] = {'DBInstanceIdentifiers': ['db-00003']}
+
+        with patch('lambda_function.EXPORT_BUCKET', 'analytics'), \
+                patch.object(lambda_function.logger, 'error') as error:
+            lambda_function.handler(self.mock_event, self.mock_context)
+            lambda_function.SNAPSHOTS.invalidate()
+            lambda_function.handler(self.mock_event, self.mock_context)
+
+        self.assertEqual(self.fake.calls['StartExportTask'], 0)
+        self.assertIn('ExportRoleArn and ExportKmsKeyId', error.call_args[0][0] % error.call_args[0][1:])
+        self.assertEqual(lambda_function.send.call_args[0][2], lambda_function.SUCCESS)
+
+    def test_snapshot_event_exports_right_away_once(self):
+        self.fake.create_db_snapshot(DBSnapshotIdentifier='fleet-db-00003-2023-01-01', DBInstanceIdentifier='db-00003')
+        # A listing cached while the snapshot was still creating
+        lambda_function.SNAPSHOTS.snapshots('instance', 'db-00003', 'fleet-db-00003-', self.fake)
+        event = {'id': 'event-1', 'source': 'aws.rds', 'detail-type': 'RDS DB Snapshot Event',
+                 'detail': {'Message': 'Manual snapshot created', 'SourceIdentifier': 'fleet-db-00003-2023-01-01'}}
+
+        with patch('lambda_function.EXPORT_BUCKET', 'analytics'), \
+                patch('lambda_function.EXPORT_ROLE_ARN', 'arn:aws:iam::123456789012:role/export'), \
+                patch('lambda_function.EXPORT_KMS_KEY_ID', 'key-id'), \
+                patch('lambda_function.EVENT_DEDUPE', dedupe.DedupeCache()):
+            first = lambda_function.handler(event, self.mock_context)
+            second = lambda_function.handler(dict(event), self.mock_context)
+            ignored = lambda_function.handler(dict(event, id='event-2', detail={
+                'Message': 'Manual snapshot created', 'SourceIdentifier': 'other-db-00003'}), self.mock_context)
+
+        self.assertEqual(first['Sources'], 1)
+        self.assertEqual(list(self.fake.export_tasks), ['export-fleet-db-00003-2023-01-01'])
+        self.assertTrue(second['Duplicate'])
+        self.assertEqual(self.fake.calls['StartExportTask'], 1)
+        self.assertEqual(ignored['Sources'], 0)
+        lambda_function.send.assert_not_called()
+
+    def test_snapshot_created_elsewhere_is_reused(self):
+        self.mock_event['ResourceProperties'] = {'DBInstanceIdentifiers': ['db-00003']}
+        lambda_function.SNAPSHOTS.snapshots('instance', 'db-00003', 'fleet-db-00003-', self.fake)
+        self.fake.create_db_snapshot(DBSnapshotIdentifier='fleet-db-00003-2023-01-01', DBInstanceIdentifier='db-00003')
+
+        results = lambda_function.handler(self.mock_event, self.mock_context)
+
+        self.assertEqual(results['db-00003']['Status'], lambda_function.SUCCESS)
+        self.assertTrue(results['db-00003']['Existing'])
+
+    def test_failed_existing_snapshot_is_not_a_backup(self):
+        self.fake.add_snapshot('instance', 'db-00003', 'fleet-2023-01-01', datetime.datetime(2023, 1, 1),
+                               status='failed')
+        self.fake.add_snapshot('instance', 'db-00004', 'fleet-db-00004-2023-01-01', datetime.datetime(2023, 1, 1),
+                               status='failed')
+
+        with patch('lambda_function.DBINSTANCEID', 'db-00003'):
+            lambda_function.handler(self.mock_event, self.mock_context)
+        args, kwargs = lambda_function.send.call_args
+        self.assertEqual(args[2], lambda_function.FAILED)
+        self.assertIn("already exists but is 'failed'", kwargs['reason'])
+
+        self.mock_event['ResourceProperties'] = {'DBInstanceIdentifiers': ['db-00003', 'db-00004']}
+        results = lambda_function.handler(self.mock_event, self.mock_context)
+        self.assertEqual(results['db-00003']['Status'], lambda_function.SUCCESS)
+        self.assertEqual(results['db-00004']['Status'], lambda_function.FAILED)
+        self.assertEqual(lambda_function.send.call_args[0][2], lambda_function.FAILED)
+        self.assertEqual(self.fake.calls['CreateDBSnapshot'], 1)
+
+    def test_single_mode_rerun(self):
+        with patch('lambda_function.DBINSTANCEID', 'db-00003'), \
+                patch('lambda_function.SNAPSHOT_NAME_GRANULARITY', naming.HOURLY):
+            lambda_function.handler(self.mock_event, self.mock_context)
+            lambda_function.handler(self.mock_event, self.mock_context)
+
+        self.assertEqual(list(self.fake.snapshots), ['fleet-2023-01-01-12'])
+        args, kwargs = lambda_function.send.call_args
+        self.assertEqual(kwargs['reason'], 'Instance snapshot already exists.')
+        self.assertEqual(kwargs['response_data']['DBSnapshot']['DBSnapshotIdentifier'], 'fleet-2023-01-01-12')
+
+    def test_scheduled_run_prunes_without_responding(self):
+        self.fake.add_snapshot('instance', 'db-00003', 'fleet-2000-01-01', datetime.datetime(2000, 1, 1))
+        self.fake.add_snapshot('instance', 'db-00003', 'fleet-2022-12-31', datetime.datetime(2022, 12, 31))
+        lambda_function.send.side_effect = SEND
+        scheduled = {'version': '0', 'id': 'event-id', 'detail-type': 'Scheduled Event', 'source': 'aws.events',
+                     'time': '2023-01-01T12:00:00Z', 'resources': [], 'detail': {}}
+        with patch('lambda_function.DBINSTANCEID', 'db-00003'), \
+                patch('lambda_function.RETAIN_DAILY', 1), \
+                patch.object(lambda_function.TRANSPORT, 'put') as put, \
+                patch.object(lambda_function.WATCHDOG, 'start') as start:
+            lambda_function.handler(scheduled, self.mock_context)
+
+        self.assertEqual(sorted(self.fake.snapshots), ['fleet-2022-12-31', 'fleet-2023-01-01'])
+        put.assert_not_called()
+        start.assert_not_called()
+
+    def test_profiled_handler_reports_its_phases(self):
+        profiler = lambda_function.PROFILER
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with patch('lambda_function.DBINSTANCEID', 'db-00003'), \
+                patch.object(profiler, 'modes', (profiling.CPU, profiling.SPANS)), \
+                patch.object(profiler, 'output_dir', directory), \
+                patch.object(lambda_function.WATCHDOG, '_observer', profiler.phase):
+            lambda_function.handler(self.mock_event, self.mock_context)
+
+        report = profiler.last_report
+        self.assertEqual(report['Name'], 'handler')
+        self.assertEqual([span[0] for span in report['Spans']],
+                         ['start', 'log event', 'resolving fleet', 'snapshot of db-00003', 'copies', 'exports',
+                          'retention'])
+        self.assertTrue(os.path.exists(report['StatsFile']))
+        self.assertEqual(lambda_function.send.call_args[0][2], lambda_function.SUCCESS)
+
+    def test_restore_instance(self):
+        with patch.dict(os.environ, {'NEW_INSTANCEID': 'db-restored'}):
+            self.assertEqual(rds_restore.main('db-00003'), 'creating')
+        self.assertIn('db-restored', self.fake.instances)
+        # verify_restore asks again, the index answers without another call
+        calls = self.fake.calls['DescribeDBInstances']
+        self.assertFalse(rds_restore.TOPOLOGY.cluster_of('db-00003'))
+        self.assertEqual(self.fake.calls['DescribeDBInstances'], calls)
+
+    def test_restore_cluster_recreates_members(self):
+        with patch.dict(os.environ, {'NEW_CLUSTER_ID': 'cluster-restored', 'RESTORE_RATE': '1000',
+                                     'RESTORE_MIN_DELAY': '0'}):
+            self.assertEqual(rds_restore.main('db-00005'), 'available')
+        members = self.fake.clusters['cluster-restored']['DBClusterMembers']
+        self.assertEqual(sorted(member['DBInstanceIdentifier'] for member in members),
+                         ['cluster-restored-db-00005', 'cluster-restored-db-00006'])
+
+    def test_restore_instance_to_time(self):
+        created = datetime.datetime(2023, 1, 5, 2, 0)
+        self.fake.add_snapshot('instance', 'db-00003', 'daily-2023-01-05', created)
+        self.fake.add_snapshot('instance', 'db-00003', 'daily-2023-01-06', created + datetime.timedelta(days=1))
+        cache = os.path.join(tempfile.mkdtemp(), 'timeline.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(cache))
+        environment = {'NEW_INSTANCEID': 'db-restored', 'RESTORE_TIME': '2023-01-06T01:00:00Z',
+                       'DBSNAPSHOTID': 'daily-', 'RESTORE_TIMELINE_CACHE': cache}
+
+        with patch.dict(os.environ, environment):
+            self.assertEqual(rds_restore.main('db-00003'), 'creating')
+        self.assertEqual(self.fake.calls['RestoreDBInstanceFromDBSnapshot'], 1)
+        self.assertTrue(os.path.exists(cache))
+
+    def test_throttling(self):
+        self.fake.throttle_rate = 1.0
+        with self.assertRaises(ClientError) as raised:
+            self.fake.describe_db_instances(DBInstanceIdentifier='db-00003')
+        self.assertEqual(raised.exception.response['Error']['Code'], 'Throttling')
+        # query_db_cluster treats any API error as "not clustered"
+        self.assertFalse(utils.query_db_cluster('db-00003'))
+        self.assertEqual(self.fake.calls['Throttled'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
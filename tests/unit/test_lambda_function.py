@@ -1,11 +1,11 @@
 """Unit tests for the lambda_function.py module."""
 
 import unittest
-from unittest.mock import patch, MagicMock, call
+from unittest.mock import patch, MagicMock
 import os
 import sys
 from botocore.exceptions import ClientError
-import datetime # Needed for NOW
+import datetime # Needed for the fixed invocation time
 
 # Adjust path to import lambda_function and common.utils
 # This assumes the tests are run from the root of the repository.
@@ -14,6 +14,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../.
 # Import the module to be tested
 import lambda_function
 from lambda_function import logger as lambda_logger # import logger to suppress its output
+from common import naming, topology
 
 class TestLambdaHandler(unittest.TestCase):
 
@@ -36,7 +37,6 @@ class TestLambdaHandler(unittest.TestCase):
         self.original_env = os.environ.copy()
         self.original_dbinstanceid = lambda_function.DBINSTANCEID
         self.original_dbsnapshotid = lambda_function.DBSNAPSHOTID
-        self.original_now = lambda_function.NOW
 
         # Set default mock environment variables for most tests
         os.environ['DBInstanceIdentifier'] = 'test-db'
@@ -53,7 +53,10 @@ class TestLambdaHandler(unittest.TestCase):
         # This patching method is more robust for datetime.datetime.now
         self.patch_datetime = patch('datetime.datetime', self.mock_datetime_now) 
         self.patch_datetime.start()
-        lambda_function.NOW = self.mock_datetime_now.now.return_value
+
+        # Fresh snapshot listings per test
+        self.patch_snapshots = patch('lambda_function.SNAPSHOTS', naming.SnapshotCatalog())
+        self.patch_snapshots.start()
 
 
         # Suppress logger output during tests
@@ -69,24 +72,24 @@ class TestLambdaHandler(unittest.TestCase):
         # Restore original module-level variables in lambda_function
         lambda_function.DBINSTANCEID = self.original_dbinstanceid
         lambda_function.DBSNAPSHOTID = self.original_dbsnapshotid
-        lambda_function.NOW = self.original_now
         
         # Stop datetime patch
         self.patch_datetime.stop()
+        self.patch_snapshots.stop()
 
         # Stop logger patch
         self.patch_lambda_logger.stop()
 
     @patch('lambda_function.send')
     @patch('lambda_function.RDS') # Patches the RDS client instance in lambda_function module
-    @patch('common.utils.query_db_cluster') # Patches the function imported from common.utils
-    def test_handler_cluster_snapshot_success(self, mock_common_query_db_cluster, mock_rds_client, mock_send):
-        mock_common_query_db_cluster.return_value = 'actual-cluster-id' # Instance is in a cluster
+    @patch('lambda_function.TOPOLOGY.cluster_of') # Cluster membership comes from the topology index
+    def test_handler_cluster_snapshot_success(self, mock_cluster_of, mock_rds_client, mock_send):
+        mock_cluster_of.return_value = 'actual-cluster-id' # Instance is in a cluster
         mock_rds_client.create_db_cluster_snapshot.return_value = {'DBClusterSnapshot': {'Status': 'available', 'DBClusterSnapshotIdentifier': 'test-snapshot-prefix2023-01-01'}}
         
         lambda_function.handler(self.mock_event, self.mock_context)
         
-        expected_snapshot_id = 'test-snapshot-prefix' + lambda_function.NOW.strftime("%Y-%m-%d")
+        expected_snapshot_id = 'test-snapshot-prefix' + self.mock_datetime_now.now.return_value.strftime("%Y-%m-%d")
         mock_rds_client.create_db_cluster_snapshot.assert_called_once_with(
             DBClusterSnapshotIdentifier=expected_snapshot_id,
             DBClusterIdentifier='actual-cluster-id'
@@ -100,9 +103,9 @@ class TestLambdaHandler(unittest.TestCase):
 
     @patch('lambda_function.send')
     @patch('lambda_function.RDS')
-    @patch('common.utils.query_db_cluster')
-    def test_handler_instance_snapshot_success(self, mock_common_query_db_cluster, mock_rds_client, mock_send):
-        mock_common_query_db_cluster.return_value = False # Not a cluster
+    @patch('lambda_function.TOPOLOGY.cluster_of')
+    def test_handler_instance_snapshot_success(self, mock_cluster_of, mock_rds_client, mock_send):
+        mock_cluster_of.return_value = False # Not a cluster
         mock_snapshot_response = {
             'DBSnapshot': {
                 'DBSnapshotIdentifier': 'test-snapshot-prefix2023-01-01',
@@ -115,7 +118,7 @@ class TestLambdaHandler(unittest.TestCase):
         
         lambda_function.handler(self.mock_event, self.mock_context)
         
-        expected_snapshot_id = 'test-snapshot-prefix' + lambda_function.NOW.strftime("%Y-%m-%d")
+        expected_snapshot_id = 'test-snapshot-prefix' + self.mock_datetime_now.now.return_value.strftime("%Y-%m-%d")
         mock_rds_client.create_db_snapshot.assert_called_once_with(
             DBSnapshotIdentifier=expected_snapshot_id,
             DBInstanceIdentifier='test-db'
@@ -131,9 +134,9 @@ class TestLambdaHandler(unittest.TestCase):
 
     @patch('lambda_function.send')
     @patch('lambda_function.RDS')
-    @patch('common.utils.query_db_cluster')
-    def test_handler_instance_snapshot_failure_clienterror(self, mock_common_query_db_cluster, mock_rds_client, mock_send):
-        mock_common_query_db_cluster.return_value = False # Not a cluster
+    @patch('lambda_function.TOPOLOGY.cluster_of')
+    def test_handler_instance_snapshot_failure_clienterror(self, mock_cluster_of, mock_rds_client, mock_send):
+        mock_cluster_of.return_value = False # Not a cluster
         client_error = ClientError({'Error': {'Code': 'TestError', 'Message': 'Test message'}}, 'create_db_snapshot')
         mock_rds_client.create_db_snapshot.side_effect = client_error
         
@@ -146,11 +149,27 @@ class TestLambdaHandler(unittest.TestCase):
             response_data={} 
         )
 
+    @patch('lambda_function.send')
+    @patch('lambda_function.RDS')
+    @patch('lambda_function.TOPOLOGY.cluster_of')
+    def test_handler_unexpected_error_responds_once(self, mock_cluster_of, mock_rds_client, mock_send):
+        mock_cluster_of.return_value = False
+        mock_rds_client.create_db_snapshot.side_effect = RuntimeError('connection reset')
+
+        lambda_function.handler(self.mock_event, self.mock_context)
+
+        mock_send.assert_called_once_with(
+            self.mock_event, self.mock_context,
+            lambda_function.FAILED,
+            reason="Unexpected RuntimeError during snapshot of test-db: connection reset",
+            response_data={'Phase': 'snapshot of test-db'}
+        )
+
     @patch('lambda_function.send')
     @patch('lambda_function.RDS') # Still need to patch RDS even if not directly used, to avoid real calls
-    @patch('common.utils.query_db_cluster')
-    def test_handler_cluster_snapshot_failure_clienterror(self, mock_common_query_db_cluster, mock_rds_client, mock_send):
-        mock_common_query_db_cluster.return_value = 'actual-cluster-id' # Instance is in a cluster
+    @patch('lambda_function.TOPOLOGY.cluster_of')
+    def test_handler_cluster_snapshot_failure_clienterror(self, mock_cluster_of, mock_rds_client, mock_send):
+        mock_cluster_of.return_value = 'actual-cluster-id' # Instance is in a cluster
         client_error = ClientError({'Error': {'Code': 'TestError', 'Message': 'Test message'}}, 'create_db_cluster_snapshot')
         mock_rds_client.create_db_cluster_snapshot.side_effect = client_error
         
@@ -163,8 +182,28 @@ class TestLambdaHandler(unittest.TestCase):
             response_data={}
         )
     
+    @patch('lambda_function.WAIT_FOR_AVAILABLE', True)
     @patch('lambda_function.send')
-    # No need to patch RDS or query_db_cluster as env var check is before them
+    @patch('lambda_function.RDS')
+    @patch('lambda_function.TOPOLOGY.cluster_of')
+    def test_handler_waits_for_available_snapshot(self, mock_cluster_of, mock_rds_client, mock_send):
+        mock_cluster_of.return_value = False
+        mock_rds_client.create_db_snapshot.return_value = {'DBSnapshot': {'Status': 'creating'}}
+        self.mock_context.get_remaining_time_in_millis.return_value = 14000 # Too little time to sleep
+        mock_rds_client.get_paginator.return_value.paginate.return_value = [{'DBSnapshots': [
+            {'DBSnapshotIdentifier': 'test-snapshot-prefix2023-01-01', 'Status': 'creating', 'PercentProgress': 50}]}]
+
+        lambda_function.handler(self.mock_event, self.mock_context)
+
+        mock_send.assert_called_once_with(
+            self.mock_event, self.mock_context,
+            lambda_function.FAILED,
+            reason="Snapshot test-snapshot-prefix2023-01-01 is 'creating', not available.",
+            response_data={}
+        )
+
+    @patch('lambda_function.send')
+    # No need to patch RDS or the topology index as env var check is before them
     def test_handler_missing_dbinstanceid_env_var(self, mock_send):
         # Set one of the required env vars to None or empty for this test
         lambda_function.DBINSTANCEID = None 
@@ -201,5 +240,178 @@ class TestLambdaHandler(unittest.TestCase):
         )
 
 
+class TestLambdaSend(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_event = {
+            'StackId': 'stack-id',
+            'RequestId': 'request-id',
+            'LogicalResourceId': 'logical-id',
+            'ResponseURL': 'https://bucket.s3.amazonaws.com/key?signature=secret',
+        }
+        self.mock_context = MagicMock()
+        self.mock_context.log_stream_name = 'log-stream'
+        self.patch_lambda_logger = patch.object(lambda_logger, 'propagate', False)
+        self.patch_lambda_logger.start()
+
+    def tearDown(self):
+        self.patch_lambda_logger.stop()
+
+    @patch('lambda_function.TRANSPORT')
+    def test_send_puts_json_body(self, mock_transport):
+        mock_transport.put.return_value = 200
+
+        self.assertTrue(lambda_function.send(self.mock_event, self.mock_context, lambda_function.SUCCESS,
+                                             reason='done', response_data={'Key': 'Value'}))
+
+        url, body, headers = mock_transport.put.call_args[0]
+        self.assertEqual(url, self.mock_event['ResponseURL'])
+        self.assertEqual(headers['Content-Length'], str(len(body)))
+        self.assertIn(b'"Status":"SUCCESS"', body)
+        self.assertIn(b'"Data":{"Key":"Value"}', body)
+
+    @patch('lambda_function.TRANSPORT')
+    def test_send_handles_datetimes_in_response_data(self, mock_transport):
+        mock_transport.put.return_value = 200
+        response = {'DBClusterSnapshot': {'DBClusterSnapshotIdentifier': 'snap',
+                                          'SnapshotCreateTime': datetime.datetime(2023, 1, 1, 12, 0, 0),
+                                          'AvailabilityZones': ['us-east-1a']},
+                    'ResponseMetadata': {'RequestId': 'abc'}}
+
+        self.assertTrue(lambda_function.send(self.mock_event, self.mock_context, lambda_function.SUCCESS,
+                                             response_data=response))
+
+        body = mock_transport.put.call_args[0][1]
+        self.assertIn(b'"DBClusterSnapshot":{"DBClusterSnapshotIdentifier":"snap",'
+                      b'"SnapshotCreateTime":"2023-01-01T12:00:00"}', body)
+        self.assertNotIn(b'ResponseMetadata', body)
+
+    @patch('lambda_function.TRANSPORT')
+    def test_send_reports_failure(self, mock_transport):
+        mock_transport.put.return_value = None
+
+        self.assertFalse(lambda_function.send(self.mock_event, self.mock_context, lambda_function.FAILED))
+
+
+class TestLambdaFleetMode(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_event = {
+            'StackId': 'stack-id',
+            'RequestId': 'request-id',
+            'LogicalResourceId': 'logical-id',
+            'ResponseURL': 'http://example.com/cfnresponse',
+            'ResourceProperties': {'DBInstanceIdentifiers': ['db-a', 'db-b', 'db-c']}
+        }
+        self.mock_context = MagicMock()
+        self.mock_context.log_stream_name = 'log-stream'
+        self.mock_context.get_remaining_time_in_millis = MagicMock(return_value=30000)
+
+        self.original_dbsnapshotid = lambda_function.DBSNAPSHOTID
+        lambda_function.DBSNAPSHOTID = 'fleet-'
+        self.patch_datetime = patch('lambda_function.datetime')
+        self.patch_datetime.start().datetime.now.return_value = datetime.datetime(2023, 1, 1, 12, 0, 0)
+        self.patch_snapshots = patch('lambda_function.SNAPSHOTS', naming.SnapshotCatalog())
+        self.patch_snapshots.start()
+
+        # Fresh topology index per test, backed by its own mock client
+        self.mock_rds_client = MagicMock()
+        self.patch_topology = patch('lambda_function.TOPOLOGY',
+                                    topology.TopologyIndex(client=self.mock_rds_client))
+        self.patch_topology.start()
+
+        self.patch_lambda_logger = patch.object(lambda_logger, 'propagate', False)
+        self.patch_lambda_logger.start()
+
+    def tearDown(self):
+        lambda_function.DBSNAPSHOTID = self.original_dbsnapshotid
+        self.patch_datetime.stop()
+        self.patch_snapshots.stop()
+        self.patch_topology.stop()
+        self.patch_lambda_logger.stop()
+
+    def test_split_identifiers(self):
+        self.assertEqual(lambda_function.split_identifiers(' a, b,,c '), ['a', 'b', 'c'])
+        self.assertEqual(lambda_function.split_identifiers(['a', ' b ']), ['a', 'b'])
+        self.assertEqual(lambda_function.split_identifiers(None), [])
+
+    def test_resolve_fleet_collapses_cluster_members(self):
+        self.mock_rds_client.get_paginator.return_value.paginate.side_effect = [
+            [{'DBInstances': [
+                {'DBInstanceIdentifier': 'db-a', 'DBClusterIdentifier': 'cluster-1'},
+                {'DBInstanceIdentifier': 'db-b', 'DBClusterIdentifier': 'cluster-1'},
+                {'DBInstanceIdentifier': 'db-c'},
+            ]}],
+        ]
+
+        targets = lambda_function.resolve_fleet(self.mock_event)
+
+        self.assertEqual(targets, [('cluster', 'cluster-1'), ('instance', 'db-c')])
+        # One sweep answers every identifier, no per-instance describe calls
+        self.mock_rds_client.describe_db_instances.assert_not_called()
+
+    def test_resolve_fleet_by_tag(self):
+        self.mock_rds_client.get_paginator.return_value.paginate.side_effect = [
+            [{'DBInstances': [
+                {'DBInstanceIdentifier': 'tagged', 'TagList': [{'Key': 'backup', 'Value': 'daily'}]},
+                {'DBInstanceIdentifier': 'other', 'TagList': [{'Key': 'backup', 'Value': 'never'}]},
+                {'DBInstanceIdentifier': 'untagged'},
+            ]}],
+        ]
+        event = {'ResourceProperties': {'FleetTagKey': 'backup', 'FleetTagValue': 'daily'}}
+
+        self.assertEqual(lambda_function.resolve_fleet(event), [('instance', 'tagged')])
+
+    @patch('lambda_function.send')
+    @patch('lambda_function.RDS')
+    def test_fleet_handler_reports_per_target_results(self, mock_rds_client, mock_send):
+        self.mock_rds_client.get_paginator.return_value.paginate.side_effect = [
+            [{'DBInstances': [{'DBInstanceIdentifier': 'db-a'}, {'DBInstanceIdentifier': 'db-b'},
+                              {'DBInstanceIdentifier': 'db-c'}]}],
+        ]
+
+        def create_db_snapshot(DBSnapshotIdentifier, DBInstanceIdentifier):
+            if DBInstanceIdentifier == 'db-b':
+                raise ClientError({'Error': {'Code': 'InvalidDBInstanceState', 'Message': 'busy'}}, 'create_db_snapshot')
+            return {'DBSnapshot': {'DBSnapshotIdentifier': DBSnapshotIdentifier}}
+        mock_rds_client.create_db_snapshot.side_effect = create_db_snapshot
+
+        results = lambda_function.handler(self.mock_event, self.mock_context)
+
+        self.assertEqual(mock_rds_client.create_db_snapshot.call_count, 3)
+        self.assertEqual(results['db-a'], {'Status': lambda_function.SUCCESS, 'Type': 'instance',
+                                           'SnapshotIdentifier': 'fleet-db-a-2023-01-01'})
+        self.assertEqual(results['db-b']['Status'], lambda_function.FAILED)
+        self.assertEqual(results['db-c']['Status'], lambda_function.SUCCESS)
+        mock_send.assert_called_once_with(
+            self.mock_event, self.mock_context,
+            lambda_function.FAILED,
+            reason="1 of 3 fleet snapshot(s) failed.",
+            response_data=results
+        )
+
+
+    @patch('lambda_function.RETAIN_DAILY', 1)
+    @patch('lambda_function.send')
+    @patch('lambda_function.RDS')
+    def test_fleet_handler_prunes_after_success(self, mock_rds_client, mock_send):
+        self.mock_event['ResourceProperties'] = {'DBInstanceIdentifiers': 'db-a'}
+        self.mock_rds_client.get_paginator.return_value.paginate.side_effect = [
+            [{'DBInstances': [{'DBInstanceIdentifier': 'db-a'}]}],
+        ]
+        mock_rds_client.get_paginator.return_value.paginate.return_value = [{'DBSnapshots': [
+            {'DBSnapshotIdentifier': 'fleet-db-a-2022-12-31', 'Status': 'available',
+             'SnapshotCreateTime': datetime.datetime(2022, 12, 31)},
+            {'DBSnapshotIdentifier': 'fleet-db-a-2022-12-30', 'Status': 'available',
+             'SnapshotCreateTime': datetime.datetime(2022, 12, 30)},
+        ]}]
+
+        lambda_function.handler(self.mock_event, self.mock_context)
+
+        mock_rds_client.get_paginator.return_value.paginate.assert_called_once_with(
+            DBInstanceIdentifier='db-a', SnapshotType='manual')
+        mock_rds_client.delete_db_snapshot.assert_called_once_with(DBSnapshotIdentifier='fleet-db-a-2022-12-30')
+
+
 if __name__ == '__main__':
     unittest.main()
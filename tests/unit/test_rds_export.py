@@ -0,0 +1,55 @@
+"""Unit tests for the rds_export.py script."""
+
+import unittest
+from unittest.mock import patch
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import rds_export
+from common import clients, export
+from tests.fake_rds import FakeRDS
+
+
+class TestRdsExport(unittest.TestCase):
+
+    def setUp(self):
+        self.original_env = os.environ.copy()
+        os.environ.update({'EXPORT_BUCKET': 'analytics', 'EXPORT_ROLE_ARN': 'arn:aws:iam::123456789012:role/export',
+                           'EXPORT_KMS_KEY_ID': 'key', 'EXPORT_MIN_DELAY': '0', 'EXPORT_MAX_DELAY': '0'})
+        clients.reset()
+        self.fake = FakeRDS(instances=3)
+        clients.install(self.fake)
+        self.patch_loggers = [patch.object(logger, 'propagate', False) for logger in (rds_export.logger, export.logger)]
+        for active in self.patch_loggers:
+            active.start()
+
+    def tearDown(self):
+        for active in self.patch_loggers:
+            active.stop()
+        clients.reset()
+        os.environ.clear()
+        os.environ.update(self.original_env)
+
+    def test_missing_destination(self):
+        os.environ.pop('EXPORT_KMS_KEY_ID')
+        with self.assertRaisesRegex(ValueError, "EXPORT_KMS_KEY_ID"):
+            rds_export.export_snapshots('backup-')
+
+    @patch('builtins.print')
+    def test_exports_snapshots_with_prefix(self, mock_print):
+        for number in range(3):
+            self.fake.create_db_snapshot(DBSnapshotIdentifier='backup-db-%05d-2023-01-01' % number,
+                                         DBInstanceIdentifier='db-%05d' % number)
+        self.fake.create_db_snapshot(DBSnapshotIdentifier='other-db-00000', DBInstanceIdentifier='db-00000')
+
+        self.assertTrue(rds_export.export_snapshots('backup-'))
+
+        self.assertEqual(sorted(self.fake.export_tasks), ['export-backup-db-%05d-2023-01-01' % number
+                                                          for number in range(3)])
+        self.assertIn('3/3 exports complete', mock_print.call_args_list[-1][0][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
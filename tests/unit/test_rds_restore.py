@@ -1,9 +1,13 @@
 """Unit tests for the rds_restore.py script."""
 
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 import os
+import re
+import shutil
+import sqlite3
 import sys
+import tempfile
 from botocore.exceptions import ClientError
 
 # Adjust path to import rds_restore and common.utils
@@ -11,7 +15,6 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../.
 
 import rds_restore # Import the module to be tested
 from rds_restore import logger as rds_logger # import logger to suppress its output
-from common.utils import query_db_cluster # Though mocked, ensure it's importable for context
 
 class TestRdsRestoreMain(unittest.TestCase):
 
@@ -42,9 +45,9 @@ class TestRdsRestoreMain(unittest.TestCase):
         self.patch_utils_logger.stop()
 
     @patch('rds_restore.RDS')
-    @patch('common.utils.query_db_cluster') # Patching query_db_cluster at its source
-    def test_main_cluster_restore_success(self, mock_query_db_cluster, mock_rds_client):
-        mock_query_db_cluster.return_value = 'old-cluster-id' # It's a cluster instance
+    @patch('rds_restore.TOPOLOGY.cluster_of') # Cluster membership comes from the topology index
+    def test_main_cluster_restore_success(self, mock_cluster_of, mock_rds_client):
+        mock_cluster_of.return_value = 'old-cluster-id' # It's a cluster instance
         mock_rds_client.restore_db_cluster_to_point_in_time.return_value = {'DBCluster': {'Status': 'restoring'}}
         
         status = rds_restore.main('test-db-instance')
@@ -57,9 +60,9 @@ class TestRdsRestoreMain(unittest.TestCase):
         )
 
     @patch('rds_restore.RDS')
-    @patch('common.utils.query_db_cluster')
-    def test_main_instance_restore_success(self, mock_query_db_cluster, mock_rds_client):
-        mock_query_db_cluster.return_value = False # Not a cluster instance
+    @patch('rds_restore.TOPOLOGY.cluster_of')
+    def test_main_instance_restore_success(self, mock_cluster_of, mock_rds_client):
+        mock_cluster_of.return_value = False # Not a cluster instance
         mock_rds_client.restore_db_instance_to_point_in_time.return_value = {'DBInstance': {'DBInstanceStatus': 'restoring'}}
 
         status = rds_restore.main('test-db-instance')
@@ -72,9 +75,9 @@ class TestRdsRestoreMain(unittest.TestCase):
         )
 
     @patch('rds_restore.RDS')
-    @patch('common.utils.query_db_cluster')
-    def test_main_cluster_restore_client_error(self, mock_query_db_cluster, mock_rds_client):
-        mock_query_db_cluster.return_value = 'old-cluster-id'
+    @patch('rds_restore.TOPOLOGY.cluster_of')
+    def test_main_cluster_restore_client_error(self, mock_cluster_of, mock_rds_client):
+        mock_cluster_of.return_value = 'old-cluster-id'
         client_error = ClientError({'Error': {'Code': 'TestError', 'Message': 'Test message'}}, 'restore_db_cluster_to_point_in_time')
         mock_rds_client.restore_db_cluster_to_point_in_time.side_effect = client_error
 
@@ -82,26 +85,26 @@ class TestRdsRestoreMain(unittest.TestCase):
             rds_restore.main('test-db-instance')
             
     @patch('rds_restore.RDS')
-    @patch('common.utils.query_db_cluster')
-    def test_main_instance_restore_client_error(self, mock_query_db_cluster, mock_rds_client):
-        mock_query_db_cluster.return_value = False # Not a cluster
+    @patch('rds_restore.TOPOLOGY.cluster_of')
+    def test_main_instance_restore_client_error(self, mock_cluster_of, mock_rds_client):
+        mock_cluster_of.return_value = False # Not a cluster
         client_error = ClientError({'Error': {'Code': 'TestError', 'Message': 'Test message'}}, 'restore_db_instance_to_point_in_time')
         mock_rds_client.restore_db_instance_to_point_in_time.side_effect = client_error
 
         with self.assertRaises(ClientError):
             rds_restore.main('test-db-instance')
 
-    @patch('common.utils.query_db_cluster') # Still need to mock this even if not directly used in this path
-    def test_main_missing_new_cluster_id_for_cluster_restore(self, mock_query_db_cluster):
-        mock_query_db_cluster.return_value = 'old-cluster-id' # It's a cluster
+    @patch('rds_restore.TOPOLOGY.cluster_of') # Still need to mock this even if not directly used in this path
+    def test_main_missing_new_cluster_id_for_cluster_restore(self, mock_cluster_of):
+        mock_cluster_of.return_value = 'old-cluster-id' # It's a cluster
         os.environ.pop('NEW_CLUSTER_ID', None) # Remove the env var
 
         with self.assertRaisesRegex(ValueError, "NEW_CLUSTER_ID environment variable is not set for clustered restore."):
             rds_restore.main('test-db-instance')
 
-    @patch('common.utils.query_db_cluster')
-    def test_main_missing_new_instance_id_for_instance_restore(self, mock_query_db_cluster):
-        mock_query_db_cluster.return_value = False # Not a cluster
+    @patch('rds_restore.TOPOLOGY.cluster_of')
+    def test_main_missing_new_instance_id_for_instance_restore(self, mock_cluster_of):
+        mock_cluster_of.return_value = False # Not a cluster
         os.environ.pop('NEW_INSTANCEID', None) # Remove the env var
 
         with self.assertRaisesRegex(ValueError, "NEW_INSTANCEID environment variable not set for non-clustered restore."):
@@ -109,7 +112,7 @@ class TestRdsRestoreMain(unittest.TestCase):
             
     def test_main_missing_instanceid_parameter(self):
         # Tests the check at the very beginning of main()
-        with self.assertRaisesRegex(ValueError, "DBINSTANCEID (passed as instanceid) is missing."):
+        with self.assertRaisesRegex(ValueError, re.escape("DBINSTANCEID (passed as instanceid) is missing.")):
             rds_restore.main(None) # Pass None as instanceid
 
     # Tests for the __main__ block execution path
@@ -162,6 +165,92 @@ class TestRdsRestoreMain(unittest.TestCase):
                 self.assertNotEqual(call_args[0][0], 1)
 
 
+    @patch('rds_restore.RDS')
+    @patch('rds_restore.TOPOLOGY.cluster_of')
+    def test_main_clone_restore(self, mock_cluster_of, mock_rds_client):
+        os.environ['RESTORE_TYPE'] = 'clone'
+        os.environ['RESTORE_CLUSTER_MEMBERS'] = 'false'
+        mock_cluster_of.return_value = 'old-cluster-id'
+        mock_rds_client.restore_db_cluster_to_point_in_time.return_value = {'DBCluster': {'Status': 'creating'}}
+
+        self.assertEqual(rds_restore.main('test-db-instance'), 'creating')
+
+        mock_rds_client.restore_db_cluster_to_point_in_time.assert_called_once_with(
+            DBClusterIdentifier='new-test-cluster',
+            SourceDBClusterIdentifier='old-cluster-id',
+            RestoreType='copy-on-write',
+            UseLatestRestorableTime=True
+        )
+
+    def test_main_invalid_restore_type(self):
+        os.environ['RESTORE_TYPE'] = 'snapshot'
+        with self.assertRaisesRegex(ValueError, "RESTORE_TYPE must be 'full' or 'clone'"):
+            rds_restore.main('test-db-instance')
+
+    @patch('builtins.print')
+    @patch('common.restore.restore_many')
+    def test_restore_manifest_reports_every_database(self, mock_restore_many, mock_print):
+        os.environ['RESTORE_RATE'] = '2'
+        mock_restore_many.return_value = ({
+            'db-a-dr': {'Source': 'db-a', 'Target': 'db-a-dr', 'Type': 'instance', 'Status': 'available',
+                        'Seconds': 600.0},
+            'db-b-dr': {'Source': 'db-b', 'Target': 'db-b-dr', 'Type': 'cluster', 'Status': 'timeout',
+                        'Seconds': None},
+        }, 900.0)
+
+        self.assertFalse(rds_restore.restore_manifest('{"db-a": "db-a-dr", "db-b": "db-b-dr"}'))
+
+        self.assertEqual(mock_restore_many.call_args[0][0], [('db-a', 'db-a-dr'), ('db-b', 'db-b-dr')])
+        self.assertEqual(mock_restore_many.call_args[1]['rate'], 2.0)
+        printed = [call_args[0][0] for call_args in mock_print.call_args_list]
+        self.assertEqual(len(printed), 4)
+        self.assertIn('1/2 restores available, total recovery time 900 s', printed[-1])
+
+    @patch('builtins.print')
+    @patch('common.clients.get_client')
+    @patch('common.restore.restore_many')
+    def test_restore_manifest_in_every_hub_account(self, mock_restore_many, mock_get_client, mock_print):
+        os.environ['HUB_ACCOUNTS'] = '111111111111,222222222222'
+        mock_get_client.side_effect = lambda service, region, role_arn: role_arn
+        mock_restore_many.return_value = ({
+            'db-a-dr': {'Source': 'db-a', 'Target': 'db-a-dr', 'Type': 'instance', 'Status': 'available',
+                        'Seconds': 600.0},
+        }, 600.0)
+
+        self.assertTrue(rds_restore.restore_manifest('{"db-a": "db-a-dr"}'))
+
+        self.assertEqual(sorted(call_args[1]['client'] for call_args in mock_restore_many.call_args_list),
+                         ['arn:aws:iam::111111111111:role/rds-backup-hub',
+                          'arn:aws:iam::222222222222:role/rds-backup-hub'])
+        printed = [call_args[0][0] for call_args in mock_print.call_args_list]
+        self.assertEqual([line for line in printed if line.startswith('Account')],
+                         ['Account 111111111111:', 'Account 222222222222:'])
+
+    def test_verify_restore_not_configured(self):
+        self.assertIsNone(rds_restore.verify_restore('test-db-instance', 'available'))
+
+    @patch('builtins.print')
+    @patch('common.restore.wait_for', return_value='available')
+    @patch('rds_restore.TOPOLOGY.cluster_of', return_value=False)
+    def test_verify_restore_waits_then_compares(self, mock_cluster_of, mock_wait_for, mock_print):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for name, rows in (('source.db', 3), ('target.db', 2)):
+            connection = sqlite3.connect(os.path.join(directory, name))
+            connection.execute('CREATE TABLE orders (id INTEGER PRIMARY KEY)')
+            connection.executemany('INSERT INTO orders VALUES (?)', [(number,) for number in range(rows)])
+            connection.commit()
+            connection.close()
+        os.environ['VERIFY_SOURCE_URL'] = 'sqlite:///' + os.path.join(directory, 'source.db')
+        os.environ['VERIFY_TARGET_URL'] = 'sqlite:///' + os.path.join(directory, 'target.db')
+
+        with patch.object(rds_restore.verify.logger, 'propagate', False):
+            self.assertFalse(rds_restore.verify_restore('test-db-instance', 'creating'))
+
+        self.assertEqual(mock_wait_for.call_args[0][:2], ('instance', 'new-test-instance'))
+        printed = [call_args[0][0] for call_args in mock_print.call_args_list]
+        self.assertIn('0/1 tables match', printed[-1])
+
     @patch('sys.exit')
     def test_main_block_missing_dbinstanceid(self, mock_sys_exit):
         os.environ.pop('DBINSTANCEID', None)